@@ -1,14 +1,462 @@
-import uuid
-import os
 import dexy.data
+import dexy.exceptions
+import dexy.utils
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+class BatchDatabase(object):
+    """
+    SQLite database in the artifacts dir with information about the docs in
+    recent batches, the arg strings of nodes from the most recent run, when
+    objects in the content-addressed store were last used, and a history of
+    timings and cache use of docs and filters over many runs.
+
+    Settings of data objects are stored once per distinct set of settings
+    and shared between data objects, so the many docs which only differ in
+    name and storage key don't each store a full copy.
+    """
+    # Number of completed batches to keep.
+    keep_batches = 5
+
+    # Number of runs to keep history for.
+    keep_runs = 100
+
+    tables = (
+        """CREATE TABLE IF NOT EXISTS batches (
+            id INTEGER PRIMARY KEY,
+            uuid TEXT UNIQUE,
+            start_time REAL,
+            end_time REAL,
+            filters_used TEXT,
+            complete INTEGER DEFAULT 0
+            )""",
+        """CREATE TABLE IF NOT EXISTS settings (
+            id INTEGER PRIMARY KEY,
+            digest TEXT UNIQUE,
+            value BLOB
+            )""",
+        """CREATE TABLE IF NOT EXISTS docs (
+            batch_id INTEGER,
+            doc_key TEXT,
+            title TEXT,
+            start_time REAL,
+            finish_time REAL,
+            elapsed REAL,
+            state TEXT,
+            PRIMARY KEY (batch_id, doc_key)
+            )""",
+        """CREATE TABLE IF NOT EXISTS datas (
+            batch_id INTEGER,
+            doc_key TEXT,
+            role TEXT,
+            position INTEGER,
+            alias TEXT,
+            key TEXT,
+            ext TEXT,
+            storage_key TEXT,
+            name TEXT,
+            settings_id INTEGER,
+            PRIMARY KEY (batch_id, doc_key, role, position)
+            )""",
+        "CREATE INDEX IF NOT EXISTS datas_by_key ON datas (batch_id, role, key)",
+        "CREATE INDEX IF NOT EXISTS datas_by_storage_key ON datas (batch_id, storage_key)",
+        "CREATE INDEX IF NOT EXISTS datas_by_name ON datas (batch_id, name)",
+        """CREATE TABLE IF NOT EXISTS node_args (
+            node_key TEXT PRIMARY KEY,
+            argstring TEXT
+            )""",
+        """CREATE TABLE IF NOT EXISTS artifacts (
+            digest TEXT PRIMARY KEY,
+            alias TEXT,
+            last_access REAL
+            )""",
+        """CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            start_time REAL,
+            end_time REAL,
+            state TEXT,
+            jobs INTEGER
+            )""",
+        """CREATE TABLE IF NOT EXISTS doc_runs (
+            run_id INTEGER,
+            doc_key TEXT,
+            state TEXT,
+            elapsed REAL,
+            bytes_in INTEGER,
+            bytes_out INTEGER,
+            PRIMARY KEY (run_id, doc_key)
+            )""",
+        """CREATE TABLE IF NOT EXISTS filter_runs (
+            run_id INTEGER,
+            doc_key TEXT,
+            position INTEGER,
+            alias TEXT,
+            elapsed REAL,
+            restored INTEGER,
+            exit_code INTEGER,
+            bytes_in INTEGER,
+            bytes_out INTEGER,
+            PRIMARY KEY (run_id, doc_key, position)
+            )"""
+        )
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.lock = threading.RLock()
+        self.settings_ids = {}
+        self.open_batch_id = None # batch whose doc info is not yet committed
+        self._conn = None
+
+    def filename(self):
+        return os.path.join(self.wrapper.artifacts_dir, 'batches.sqlite3')
+
+    def exists(self):
+        return os.path.exists(self.filename())
+
+    def connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.filename(), check_same_thread=False)
+            self._conn.text_factory = str
+            # Don't wait for the disk on each commit, a lost batch only
+            # means docs are run again.
+            self._conn.execute("PRAGMA synchronous = OFF")
+            for sql in self.tables:
+                self._conn.execute(sql)
+        return self._conn
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.connection().execute(sql, params).fetchall()
+
+    def commit(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.commit()
+
+    def rollback(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.rollback()
+            self.open_batch_id = None
+
+    def check_no_open_batch(self):
+        """
+        Doc info of an open batch shares the connection's transaction, so
+        committing anything else would commit it too before the batch is
+        finished or abandoned.
+        """
+        if self.open_batch_id is not None:
+            msg = "can't commit while batch %s is open"
+            raise dexy.exceptions.InternalDexyProblem(msg % self.open_batch_id)
+
+    def close(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # Settings
+    def pickle(self):
+        return dexy.utils.pickle_lib(self.wrapper)
+
+    def settings_id(self, settings):
+        """
+        Returns id of the row holding these settings, adding a row if needed.
+        """
+        value = self.pickle().dumps(sorted(settings.items()), -1)
+        digest = hashlib.md5(value).hexdigest()
+
+        if not digest in self.settings_ids:
+            conn = self.connection()
+            conn.execute("INSERT OR IGNORE INTO settings (digest, value) VALUES (?, ?)",
+                    (digest, sqlite3.Binary(value)))
+            row = conn.execute("SELECT id FROM settings WHERE digest = ?", (digest,)).fetchone()
+            self.settings_ids[digest] = row[0]
+
+        return self.settings_ids[digest]
+
+    def load_settings(self, settings_ids):
+        settings = {}
+        for i in range(0, len(settings_ids), 500):
+            chunk = settings_ids[i:i+500]
+            sql = "SELECT id, value FROM settings WHERE id IN (%s)" % ",".join("?" * len(chunk))
+            for settings_id, value in self.execute(sql, chunk):
+                settings[settings_id] = dict(self.pickle().loads(str(value)))
+        return settings
+
+    # Batches
+    def start_batch(self, batch_uuid, start_time):
+        with self.lock:
+            cursor = self.connection().execute(
+                    "INSERT INTO batches (uuid, start_time) VALUES (?, ?)",
+                    (batch_uuid, start_time))
+            self.open_batch_id = cursor.lastrowid
+            return cursor.lastrowid
+
+    def finish_batch(self, batch_id, start_time, end_time, filters_used):
+        with self.lock:
+            self.connection().execute(
+                    """UPDATE batches SET start_time = ?, end_time = ?,
+                    filters_used = ?, complete = 1 WHERE id = ?""",
+                    (start_time, end_time, " ".join(filters_used), batch_id))
+            self.prune()
+            self.commit()
+            self.open_batch_id = None
+
+    def prune(self):
+        """
+        Removes all but the most recent completed batches.
+        """
+        rows = self.execute("""SELECT id FROM batches WHERE complete = 1
+                ORDER BY id DESC LIMIT ?""", (self.keep_batches,))
+        if not rows:
+            return
+
+        oldest_kept = rows[-1][0]
+        for table, column in (('datas', 'batch_id'), ('docs', 'batch_id'), ('batches', 'id')):
+            self.execute("DELETE FROM %s WHERE %s < ?" % (table, column), (oldest_kept,))
+        self.execute("""DELETE FROM settings WHERE id NOT IN
+                (SELECT DISTINCT settings_id FROM datas)""")
+        self.settings_ids = {}
+
+    def most_recent_batch(self):
+        """
+        Returns (id, uuid, start_time, end_time, filters_used) of the most
+        recent completed batch, or None.
+        """
+        rows = self.execute("""SELECT id, uuid, start_time, end_time, filters_used
+                FROM batches WHERE complete = 1 ORDER BY id DESC LIMIT 1""")
+        if rows:
+            return rows[0]
+
+    # Docs
+    def save_doc(self, batch_id, doc_key, info):
+        """
+        Inserts or replaces information about the doc.
+        """
+        datas = [('input', 0, info['input-data']), ('output', 0, info['output-data'])]
+        datas.extend(('filter', i, args) for i, args in enumerate(info['filters-data']))
+
+        with self.lock:
+            conn = self.connection()
+            conn.execute("INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (batch_id, doc_key, info['title'], info['start_time'],
+                        info['finish_time'], info['elapsed'], info['state']))
+            conn.execute("DELETE FROM datas WHERE batch_id = ? AND doc_key = ?",
+                    (batch_id, doc_key))
+            conn.executemany("INSERT INTO datas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(batch_id, doc_key, role, position, alias, key, ext, storage_key,
+                        settings.get('output-name') or settings.get('canonical-name'),
+                        self.settings_id(settings))
+                        for role, position, (alias, key, ext, storage_key, settings) in datas])
+
+    def update_doc_states(self, batch_id, states):
+        """
+        Updates the state of docs given a list of (state, doc key) tuples.
+        """
+        with self.lock:
+            self.connection().executemany(
+                    "UPDATE docs SET state = ? WHERE batch_id = ? AND doc_key = ?",
+                    [(state, batch_id, doc_key) for state, doc_key in states])
+
+    def remove_doc(self, batch_id, doc_key):
+        with self.lock:
+            for table in ('docs', 'datas'):
+                self.execute("DELETE FROM %s WHERE batch_id = ? AND doc_key = ?" % table,
+                        (batch_id, doc_key))
+
+    def load_docs(self, batch_id, doc_keys=None):
+        """
+        Returns a dict of doc keys to doc info dicts, in the format returned
+        by Doc.batch_info, for all docs in the batch or only those listed.
+        """
+        docs_sql = "SELECT doc_key, title, start_time, finish_time, elapsed, state FROM docs WHERE batch_id = ?"
+        datas_sql = """SELECT doc_key, role, position, alias, key, ext, storage_key, settings_id
+                FROM datas WHERE batch_id = ?"""
+
+        if doc_keys is None:
+            doc_rows = self.execute(docs_sql, (batch_id,))
+            data_rows = self.execute(datas_sql, (batch_id,))
+        else:
+            doc_rows = []
+            data_rows = []
+            for doc_key in doc_keys:
+                doc_rows.extend(self.execute(docs_sql + " AND doc_key = ?", (batch_id, doc_key)))
+                data_rows.extend(self.execute(datas_sql + " AND doc_key = ?", (batch_id, doc_key)))
+
+        docs = {}
+        for doc_key, title, start_time, finish_time, elapsed, state in doc_rows:
+            docs[doc_key] = {
+                    'filters-data' : [],
+                    'title' : title,
+                    'start_time' : start_time,
+                    'finish_time' : finish_time,
+                    'elapsed' : elapsed,
+                    'state' : state
+                    }
+
+        settings = self.load_settings(list(set(row[-1] for row in data_rows)))
+
+        for doc_key, role, position, alias, key, ext, storage_key, settings_id in sorted(data_rows):
+            args = (alias, key, ext, storage_key, settings[settings_id])
+            if role == 'filter':
+                docs[doc_key]['filters-data'].append(args)
+            else:
+                docs[doc_key]["%s-data" % role] = args
+
+        return docs
+
+    def doc_key_for_storage_key(self, batch_id, storage_key):
+        rows = self.execute("""SELECT doc_key FROM datas WHERE batch_id = ?
+                AND role = 'output' AND storage_key = ?""", (batch_id, storage_key))
+        if rows:
+            return rows[0][0]
+
+    def doc_keys_for_output(self, batch_id, key=None, expr=None, name=None):
+        """
+        Returns doc keys whose output data has exactly this key, a key
+        containing expr, or this output name.
+        """
+        sql = "SELECT doc_key FROM datas WHERE batch_id = ? AND role = 'output'"
+        if key is not None:
+            rows = self.execute(sql + " AND key = ?", (batch_id, key))
+        elif expr is not None:
+            rows = self.execute(sql + " AND instr(key, ?) > 0", (batch_id, expr))
+        else:
+            rows = self.execute(sql + " AND name = ?", (batch_id, name))
+        return [row[0] for row in rows]
+
+    # Node args
+    def load_node_args(self):
+        return dict(self.execute("SELECT node_key, argstring FROM node_args"))
+
+    def save_node_args(self, node_args):
+        with self.lock:
+            self.check_no_open_batch()
+            conn = self.connection()
+            conn.execute("DELETE FROM node_args")
+            conn.executemany("INSERT INTO node_args VALUES (?, ?)", node_args.iteritems())
+            conn.commit()
+
+    # Artifacts
+    def load_artifacts(self):
+        """
+        Returns a dict of object digests to (filter alias, last access time).
+        """
+        rows = self.execute("SELECT digest, alias, last_access FROM artifacts")
+        return dict((digest, (alias, last_access)) for digest, alias, last_access in rows)
+
+    def save_artifact_access(self, accesses):
+        """
+        Records access times given a dict of digests to (filter alias or None,
+        access time). The alias already recorded is kept if none is given.
+        """
+        with self.lock:
+            self.check_no_open_batch()
+            conn = self.connection()
+            conn.executemany("""INSERT OR REPLACE INTO artifacts VALUES (?,
+                    COALESCE(?, (SELECT alias FROM artifacts WHERE digest = ?)), ?)""",
+                    [(digest, alias, digest, last_access)
+                        for digest, (alias, last_access) in accesses.iteritems()])
+            conn.commit()
+
+    def remove_artifacts(self, digests):
+        with self.lock:
+            self.check_no_open_batch()
+            conn = self.connection()
+            conn.executemany("DELETE FROM artifacts WHERE digest = ?",
+                    [(digest,) for digest in digests])
+            conn.commit()
+
+    # History
+    def save_run(self, start_time, end_time, state, jobs, docs):
+        """
+        Adds a run to the history. docs is a list of (doc key, state,
+        elapsed, bytes in, bytes out, filters) tuples, where filters is a
+        list of (alias, elapsed, restored, exit code, bytes in, bytes out)
+        tuples.
+        """
+        with self.lock:
+            self.check_no_open_batch()
+            conn = self.connection()
+            run_id = conn.execute("INSERT INTO runs (start_time, end_time, state, jobs) VALUES (?, ?, ?, ?)",
+                    (start_time, end_time, state, jobs)).lastrowid
+            conn.executemany("INSERT INTO doc_runs VALUES (?, ?, ?, ?, ?, ?)",
+                    [(run_id,) + doc[0:5] for doc in docs])
+            conn.executemany("INSERT INTO filter_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, doc[0], position) + f
+                        for doc in docs
+                        for position, f in enumerate(doc[5])])
+            self.prune_runs()
+            conn.commit()
+            return run_id
+
+    def prune_runs(self):
+        """
+        Removes history of all but the most recent runs.
+        """
+        rows = self.execute("SELECT id FROM runs ORDER BY id DESC LIMIT ?", (self.keep_runs,))
+        if not rows:
+            return
+
+        oldest_kept = rows[-1][0]
+        for table, column in (('filter_runs', 'run_id'), ('doc_runs', 'run_id'), ('runs', 'id')):
+            self.execute("DELETE FROM %s WHERE %s < ?" % (table, column), (oldest_kept,))
+
+    def recent_runs(self, n):
+        """
+        Returns a list of (id, start_time, end_time, state, jobs) for the
+        most recent n runs, oldest first.
+        """
+        rows = self.execute("""SELECT id, start_time, end_time, state, jobs FROM runs
+                ORDER BY id DESC LIMIT ?""", (n,))
+        return list(reversed(rows))
+
+    def doc_runs(self, run_ids):
+        """
+        Returns a list of (run id, doc key, state, elapsed, bytes in, bytes
+        out) for docs in the runs.
+        """
+        return self.history_rows('doc_runs', run_ids)
+
+    def filter_runs(self, run_ids):
+        """
+        Returns a list of (run id, doc key, position, alias, elapsed,
+        restored, exit code, bytes in, bytes out) for filters in the runs.
+        """
+        return self.history_rows('filter_runs', run_ids)
+
+    def history_rows(self, table, run_ids):
+        if not run_ids:
+            return []
+        return self.execute("SELECT * FROM %s WHERE run_id >= ? AND run_id <= ?" % table,
+                (min(run_ids), max(run_ids)))
 
 class Batch(object):
+    """
+    Information about the docs in a dexy run. Doc info is written to the
+    batch database as docs are added and updated once the run has started,
+    and the batch becomes the most recent batch when it is saved at the end
+    of a successful run.
+
+    A batch loaded from the database only reads doc info when needed.
+
+    Data objects are created once per doc and input/output and then shared
+    by everything which asks the batch for them.
+    """
     def __init__(self, wrapper):
         self.wrapper = wrapper
-        self.docs = {}
+        self._docs = {}
+        self._doc_infos = {} # doc info read so far for a batch loaded from the db
+        self._datas = {} # (doc key, 'input' or 'output') -> data object
         self.doc_keys = {}
         self.filters_used = []
         self.uuid = str(uuid.uuid4())
+        self.batch_id = None
         self.start_time = None
         self.end_time = None
 
@@ -21,6 +469,15 @@ class Batch(object):
                 continue
             yield self.output_data(doc_key)
 
+    def db(self):
+        return self.wrapper.batch_db()
+
+    @property
+    def docs(self):
+        if self._docs is None:
+            self._docs = self.db().load_docs(self.batch_id)
+        return self._docs
+
     def add_doc(self, doc):
         """
         Adds a new doc to the batch of docs.
@@ -32,8 +489,65 @@ class Batch(object):
             self.update_doc_info(doc)
             self.filters_used.extend(doc.filter_aliases)
 
+    def remove_doc(self, doc):
+        """
+        Removes a doc from the batch.
+        """
+        doc_key = doc.key_with_class()
+        self.docs.pop(doc_key, None)
+        self.forget_datas(doc_key)
+        self.doc_keys.pop(doc.output_data().storage_key, None)
+        if self.batch_id is not None:
+            self.db().remove_doc(self.batch_id, doc_key)
+
     def update_doc_info(self, doc):
-        self.docs[doc.key_with_class()] = doc.batch_info()
+        doc_key = doc.key_with_class()
+        info = doc.batch_info()
+        self.docs[doc_key] = info
+        self.forget_datas(doc_key)
+        if self.batch_id is not None:
+            self.db().save_doc(self.batch_id, doc_key, info)
+
+    def forget_datas(self, doc_key):
+        for input_or_output in ('input', 'output'):
+            self._datas.pop((doc_key, input_or_output), None)
+
+    def start(self):
+        """
+        Called when the run starts, from now on doc info is written to the
+        batch database as it changes.
+        """
+        self.start_time = time.time()
+        if self.batch_id is None:
+            db = self.db()
+            self.batch_id = db.start_batch(self.uuid, self.start_time)
+            for doc_key, info in self.docs.iteritems():
+                db.save_doc(self.batch_id, doc_key, info)
+
+    def save(self):
+        """
+        Records the final state of each doc and marks the batch as complete,
+        making it the most recent batch.
+        """
+        if self.batch_id is None:
+            self.start()
+
+        nodes = getattr(self.wrapper, 'nodes', {})
+        states = []
+        for doc_key, info in self.docs.iteritems():
+            if doc_key in nodes:
+                info['state'] = nodes[doc_key].state
+            states.append((info['state'], doc_key))
+
+        self.db().update_doc_states(self.batch_id, states)
+        self.db().finish_batch(self.batch_id, self.start_time, self.end_time,
+                self.filters_used)
+
+    def abandon(self):
+        """
+        Discards doc info written since the last save, e.g. after an error.
+        """
+        self.db().rollback()
 
     def output_data(self, doc_key):
         return self.data(doc_key, 'output')
@@ -42,10 +556,21 @@ class Batch(object):
         return self.data(doc_key, 'input')
 
     def doc_info(self, doc_key):
-        return self.docs[doc_key]
-   
+        if self._docs is None:
+            if not doc_key in self._doc_infos:
+                self._doc_infos.update(self.db().load_docs(self.batch_id, [doc_key]))
+            return self._doc_infos[doc_key]
+        else:
+            return self._docs[doc_key]
+
     def doc_key(self, storage_key):
-        return self.doc_keys[storage_key]
+        if self._docs is None:
+            doc_key = self.db().doc_key_for_storage_key(self.batch_id, storage_key)
+            if doc_key is None:
+                raise KeyError(storage_key)
+            return doc_key
+        else:
+            return self.doc_keys[storage_key]
 
     def data_for_storage_key(self, storage_key, input_or_output='output'):
         """
@@ -57,10 +582,17 @@ class Batch(object):
 
     def data(self, doc_key, input_or_output='output'):
         """
-        Retrieves a data object given the doc key.
+        Retrieves a data object given the doc key. The same data object is
+        returned each time.
         """
-        doc_info = self.doc_info(doc_key)["%s-data" % input_or_output]
-        args = list(doc_info)
+        cache_key = (doc_key, input_or_output)
+        if not cache_key in self._datas:
+            info = self.doc_info(doc_key)
+            self._datas[cache_key] = self.create_data(info["%s-data" % input_or_output])
+        return self._datas[cache_key]
+
+    def create_data(self, data_args):
+        args = list(data_args)
         args.append(self.wrapper)
         data = dexy.data.Data.create_instance(*args)
         data.setup_storage()
@@ -68,61 +600,48 @@ class Batch(object):
             data.storage.connect()
         return data
 
+    def matching_output_data(self, key=None, expr=None, name=None):
+        """
+        Returns output data of docs whose output has exactly this key, a key
+        containing expr, or this output name, sorted by key.
+        """
+        if self._docs is None:
+            db = self.db()
+            doc_keys = db.doc_keys_for_output(self.batch_id, key, expr, name)
+            self._doc_infos.update(db.load_docs(self.batch_id,
+                [doc_key for doc_key in doc_keys if not doc_key in self._doc_infos]))
+            datas = [self.output_data(doc_key) for doc_key in doc_keys
+                    if self._doc_infos[doc_key]['state'] != 'uncached']
+        else:
+            datas = [data for data in self
+                    if (key is not None and data.key == key) or
+                    (expr is not None and expr in data.key) or
+                    (name is not None and data.name == name)]
+
+        return sorted(datas, key=lambda data: data.key)
+
     def elapsed(self):
         if self.end_time and self.start_time:
             return self.end_time - self.start_time
         else:
             return 0
 
-    def filename(self):
-        return "%s.pickle" % self.uuid
-
-    def filepath(self):
-        return os.path.join(self.batch_dir(), self.filename())
-
-    def most_recent_filename(self):
-        return os.path.join(self.batch_dir(), 'most-recent-batch.txt')
-
-    def batch_dir(self):
-        return os.path.join(self.wrapper.artifacts_dir, 'batches')
-
-    def to_dict(self):
-        attr_names = ['docs', 'doc_keys', 'filters_used', 'uuid']
-        return dict((k, getattr(self, k),) for k in attr_names)
-
-    def save_to_file(self):
-        try:
-            os.makedirs(self.batch_dir())
-        except OSError:
-            pass
-
-        with open(self.filepath(), 'w') as f:
-            pickle = dexy.utils.pickle_lib(self.wrapper)
-            pickle.dump(self.to_dict(), f)
-
-        with open(self.most_recent_filename(), 'w') as f:
-            f.write(self.uuid)
-
-    def load_from_file(self):
-        pickle = dexy.utils.pickle_lib(self.wrapper)
-        with open(self.filepath(), 'r') as f:
-            d = pickle.load(f)
-            for k, v in d.iteritems():
-                setattr(self, k, v)
-
     @classmethod
     def load_most_recent(klass, wrapper):
         """
-        Retuns a batch instance representing the most recent batch as indicated
-        by the UUID stored in most-recent-batch.txt.
+        Returns a batch instance representing the most recently completed
+        batch, or None if there is no completed batch.
         """
+        db = wrapper.batch_db()
+        if not db.exists():
+            return None
+
+        row = db.most_recent_batch()
+        if not row:
+            return None
+
         batch = Batch(wrapper)
-        try:
-            with open(batch.most_recent_filename(), 'r') as f:
-                most_recent_uuid = f.read()
-
-            batch.uuid = most_recent_uuid
-            batch.load_from_file()
-            return batch
-        except IOError:
-            pass
+        batch.batch_id, batch.uuid, batch.start_time, batch.end_time, filters_used = row
+        batch.filters_used = (filters_used or "").split()
+        batch._docs = None
+        return batch
@@ -0,0 +1,409 @@
+from dexy.utils import file_digest
+from dexy.utils import is_windows
+import dexy.remote_cache
+import os
+import shutil
+import stat
+import tarfile
+import threading
+import time
+import uuid
+
+class ContentAddressedStore(object):
+    """
+    Stores filter output files under .dexy/cas/ named by the digest of their
+    contents, so identical outputs are kept once and shared via hard links.
+
+    An index maps content addresses (digests of everything which determines a
+    filter's output, see `Filter.content_address`) to output digests. A filter
+    whose content address is already in the index does not need to run, e.g.
+    when a doc changes back to contents it had in an earlier run or output is
+    found in a remote cache. Names of docs are part of the content address, so
+    a renamed doc is run again, but its output is still stored once if it is
+    identical.
+
+    If a remote cache is configured, content addresses which are not in the
+    local index are looked up there, and new output is published to it.
+
+    The time each object was last used, and the filter which created it, are
+    recorded in the batch database so the store can be kept within a size
+    budget by removing the least recently used objects.
+    """
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.file_digests = {}
+        self.object_digests = {} # cache files linked to objects in this run
+        self.accessed = {} # digest -> (filter alias, access time)
+        self.lock = threading.Lock()
+        self.remote = dexy.remote_cache.create_remote_cache(wrapper)
+
+    def cas_dir(self):
+        return os.path.join(self.wrapper.artifacts_dir, 'cas')
+
+    def object_path(self, digest):
+        return os.path.join(self.cas_dir(), 'objects', digest[0:2], digest)
+
+    def index_path(self, content_address):
+        return os.path.join(self.cas_dir(), 'index', content_address[0:2], content_address)
+
+    def file_digest(self, filepath):
+        """
+        Returns digest of file contents. Files in the cache are written once
+        per run, so each is only hashed once.
+        """
+        with self.lock:
+            digest = self.file_digests.get(filepath)
+        if not digest:
+            digest = file_digest(filepath)
+            with self.lock:
+                self.file_digests[filepath] = digest
+        return digest
+
+    def makedirs(self, filepath):
+        try:
+            os.makedirs(os.path.dirname(filepath))
+        except OSError:
+            pass
+
+    def link_or_copy(self, src, dest):
+        try:
+            os.link(src, dest)
+        except (OSError, AttributeError):
+            shutil.copyfile(src, dest)
+
+    def set_read_only(self, filepath):
+        if not is_windows:
+            os.chmod(filepath, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+    def is_valid_digest(self, digest, source):
+        """
+        Returns a boolean indicating whether digest is an md5 hex digest and
+        so safe to use in a path, logging digests which aren't.
+        """
+        if dexy.remote_cache.VALID_DIGEST.match(digest):
+            return True
+
+        if hasattr(self.wrapper, 'log'):
+            msg = "ignoring invalid digest '%s' from %s"
+            self.wrapper.log.warn(msg % (digest[0:80], source))
+        return False
+
+    def lookup(self, content_address):
+        """
+        Returns the output digest stored for content_address, or None if
+        there is no entry or the object it refers to has gone.
+        """
+        if not self.is_valid_digest(content_address, "content address"):
+            return None
+
+        try:
+            with open(self.index_path(content_address), 'r') as f:
+                digest = f.read().strip()
+        except IOError:
+            return self.fetch_from_remote(content_address)
+
+        if not self.is_valid_digest(digest, "index entry %s" % content_address):
+            return self.fetch_from_remote(content_address)
+        elif os.path.exists(self.object_path(digest)):
+            return digest
+        else:
+            return self.fetch_from_remote(content_address)
+
+    def remote_failed(self, action, e):
+        # Dexy works without the remote cache, so rather than failing the
+        # run or waiting on it for every filter it is no longer used.
+        msg = "not using remote cache %s after error %s: %s"
+        self.wrapper.log.warn(msg % (self.remote.location, action, e))
+        self.remote = None
+
+    def fetch_from_remote(self, content_address):
+        """
+        Copies the index entry and object for content_address from the remote
+        cache into the local store. Returns the output digest, or None if the
+        remote cache doesn't have output for content_address.
+        """
+        remote = self.remote
+        if not remote:
+            return None
+
+        try:
+            digest = remote.lookup(content_address)
+            if not digest or not self.is_valid_digest(digest, "remote cache %s" % remote.location):
+                return None
+
+            object_path = self.object_path(digest)
+            if not os.path.exists(object_path):
+                self.makedirs(object_path)
+                tmp_path = "%s.%s" % (object_path, uuid.uuid4())
+                if not remote.fetch(digest, tmp_path):
+                    return None
+                if file_digest(tmp_path) != digest:
+                    os.remove(tmp_path)
+                    self.wrapper.log.warn("discarding corrupt object %s from remote cache" % digest)
+                    return None
+                self.set_read_only(tmp_path)
+                os.rename(tmp_path, object_path)
+
+        except (IOError, OSError) as e:
+            self.remote_failed("fetching %s" % content_address, e)
+            return None
+
+        self.write_index_entry(content_address, digest)
+        self.wrapper.log.debug("fetched %s from remote cache" % content_address)
+        return digest
+
+    def publish_to_remote(self, content_address, digest):
+        remote = self.remote
+        if not remote:
+            return
+
+        try:
+            remote.publish(content_address, digest, self.object_path(digest))
+        except (IOError, OSError) as e:
+            self.remote_failed("publishing %s" % content_address, e)
+
+    def record_access(self, filepath, alias=None):
+        """
+        Notes that the object linked to filepath, if any, has been used.
+        """
+        with self.lock:
+            digest = self.object_digests.get(filepath)
+            if digest:
+                if not alias and digest in self.accessed:
+                    alias = self.accessed[digest][0]
+                self.accessed[digest] = (alias, time.time())
+
+    def save_access_times(self):
+        with self.lock:
+            accessed = self.accessed
+            self.accessed = {}
+        if accessed:
+            self.wrapper.batch_db().save_artifact_access(accessed)
+
+    def restore(self, content_address, filepath, alias=None):
+        """
+        Links stored output for content_address to filepath. Returns a
+        boolean indicating whether output was available.
+        """
+        if not content_address:
+            return False
+
+        digest = self.lookup(content_address)
+        if not digest:
+            return False
+
+        self.makedirs(filepath)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        self.link_or_copy(self.object_path(digest), filepath)
+
+        with self.lock:
+            self.file_digests[filepath] = digest
+            self.object_digests[filepath] = digest
+        self.record_access(filepath, alias)
+
+        self.wrapper.log.debug("restored %s from content-addressed store" % filepath)
+        return True
+
+    def store(self, content_address, filepath, alias=None):
+        """
+        Adds the file at filepath to the store and records it as the output
+        for content_address. If identical content is already stored, filepath
+        is replaced by a link to the existing object.
+        """
+        if not content_address:
+            return
+
+        digest = self.file_digest(filepath)
+        object_path = self.object_path(digest)
+
+        if os.path.exists(object_path):
+            if os.stat(object_path).st_ino != os.stat(filepath).st_ino:
+                os.remove(filepath)
+                self.link_or_copy(object_path, filepath)
+        else:
+            self.makedirs(object_path)
+            try:
+                self.link_or_copy(filepath, object_path)
+                self.set_read_only(object_path)
+            except (OSError, IOError):
+                # another worker stored the same content first
+                pass
+
+        with self.lock:
+            self.object_digests[filepath] = digest
+        self.record_access(filepath, alias)
+
+        self.write_index_entry(content_address, digest)
+        self.publish_to_remote(content_address, digest)
+
+    def write_index_entry(self, content_address, digest):
+        """
+        Records digest as the output for content_address. Returns a boolean
+        indicating whether the entry was written, entries which aren't md5
+        hex digests are not.
+        """
+        if not self.is_valid_digest(content_address, "index entry name"):
+            return False
+        if not self.is_valid_digest(digest, "index entry %s" % content_address):
+            return False
+
+        index_path = self.index_path(content_address)
+        self.makedirs(index_path)
+        tmp_path = "%s.%s" % (index_path, uuid.uuid4())
+        with open(tmp_path, 'w') as f:
+            f.write(digest)
+        os.rename(tmp_path, index_path)
+        return True
+
+    def stored_files(self):
+        """
+        Yields (path relative to the store dir, absolute path) for each index
+        entry and object in the store.
+        """
+        for subdir in ('index', 'objects'):
+            for dirpath, dirnames, filenames in os.walk(os.path.join(self.cas_dir(), subdir)):
+                for filename in filenames:
+                    filepath = os.path.join(dirpath, filename)
+                    relpath = os.path.relpath(filepath, self.cas_dir()).replace(os.sep, "/")
+                    # skips temporary files which are still being written
+                    if dexy.remote_cache.VALID_PATH.match(relpath):
+                        yield relpath, filepath
+
+    def export_archive(self, filename):
+        """
+        Writes all index entries and objects to a tarball. Returns the number
+        of index entries exported.
+        """
+        n_entries = 0
+        archive = tarfile.open(filename, "w:gz")
+        try:
+            for relpath, filepath in self.stored_files():
+                archive.add(filepath, relpath)
+                if relpath.startswith("index/"):
+                    n_entries += 1
+        finally:
+            archive.close()
+        return n_entries
+
+    def import_archive(self, filename):
+        """
+        Adds index entries and objects from a tarball written by
+        export_archive, skipping any already in the store. Objects whose
+        contents don't match their digest are skipped. Returns the number of
+        index entries imported.
+        """
+        n_entries = 0
+        archive = tarfile.open(filename, "r:*")
+        try:
+            for member in archive:
+                if not member.isfile() or not dexy.remote_cache.VALID_PATH.match(member.name):
+                    continue
+
+                filepath = os.path.join(self.cas_dir(), *member.name.split("/"))
+                if os.path.exists(filepath):
+                    continue
+
+                member_file = archive.extractfile(member)
+                if member.name.startswith("index/"):
+                    if self.write_index_entry(os.path.basename(filepath), member_file.read().strip()):
+                        n_entries += 1
+                elif not self.is_valid_digest(os.path.basename(filepath), "archive %s" % filename):
+                    continue
+                else:
+                    self.makedirs(filepath)
+                    tmp_path = "%s.%s" % (filepath, uuid.uuid4())
+                    with open(tmp_path, 'wb') as f:
+                        shutil.copyfileobj(member_file, f)
+                    if file_digest(tmp_path) != os.path.basename(filepath):
+                        os.remove(tmp_path)
+                        continue
+                    self.set_read_only(tmp_path)
+                    os.rename(tmp_path, filepath)
+        finally:
+            archive.close()
+        return n_entries
+
+    def objects(self):
+        """
+        Yields (digest, size, is_linked) for each object in the store, where
+        is_linked indicates whether the object is hard linked from the cache
+        dir, i.e. used by the last successful run.
+        """
+        for relpath, filepath in self.stored_files():
+            if relpath.startswith("objects/"):
+                try:
+                    info = os.stat(filepath)
+                except OSError:
+                    continue
+                yield os.path.basename(filepath), info.st_size, info.st_nlink > 1
+
+    def footprint(self):
+        """
+        Returns a dict of filter aliases to (number of objects, total size,
+        size not used by the last run) for objects in the store.
+        """
+        artifacts = self.wrapper.batch_db().load_artifacts()
+        footprint = {}
+        for digest, size, is_linked in self.objects():
+            alias = artifacts.get(digest, (None, None))[0] or '(unknown)'
+            n_objects, total_size, unused_size = footprint.get(alias, (0, 0, 0))
+            if not is_linked:
+                unused_size += size
+            footprint[alias] = (n_objects + 1, total_size + size, unused_size)
+        return footprint
+
+    def collect_garbage(self, max_size):
+        """
+        Removes the least recently used objects until the store takes up no
+        more than max_size bytes, along with index entries which refer to
+        them. Objects used by the last successful run are never removed.
+        Returns (number of objects removed, bytes freed).
+        """
+        db = self.wrapper.batch_db()
+        artifacts = db.load_artifacts()
+        now = time.time()
+
+        total_size = 0
+        in_use = {}
+        candidates = []
+        for digest, size, is_linked in self.objects():
+            total_size += size
+            if is_linked:
+                # Output of cached docs is not read during a run, so objects
+                # which are in use count as used now.
+                in_use[digest] = (artifacts.get(digest, (None, None))[0], now)
+            else:
+                last_access = artifacts.get(digest, (None, 0))[1] or 0
+                candidates.append((last_access, digest, size))
+
+        db.save_artifact_access(in_use)
+
+        removed = []
+        freed = 0
+        for last_access, digest, size in sorted(candidates):
+            if total_size - freed <= max_size:
+                break
+            try:
+                os.remove(self.object_path(digest))
+            except OSError:
+                continue
+            removed.append(digest)
+            freed += size
+
+        if removed:
+            self.remove_dangling_index_entries()
+        # forget removed objects and any which have gone some other way
+        existing = set(in_use).union(digest for _, digest, _ in candidates)
+        db.remove_artifacts((set(artifacts) - existing).union(removed))
+
+        return len(removed), freed
+
+    def remove_dangling_index_entries(self):
+        for relpath, filepath in list(self.stored_files()):
+            if relpath.startswith("index/"):
+                with open(filepath, 'r') as f:
+                    digest = f.read().strip()
+                if not dexy.remote_cache.VALID_DIGEST.match(digest) or \
+                        not os.path.exists(self.object_path(digest)):
+                    os.remove(filepath)
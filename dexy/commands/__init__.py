@@ -35,12 +35,15 @@ from dexy.commands.it import dexy_command
 from dexy.commands.it import it_command
 from dexy.commands.it import targets_command
 from dexy.commands.nodes import nodes_command
+from dexy.commands.plan import plan_command
 from dexy.commands.reporters import reporters_command
 from dexy.commands.reporters import reporters_command as reports_command
 from dexy.commands.serve import serve_command
+from dexy.commands.stats import stats_command
 from dexy.commands.templates import gen_command
 from dexy.commands.templates import template_command
 from dexy.commands.templates import templates_command
+from dexy.commands.watch import watch_command
 
 ### "modargs-settings"
 dexy_default_cmd = 'dexy'
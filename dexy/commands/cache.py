@@ -0,0 +1,138 @@
+from dexy.commands.utils import init_wrapper
+from dexy.utils import defaults
+import BaseHTTPServer
+import SocketServer
+import dexy.cas
+import dexy.exceptions
+import dexy.plugin
+import dexy.remote_cache
+import dexy.utils
+import os
+import socket
+import sys
+
+class CacheCommand(dexy.plugin.Command):
+    """
+    Commands for sharing dexy's cache of filter output.
+    """
+    aliases = ['cache']
+    namespace = 'cache'
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+def cache_command():
+    """
+    Lists the commands for sharing dexy's cache of filter output.
+    """
+    print "`dexy cache:stats` lists how much space stored filter output takes up"
+    print "`dexy cache:gc` removes least recently used filter output"
+    print "`dexy cache:export` writes cached filter output to a tarball"
+    print "`dexy cache:import` adds cached filter output from a tarball"
+    print "`dexy cache:serve` serves a directory as a remote cache over http"
+
+def format_size(size):
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            break
+        size /= 1024.0
+    else:
+        unit = 'TB'
+    if unit == 'bytes':
+        return "%d %s" % (size, unit)
+    else:
+        return "%.1f %s" % (size, unit)
+
+def stats_command(
+        __cli_options=False,
+        artifactsdir=defaults['artifacts_dir'], # location of directory in which to store artifacts
+        ):
+    """
+    Lists the number and size of stored filter outputs for each filter, and
+    how much of that space is not used by the last run and so can be freed
+    by `dexy cache:gc`.
+    """
+    wrapper = init_wrapper(locals())
+    wrapper.assert_dexy_dirs_exist()
+    footprint = dexy.cas.ContentAddressedStore(wrapper).footprint()
+
+    print "%-20s %8s %12s %12s" % ("filter", "outputs", "size", "unused")
+    for alias, (n_objects, size, unused_size) in sorted(footprint.iteritems(),
+            key=lambda item: -item[1][1]):
+        print "%-20s %8s %12s %12s" % (alias, n_objects, format_size(size), format_size(unused_size))
+
+    totals = [sum(values) for values in zip(*footprint.values())] or [0, 0, 0]
+    print "%-20s %8s %12s %12s" % ("total", totals[0], format_size(totals[1]), format_size(totals[2]))
+
+def gc_command(
+        __cli_options=False,
+        artifactsdir=defaults['artifacts_dir'], # location of directory in which to store artifacts
+        cachemaxsize=defaults['cache_max_size'], # Size to reduce stored filter output to, e.g. 500M or 2G. If not set, all output not used by the last run is removed.
+        conf=defaults['config_file'], # name to use for configuration file
+        ):
+    """
+    Removes the least recently used filter output from the content-addressed
+    store until it is within the size limit. Output used by the last run is
+    never removed.
+    """
+    wrapper = init_wrapper(locals())
+    wrapper.assert_dexy_dirs_exist()
+    max_size = dexy.utils.parse_size(wrapper.cache_max_size or 0)
+    n_removed, freed = dexy.cas.ContentAddressedStore(wrapper).collect_garbage(max_size)
+    print "removed %s stored filter outputs, freeing %s" % (n_removed, format_size(freed))
+
+def export_command(
+        __cli_options=False,
+        artifactsdir=defaults['artifacts_dir'], # location of directory in which to store artifacts
+        f='dexy-cache.tar.gz' # name of tarball to write
+        ):
+    """
+    Writes the content-addressed store of filter output to a tarball, which
+    can be imported into another project or machine with `dexy cache:import`.
+    """
+    wrapper = init_wrapper(locals())
+    wrapper.assert_dexy_dirs_exist()
+    n_entries = dexy.cas.ContentAddressedStore(wrapper).export_archive(f)
+    print "exported %s cached filter outputs to %s" % (n_entries, f)
+
+def import_command(
+        __cli_options=False,
+        artifactsdir=defaults['artifacts_dir'], # location of directory in which to store artifacts
+        f='dexy-cache.tar.gz' # name of tarball to read
+        ):
+    """
+    Adds filter output from a tarball written by `dexy cache:export` to the
+    content-addressed store. Output already in the store is kept.
+    """
+    if not os.path.exists(f):
+        raise dexy.exceptions.UserFeedback("No file '%s' to import." % f)
+
+    wrapper = init_wrapper(locals())
+    wrapper.assert_dexy_dirs_exist()
+    n_entries = dexy.cas.ContentAddressedStore(wrapper).import_archive(f)
+    print "imported %s cached filter outputs from %s" % (n_entries, f)
+
+def serve_command(
+        directory='.dexy-remote-cache', # directory in which to store cached filter output
+        port=8086 # port to listen on
+        ):
+    """
+    Runs a web server which stores and serves filter output for other dexy
+    projects, which use it by setting the remotecache option to the
+    server's URL, e.g. `dexy --remotecache http://hostname:8086`.
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    try:
+        httpd = ThreadingHTTPServer(("", port), dexy.remote_cache.RemoteCacheRequestHandler)
+    except socket.error as e:
+        raise dexy.exceptions.UserFeedback("Can't listen on port %s: %s" % (port, e))
+    httpd.root = os.path.abspath(directory)
+
+    print "serving remote cache in %s on http://localhost:%s" % (directory, port)
+    print "type ctrl+c to stop"
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -3,7 +3,6 @@ from dexy.commands.utils import init_wrapper
 from dexy.commands.utils import print_indented
 from dexy.commands.utils import print_rewrapped
 from dexy.utils import defaults
-from operator import attrgetter
 import dexy.exceptions
 import sys
 
@@ -96,15 +95,18 @@ def info_command(
     wrapper = init_wrapper(locals())
     wrapper.setup_log()
     batch = Batch.load_most_recent(wrapper)
+
+    if not batch:
+        print "you need to run dexy first"
+        sys.exit(1)
+
     wrapper.batch = batch
 
     if expr:
         print "search expr:", expr
-        matches = sorted([data for data in batch if expr in data.key],
-                key=attrgetter('key'))
+        matches = batch.matching_output_data(expr=expr)
     elif key:
-        matches = sorted([data for data in batch if key == data.key],
-                key=attrgetter('key'))
+        matches = batch.matching_output_data(key=key)
     else:
         raise dexy.exceptions.UserFeedback("Must specify either expr or key")
 
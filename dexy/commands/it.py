@@ -1,15 +1,17 @@
+from dexy.commands.cache import format_size
 from dexy.commands.utils import init_wrapper
 from dexy.utils import defaults
 from operator import attrgetter
 import dexy.exceptions
+import dexy.iostats
 import os
-import subprocess
 import sys
 import time
 
 def dexy_command(
         __cli_options=False,
         artifactsdir=defaults['artifacts_dir'], # location of directory in which to store artifacts
+        cachemaxsize=defaults['cache_max_size'], # Size limit for stored filter output, e.g. 500M or 2G. Least recently used output is removed after each run.
         conf=defaults['config_file'], # name to use for configuration file
         configs=defaults['configs'], # list of doc config files to parse
         debug=defaults['debug'], # Prints stack traces, other debug stuff.
@@ -24,6 +26,8 @@ def dexy_command(
         h=False, #nodoc
         hashfunction=defaults['hashfunction'], # What hash function to use, set to crc32 or adler32 for more speed but less reliability
         include=defaults['include'], # Locations to include which would normally be excluded.
+        iostats=defaults['iostats'], # Count and time dexy's own file I/O (stat, listdir, read, write, copy) per phase and per document, and print a summary. Counts are also shown in the run report and trace.
+        jobs=defaults['jobs'], # Number of documents to run in parallel.
         logdir=defaults['log_dir'], # DEPRECATED
         logfile=defaults['log_file'], # name of log file
         logformat=defaults['log_format'], # format of log entries
@@ -34,14 +38,17 @@ def dexy_command(
         pickle=defaults['pickle'], # library to use for persisting info to disk, may be 'c', 'py', 'json'
         plugins=defaults['plugins'], # additional python packages containing dexy plugins
         profile=defaults['profile'], # whether to run with cProfile. Arg can be a boolean, in which case profile saved to 'dexy.prof', or a filename to save to.
+        profilefilters=defaults['profile_filters'], # Profile each filter separately, saving profiles to .dexy/profiles/ along with a report of the functions taking most time in each filter.
         r=False, # whether to clear cache before running dexy
         recurse=defaults['recurse'], # whether to include doc config files in subdirectories
+        remotecache=defaults['remote_cache'], # Directory or http:// URL of a cache of filter output shared with other machines or worktrees.
         reports=defaults['reports'], # reports to be run after dexy runs, enclose in quotes and separate with spaces
         reset=False, # whether to clear cache before running dexy
         silent=defaults['silent'], # Whether to not print any output when running dexy
-        strace=defaults['strace'], # Run dexy using strace (VERY slow)
+        strace=defaults['strace'], # DEPRECATED, use iostats
         uselocals=defaults['uselocals'], # use cached local copies of remote URLs, faster but might not be up to date, 304 from server will override this setting
         target=defaults['target'], # Which target to run. By default all targets are run, this allows you to run only 1 bundle (and its dependencies).
+        trace=defaults['trace'], # Write a timeline of the run's phases, documents, filters, subprocesses and reports to .dexy/trace.json, which can be opened in Perfetto or chrome://tracing.
         version=False, # For people who type -version out of habit
         writeanywhere=defaults['writeanywhere'] # Whether dexy can write files outside of the dexy project root.
     ):
@@ -60,23 +67,31 @@ def dexy_command(
     if silent:
         print "sorry, -silent option not implemented yet https://github.com/ananelson/dexy/issues/33"
 
+    if strace:
+        print "the -strace option is deprecated, use -iostats to count dexy's file I/O"
+        iostats = True
+
     wrapper = init_wrapper(locals())
     wrapper.assert_dexy_dirs_exist()
     run_reports = (not noreports)
 
     try:
-        if profile:
-            run_dexy_in_profiler(wrapper, profile)
+        if profile and profilefilters:
+            msg = "can't use -profile and -profilefilters together, cProfile can only profile one at a time"
+            raise dexy.exceptions.UserFeedback(msg)
 
-        elif strace:
-            run_dexy_in_strace(wrapper, strace)
-            run_reports = False
+        elif profile:
+            run_dexy_in_profiler(wrapper, profile)
 
         else:
             start = time.time()
             wrapper.run_from_new()
             elapsed = time.time() - start
             print "dexy run finished in %0.3f%s" % (elapsed, wrapper.state_message())
+            if wrapper.filter_profiler.enabled:
+                print "Filter profiles are in %s, report is in %s." % (
+                        wrapper.filter_profiler.profiles_dir(),
+                        wrapper.filter_profiler.report_filename())
 
     except dexy.exceptions.UserFeedback as e:
         handle_user_feedback_exception(wrapper, e)
@@ -93,6 +108,9 @@ def dexy_command(
         wrapper.report()
         print "dexy reports finished in %0.3f" % (time.time() - start_time)
 
+    if wrapper.fileio.enabled:
+        print_iostats(wrapper)
+
 it_command = dexy_command
 
 def log_and_print_exception(wrapper, e):
@@ -142,34 +160,31 @@ def run_dexy_in_profiler(wrapper, profile):
 
     print "Report is in %s, profile data is in %s." % (stats_output_file, profile_filename)
 
-def run_dexy_in_strace(wrapper, strace):
-    if isinstance(strace, bool):
-        strace_filename = 'dexy.strace'
-    else:
-        strace_filename = strace
-
-    def run_command(command):
-        proc = subprocess.Popen(
-                   command,
-                   shell=True,
-                   stdout=subprocess.PIPE,
-                   stderr=subprocess.PIPE
-                   )
-        stdout, stderr = proc.communicate()
-        print stdout
-
-    commands = ( 
-            "strace dexy --reports \"\" 2> %s" % strace_filename, # TODO pass command line args except for --strace option
-            "echo \"calls to stat:\" ; grep \"^stat(\" %s | wc -l" % strace_filename,
-            "echo \"calls to read:\" ; grep \"^read(\" %s | wc -l" % strace_filename,
-            "echo \"calls to write:\" ; grep \"^write(\" %s | wc -l" % strace_filename,
-            "grep \"^stat(\" %s | sort | uniq -c | sort -r -n > strace-stats.txt" % strace_filename,
-            "grep \"^read(\" %s | sort | uniq -c | sort -r -n > strace-reads.txt" % strace_filename,
-            "grep \"^write(\" %s | sort | uniq -c | sort -r -n > strace-writes.txt" % strace_filename,
-        )
-
-    for command in commands:
-        run_command(command)
+def print_iostats(wrapper, limit=10):
+    """
+    Prints counts of dexy's own file I/O for each phase of the run, and for
+    the nodes which spent longest on I/O.
+    """
+    fileio = wrapper.fileio
+
+    def print_totals(totals, indent):
+        for op in dexy.iostats.OPERATIONS:
+            if op in totals:
+                calls, nbytes, seconds = totals[op]
+                print "%s%-8s %8s calls %12s %9.3fs" % (indent, op, calls,
+                        format_size(nbytes), seconds)
+
+    print "file I/O by phase:"
+    for phase in ('setup', 'walk', 'check', 'run', 'report'):
+        totals = fileio.totals('phase', phase)
+        if totals:
+            print "  %s" % phase
+            print_totals(totals, "    ")
+
+    print "file I/O by node, slowest first:"
+    for node_key in fileio.nodes_by_seconds()[0:limit]:
+        print "  %s" % node_key
+        print_totals(fileio.totals('node', node_key), "    ")
 
 def targets_command(
         full=False, # Whether to just print likely pretty target names, or all names.
@@ -0,0 +1,83 @@
+from dexy.commands.it import handle_user_feedback_exception
+from dexy.commands.stats import format_seconds
+from dexy.commands.utils import init_wrapper
+from dexy.doc import Doc
+from dexy.utils import defaults
+import dexy.exceptions
+import dexy.plan
+
+def plan_command(
+        __cli_options=False,
+        artifactsdir=defaults['artifacts_dir'], # location of directory in which to store artifacts
+        conf=defaults['config_file'], # name to use for configuration file
+        configs=defaults['configs'], # list of doc config files to parse
+        directory=defaults['directory'], # Allow processing just a subdirectory.
+        exclude=defaults['exclude'], # comma-separated list of directory names to exclude from dexy processing
+        excludealso=defaults['exclude_also'], # comma-separated list of directory names to exclude from dexy processing
+        full=defaults['full'], # Whether to do a full run including tasks marked default: False
+        include=defaults['include'], # Locations to include which would normally be excluded.
+        jobs=defaults['jobs'], # Number of documents to run in parallel, also shown in the speedup estimates.
+        n=10, # number of recent runs to take timings from
+        recurse=defaults['recurse'], # whether to include doc config files in subdirectories
+        target=defaults['target'] # Which target to plan for. By default all targets are included.
+        ):
+    """
+    Shows what a dexy run would do without running it: which docs are not
+    cached and why, estimated times based on recent runs, the longest chain
+    of docs which must run one after another, and how much running docs in
+    parallel could speed up the run. Nothing is changed in the cache.
+    """
+    wrapper = init_wrapper(locals())
+    wrapper.assert_dexy_dirs_exist()
+
+    try:
+        wrapper.to_valid()
+        wrapper.to_walked()
+        wrapper.load_cache_info()
+        wrapper.check_cache()
+        plan = dexy.plan.Plan(wrapper, int(n))
+    except dexy.exceptions.UserFeedback as e:
+        handle_user_feedback_exception(wrapper, e)
+        return
+
+    print_uncached_docs(plan)
+    print ''
+    print_critical_path(plan)
+    print ''
+    print_speedups(plan, int(jobs))
+
+def format_estimate(seconds, source):
+    if source == 'unknown':
+        return "%s+" % format_seconds(seconds)
+    return format_seconds(seconds)
+
+def print_uncached_docs(plan):
+    docs = plan.uncached_docs()
+    print "%s of %s docs will run:" % (len(docs),
+            len([n for n in plan.depends_on if isinstance(n, Doc)]))
+    for doc in docs:
+        seconds, source = plan.estimates[doc]
+        print "  %9s  %s" % (format_estimate(seconds, source), doc.key)
+        for reason in doc.uncached_reasons:
+            print "             %s" % reason
+
+    if any(plan.estimates[doc][1] == 'unknown' for doc in docs):
+        print "  (+ some filters have not run before, so times are underestimated)"
+
+def print_critical_path(plan):
+    path = [node for node in plan.critical_path if plan.seconds(node)]
+    print "critical path, %s:" % format_seconds(plan.critical_path_seconds)
+    if not path:
+        print "  none"
+    for node in path:
+        print "  %9s  %s" % (format_seconds(plan.seconds(node)), node.key)
+
+def print_speedups(plan, jobs):
+    print "estimated total time %s" % format_seconds(plan.total_seconds())
+    if not plan.total_seconds():
+        return
+
+    print "  %7s %12s %12s" % ("workers", "least time", "max speedup")
+    for workers in sorted(set([1, 2, 4, 8, 16, jobs])):
+        print "  %7s %12s %11.1fx" % (workers, format_seconds(plan.min_seconds(workers)),
+                plan.speedup(workers))
@@ -0,0 +1,161 @@
+from dexy.commands.cache import format_size
+from dexy.commands.utils import init_wrapper
+from dexy.utils import defaults
+from dexy.utils import median
+import time
+
+def stats_command(
+        __cli_options=False,
+        artifactsdir=defaults['artifacts_dir'], # location of directory in which to store artifacts
+        limit=10, # number of filters and docs to list in each table
+        minelapsed=0.1, # docs taking less than this many seconds are not reported as regressions
+        n=10, # number of recent runs to report on
+        threshold=20 # percent by which a doc's time in the last run must exceed its median time in earlier runs to be reported as a regression
+        ):
+    """
+    Reports on timings and cache use over recent dexy runs: how long each
+    run took, the slowest filters over these runs, the slowest docs and
+    their times in each run, and docs which have become slower.
+    """
+    wrapper = init_wrapper(locals())
+    wrapper.assert_dexy_dirs_exist()
+    db = wrapper.batch_db()
+
+    runs = db.recent_runs(int(n))
+    if not runs:
+        print "no runs recorded yet, run dexy first"
+        return
+
+    run_ids = [run[0] for run in runs]
+    doc_rows = db.doc_runs(run_ids)
+    filter_rows = db.filter_runs(run_ids)
+    last_run_id = run_ids[-1]
+    limit = int(limit)
+
+    print_runs(runs, doc_rows, filter_rows)
+    print ''
+    print_slowest_filters(filter_rows, len(runs), limit)
+    print ''
+    times = doc_times(doc_rows)
+    print_doc_trends(times, run_ids, limit)
+    print ''
+    print_regressions(regressions(times, last_run_id, float(threshold), float(minelapsed)),
+            threshold, limit)
+
+def format_time(t):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(t))
+
+def format_seconds(seconds):
+    if seconds is None:
+        return '-'
+    return "%.2fs" % seconds
+
+def ratio(part, total):
+    if not total:
+        return '-'
+    return "%d%%" % (100.0 * part / total)
+
+def print_runs(runs, doc_rows, filter_rows):
+    """
+    Prints a line for each run with its time taken and cache hit ratios.
+    A doc is a cache hit if it did not need to run, a filter is a cache
+    hit if its output was restored from the content-addressed store.
+    """
+    # run id : [docs, cached docs, filters which ran, restored filters]
+    counts = dict((run[0], [0, 0, 0, 0]) for run in runs)
+    for row in doc_rows:
+        counts[row[0]][0] += 1
+        if row[2] == 'consolidated':
+            counts[row[0]][1] += 1
+    for row in filter_rows:
+        if row[4] is not None:
+            counts[row[0]][2] += 1
+            if row[5]:
+                counts[row[0]][3] += 1
+
+    print "%-6s %-16s %-6s %4s %9s %10s %12s %10s" % (
+            "run", "started", "state", "jobs", "elapsed", "docs", "docs cached", "restored")
+    for run_id, start_time, end_time, state, jobs in runs:
+        n_docs, n_cached, n_filters, n_restored = counts[run_id]
+        print "%-6s %-16s %-6s %4s %9s %10s %12s %10s" % (
+                run_id, format_time(start_time), state, jobs,
+                format_seconds(end_time - start_time), n_docs,
+                ratio(n_cached, n_docs), ratio(n_restored, n_filters))
+
+def print_slowest_filters(filter_rows, n_runs, limit):
+    """
+    Prints the filters which took the most time in total over the runs.
+    """
+    totals = {}
+    for run_id, doc_key, position, alias, elapsed, restored, exit_code, bytes_in, bytes_out in filter_rows:
+        if elapsed is None:
+            continue
+        total = totals.setdefault(alias, [0, 0.0, 0, 0, 0])
+        total[0] += 1
+        total[1] += elapsed
+        total[2] += bytes_in or 0
+        total[3] += bytes_out or 0
+        if exit_code:
+            total[4] += 1
+
+    print "slowest filters over last %s runs:" % n_runs
+    print "  %-20s %6s %10s %10s %12s %12s %8s" % ("filter", "runs", "total",
+            "average", "bytes in", "bytes out", "nonzero exit")
+    for alias, (count, elapsed, bytes_in, bytes_out, n_nonzero) in sorted(totals.iteritems(),
+            key=lambda item: -item[1][1])[0:limit]:
+        print "  %-20s %6s %10s %10s %12s %12s %8s" % (alias, count,
+                format_seconds(elapsed), format_seconds(elapsed / count),
+                format_size(bytes_in), format_size(bytes_out), n_nonzero)
+
+def doc_times(doc_rows):
+    """
+    Returns a dict of doc keys to dicts of run ids to elapsed seconds, for
+    runs in which the doc ran.
+    """
+    times = {}
+    for run_id, doc_key, state, elapsed, bytes_in, bytes_out in doc_rows:
+        if elapsed is not None:
+            times.setdefault(doc_key, {})[run_id] = elapsed
+    return times
+
+def print_doc_trends(times, run_ids, limit):
+    """
+    Prints time taken in each run for the docs which took longest in their
+    most recent run.
+    """
+    def latest(doc_key):
+        return times[doc_key][max(times[doc_key])]
+
+    slowest = sorted(times, key=latest, reverse=True)[0:limit]
+
+    print "slowest docs, seconds per run (- if cached):"
+    print "  %s" % " ".join("%6s" % run_id for run_id in run_ids)
+    for doc_key in slowest:
+        print "  %s  %s" % (" ".join("%6s" % ("%.2f" % times[doc_key][run_id]
+            if run_id in times[doc_key] else '-') for run_id in run_ids), doc_key)
+
+def regressions(times, run_id, threshold, min_elapsed):
+    """
+    Returns a list of (doc key, median seconds in earlier runs, seconds in
+    run) for docs which ran in run_id and took more than threshold percent
+    longer than the median of earlier runs in which they ran, slowest first.
+    """
+    found = []
+    for doc_key, doc_times in times.iteritems():
+        if not run_id in doc_times or doc_times[run_id] < min_elapsed:
+            continue
+        earlier = [elapsed for other_run_id, elapsed in doc_times.iteritems()
+                if other_run_id < run_id]
+        if not earlier:
+            continue
+        typical = median(earlier)
+        if doc_times[run_id] > typical * (1 + threshold / 100.0):
+            found.append((doc_key, typical, doc_times[run_id]))
+    return sorted(found, key=lambda r: r[2] - r[1], reverse=True)
+
+def print_regressions(found, threshold, limit):
+    print "docs more than %s%% slower in last run than in earlier runs:" % threshold
+    if not found:
+        print "  none"
+    for doc_key, typical, elapsed in found[0:limit]:
+        print "  %-40s %8s -> %8s" % (doc_key, format_seconds(typical), format_seconds(elapsed))
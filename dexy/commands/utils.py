@@ -16,6 +16,7 @@ class NullHandler(logging.Handler):
 
 RENAME_PARAMS = {
         'artifactsdir' : 'artifacts_dir',
+        'cachemaxsize' : 'cache_max_size',
         'conf' : 'config_file',
         'dbalias' : 'db_alias',
         'dbfile' : 'db_file',
@@ -28,7 +29,9 @@ RENAME_PARAMS = {
         'loglevel' : 'log_level',
         'logdir' : 'log_dir',
         'nocache' : 'dont_use_cache',
-        'outputroot' : 'output_root'
+        'outputroot' : 'output_root',
+        'profilefilters' : 'profile_filters',
+        'remotecache' : 'remote_cache'
         }
 
 def default_config():
@@ -0,0 +1,146 @@
+from dexy.commands.it import handle_user_feedback_exception
+from dexy.commands.utils import init_wrapper
+from dexy.node import PatternNode
+from dexy.utils import defaults
+import dexy.exceptions
+import dexy.filemap
+import dexy.watcher
+import fnmatch
+import os
+import posixpath
+import time
+
+def watch_command(
+        __cli_options=False,
+        artifactsdir=defaults['artifacts_dir'], # location of directory in which to store artifacts
+        cachemaxsize=defaults['cache_max_size'], # Size limit for stored filter output, e.g. 500M or 2G. Least recently used output is removed after each run.
+        conf=defaults['config_file'], # name to use for configuration file
+        configs=defaults['configs'], # list of doc config files to parse
+        debug=defaults['debug'], # Prints stack traces, other debug stuff.
+        exclude=defaults['exclude'], # comma-separated list of directory names to exclude from dexy processing
+        excludealso=defaults['exclude_also'], # comma-separated list of directory names to exclude from dexy processing
+        full=defaults['full'], # Whether to do a full run including tasks marked default: False
+        globals=defaults['globals'], # global values to make available within dexy documents, should be KEY=VALUE pairs separated by spaces
+        include=defaults['include'], # Locations to include which would normally be excluded.
+        jobs=defaults['jobs'], # Number of documents to run in parallel.
+        logfile=defaults['log_file'], # name of log file
+        loglevel=defaults['log_level'], # log level, valid options are DEBUG, INFO, WARN
+        nocache=defaults['dont_use_cache'], # whether to force dexy not to use files from the cache
+        noreports=False, # if true, don't run any reports
+        outputroot=defaults['output_root'], # Subdirectory to use as root for output
+        plugins=defaults['plugins'], # additional python packages containing dexy plugins
+        poll=False, # Check for changes by polling rather than using inotify.
+        recurse=defaults['recurse'], # whether to include doc config files in subdirectories
+        remotecache=defaults['remote_cache'], # Directory or http:// URL of a cache of filter output shared with other machines or worktrees.
+        reports=defaults['reports'], # reports to be run after dexy runs, enclose in quotes and separate with spaces
+        target=defaults['target'], # Which target to run. By default all targets are run, this allows you to run only 1 bundle (and its dependencies).
+        ):
+    """
+    Runs dexy, then keeps watching the project for changes.
+
+    When a document's file changes, that document and everything which
+    depends on it are run again in the same process, then reports are run.
+    Adding or removing documents, or changing config files, causes a fresh
+    run of the whole project.
+    """
+    modargs = locals()
+    wrapper = full_run(modargs)
+    watcher = dexy.watcher.create_watcher(wrapper, poll)
+
+    print "watching for changes, press Ctrl+C to stop"
+    try:
+        while True:
+            changes = watcher.wait()
+            if not changes:
+                continue
+
+            changed_filepaths = files_to_rerun(wrapper, changes)
+            if changed_filepaths is None:
+                wrapper = full_run(modargs)
+            elif changed_filepaths:
+                wrapper = incremental_run(wrapper, changed_filepaths, noreports)
+
+    except KeyboardInterrupt:
+        print "stopped watching"
+
+    finally:
+        watcher.close()
+
+def full_run(modargs):
+    wrapper = init_wrapper(modargs)
+    wrapper.assert_dexy_dirs_exist()
+
+    try:
+        start = time.time()
+        wrapper.run_from_new()
+        elapsed = time.time() - start
+        print "dexy run finished in %0.3f%s" % (elapsed, wrapper.state_message())
+    except dexy.exceptions.UserFeedback as e:
+        handle_user_feedback_exception(wrapper, e)
+    else:
+        if not modargs['noreports'] and wrapper.state == 'ran':
+            wrapper.report()
+
+    return wrapper
+
+def incremental_run(wrapper, changed_filepaths, noreports):
+    print "changed: %s" % ", ".join(sorted(changed_filepaths))
+
+    try:
+        start = time.time()
+        affected = wrapper.rerun(changed_filepaths)
+        elapsed = time.time() - start
+        msg = "dexy ran %s nodes in %0.3f%s"
+        print msg % (len(affected), elapsed, wrapper.state_message())
+    except dexy.exceptions.UserFeedback as e:
+        handle_user_feedback_exception(wrapper, e)
+    else:
+        if not noreports and wrapper.state == 'ran':
+            wrapper.report()
+
+    return wrapper
+
+def files_to_rerun(wrapper, changes):
+    """
+    Returns the set of changed files whose docs need to be run again, or None
+    if the changes need a full run because config files have changed, docs
+    have been added or removed, or the previous run did not succeed.
+    """
+    if wrapper.state != 'ran' or dexy.watcher.EVERYTHING in changes:
+        return None
+
+    config_names = set(wrapper.parsers.split())
+    config_names.add(posixpath.basename(wrapper.config_file))
+
+    patterns = [node.key.split("|")[0]
+            for node in wrapper.nodes.values()
+            if isinstance(node, PatternNode)]
+    doc_names = set(doc.name for doc in wrapper.documents())
+
+    changed_filepaths = set()
+    for filepath in changes:
+        if posixpath.basename(filepath) in config_names:
+            return None
+
+        exists = os.path.isfile(filepath)
+        known = filepath in wrapper.filemap
+
+        if exists and known:
+            if filepath in doc_names:
+                changed_filepaths.add(filepath)
+
+        elif exists or known:
+            # file has been added or removed
+            if filepath in doc_names:
+                return None
+            if any(fnmatch.fnmatch(filepath, p) for p in patterns):
+                return None
+
+            if exists:
+                ospath = os.path.normpath(filepath)
+                dirname = os.path.dirname(ospath) or '.'
+                wrapper.filemap[filepath] = dexy.filemap.FileInfo(ospath, dirname, wrapper.fileio)
+            else:
+                del wrapper.filemap[filepath]
+
+    return changed_filepaths
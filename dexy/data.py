@@ -6,7 +6,6 @@ import dexy.wrapper
 import inflection
 import os
 import posixpath
-import shutil
 import urllib
 
 class Data(dexy.plugin.Plugin):
@@ -138,7 +137,9 @@ class Data(dexy.plugin.Plugin):
             self.wrapper.log.warn(unicode(e))
 
     def copy_from_file(self, filename):
-        shutil.copyfile(filename, self.storage.data_file())
+        self.storage.ensure_storage_dir()
+        dexy.utils.break_hardlink(self.storage.data_file())
+        self.wrapper.fileio.copyfile(filename, self.storage.data_file())
 
     def output_to_file(self, filepath):
         """
@@ -381,8 +382,7 @@ class Generic(Data):
         elif self._data and not isinstance(self._data, basestring):
             raise Exception(self._data.__class__.__name__)
         else:
-            with open(self.storage.data_file(), "r") as f:
-                return dexy.utils.parse_json_from_file(f)
+            return dexy.utils.parse_json(self.wrapper.fileio.read(self.storage.data_file()))
 
     def from_yaml(self):
         """
@@ -394,8 +394,7 @@ class Generic(Data):
         elif self._data and not isinstance(self._data, basestring):
             raise Exception(self._data.__class__.__name__)
         else:
-            with open(self.storage.data_file(), "r") as f:
-                return dexy.utils.parse_yaml(f.read())
+            return dexy.utils.parse_yaml(self.wrapper.fileio.read(self.storage.data_file()))
 
     def json_as_dict(self):
         """
@@ -483,8 +482,7 @@ class Sectioned(Data):
         """
         Write canonical (not structured) output to a file.
         """
-        with open(filepath, "wb") as f:
-            f.write(unicode(self).encode("utf-8"))
+        self.wrapper.fileio.write(filepath, unicode(self).encode("utf-8"))
 
     def keyindex(self, key):
         if self._data == [{}]:
@@ -1,3 +0,0 @@
-import dexy.datas.soup
-import dexy.datas.h5
-import dexy.datas.et
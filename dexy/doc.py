@@ -2,8 +2,6 @@ import dexy.exceptions
 import dexy.filter
 import dexy.node
 import os
-import shutil
-import stat
 import time
 
 class Doc(dexy.node.Node):
@@ -159,16 +157,6 @@ class Doc(dexy.node.Node):
 
         if self.state == 'cached':
             self.setup_datas()
-
-            # move cache files to new cache
-            for d in self.datas():
-                if os.path.exists(d.storage.last_data_file()):
-                    shutil.move(d.storage.last_data_file(), d.storage.this_data_file())
-                    self.log_debug("Moving %s from %s to %s" % (d.key, d.storage.last_data_file(), d.storage.this_data_file()))
-
-            if os.path.exists(self.runtime_info_filename(False)):
-                shutil.move(self.runtime_info_filename(False), self.runtime_info_filename(True))
-
             self.apply_runtime_info()
 
             for d in self.datas():
@@ -176,6 +164,53 @@ class Doc(dexy.node.Node):
                     d.storage.connect()
             self.transition('consolidated')
 
+        elif self.state == 'uncached':
+            self.remove_stale_cache_files()
+
+    def reset(self):
+        """
+        Discards results of the previous run of this doc so it can be run
+        again within the same batch.
+        """
+        for doc in self.additional_docs:
+            self.children.remove(doc)
+            self.wrapper.remove_node(doc)
+        if self.additional_docs:
+            self.wrapper.input_index.clear()
+        self.additional_docs = []
+        self.runtime_args = {}
+
+        self.remove_stale_cache_files()
+
+        self.initialize_settings(**self.args)
+        self.setup()
+        self.setup_datas()
+        self.doc_changed = self.check_doc_changed()
+
+        self.transition('uncached')
+        self.wrapper.batch.add_doc(self)
+
+    def cache_files(self):
+        """
+        Returns paths of all files in the cache which belong to this doc.
+        """
+        filepaths = [d.storage.this_data_file() for d in self.datas()]
+        filepaths.append(self.runtime_info_filename())
+        return [f for f in filepaths if self.wrapper.fileio.exists(f)]
+
+    def remove_stale_cache_files(self):
+        """
+        Remove files left in the cache by a previous run of this doc (and any
+        additional docs it created) so it starts from a clean slate.
+        """
+        stale = set(self.wrapper.cache_manifest.files_owned_by(self.key_with_class()))
+        stale.update(self.cache_files())
+        for filepath in stale:
+            if self.wrapper.fileio.exists(filepath):
+                self.log_debug("Removing stale cache file %s" % filepath)
+                os.remove(filepath)
+        self.wrapper.cache_manifest.discard(stale)
+
     def apply_runtime_info(self):
             runtime_info = self.load_runtime_info()
             if runtime_info:
@@ -200,6 +235,9 @@ class Doc(dexy.node.Node):
         for f in self.filters:
             f.update_settings(new_settings)
 
+    def changes_working_dir(self):
+        return any(f.changes_working_dir() for f in self.filters)
+
     def check_cache_elements_present(self):
         """
         Returns a boolean to indicate whether all files are present in cache.
@@ -210,39 +248,35 @@ class Doc(dexy.node.Node):
                 d.setup()
 
         return all(
-                os.path.exists(d.storage.last_data_file()) or
-                os.path.exists(d.storage.this_data_file())
+                self.wrapper.cache_manifest.is_present(d.storage.this_data_file())
                 for d in self.datas())
 
     def check_doc_changed(self):
+        fingerprints = self.wrapper.fingerprints
+
         if self.name in self.wrapper.filemap:
-            live_stat = self.wrapper.filemap[self.name]['stat']
+            fileinfo = self.wrapper.filemap[self.name]
+            contents_changed = fingerprints.file_changed(self.key_with_class(),
+                    fileinfo.ospath, fileinfo.stat)
 
             self.initial_data.setup()
 
-            in_this_cache = os.path.exists(self.initial_data.storage.this_data_file())
-            in_last_cache = os.path.exists(self.initial_data.storage.last_data_file())
-
-            if in_this_cache or in_last_cache:
-                # we have a file in the cache from a previous run, compare its
-                # mtime to filemap to determine whether it has changed
-                if in_this_cache:
-                    cache_stat = os.stat(self.initial_data.storage.this_data_file())
-                else:
-                    cache_stat = os.stat(self.initial_data.storage.last_data_file())
-
-                cache_mtime = cache_stat[stat.ST_MTIME]
-                live_mtime = live_stat[stat.ST_MTIME]
-                msg = "    cache mtime %s live mtime %s now %s changed (live gt cache) %s"
-                msgargs = (cache_mtime, live_mtime, time.time(), live_mtime > cache_mtime)
-                self.log_debug(msg % msgargs)
-                return live_mtime > cache_mtime
+            in_cache = self.wrapper.cache_manifest.is_present(
+                    self.initial_data.storage.this_data_file())
+
+            if in_cache:
+                # we have a file in the cache from a previous run, compare
+                # digest of live file with digest recorded for that run
+                self.log_debug("    file contents changed %s" % contents_changed)
+                return contents_changed
             else:
                 # there is no file in the cache, therefore it has 'changed'
                 return True
         else:
-            # TODO check hash of contents of virtual files
-            return False
+            contents_changed = fingerprints.contents_changed(self.key_with_class(),
+                    self.get_contents())
+            self.log_debug("    virtual contents changed %s" % contents_changed)
+            return contents_changed
 
     def data_class_alias(self):
         data_class_alias = self.setting('data-type')
@@ -263,9 +297,9 @@ class Doc(dexy.node.Node):
         return contents
 
     # Runtime Info
-    def runtime_info_filename(self, this=True):
+    def runtime_info_filename(self):
         name = "%s.runtimeargs.pickle" % self.hashid
-        return os.path.join(self.initial_data.storage.storage_dir(this), name)
+        return os.path.join(self.initial_data.storage.storage_dir(True), name)
 
     def save_runtime_info(self):
         """
@@ -278,30 +312,19 @@ class Doc(dexy.node.Node):
             'additional-docs' : self.additional_doc_info()
             }
 
-        with open(self.runtime_info_filename(), 'wb') as f:
-            pickle = self.wrapper.pickle_lib()
-            pickle.dump(info, f)
+        self.initial_data.storage.ensure_storage_dir()
+        pickle = self.wrapper.pickle_lib()
+        self.wrapper.fileio.write(self.runtime_info_filename(), pickle.dumps(info))
 
     def load_runtime_info(self):
         info = None
 
-        # Load from 'this' first
         try:
-            with open(self.runtime_info_filename(), 'rb') as f:
-                pickle = self.wrapper.pickle_lib()
-                info = pickle.load(f)
+            pickle = self.wrapper.pickle_lib()
+            info = pickle.loads(self.wrapper.fileio.read(self.runtime_info_filename()))
         except IOError:
             pass
 
-        # Load from 'last' if there's nothing in 'this'
-        if not info:
-            try:
-                with open(self.runtime_info_filename(False), 'rb') as f:
-                    pickle = self.wrapper.pickle_lib()
-                    info = pickle.load(f)
-            except IOError:
-                pass
-
         return info
 
     def run(self):
@@ -327,14 +350,38 @@ class Doc(dexy.node.Node):
             f.start_time = time.time()
             if f.output_data.state == 'new':
                 f.output_data.setup()
+
+            f.output_data.storage.ensure_storage_dir()
+            content_address = f.content_address()
+            restored = f.output_data.storage.restore_from_cas(content_address, f.alias)
+            f.restored = bool(restored)
+
             if hasattr(f.output_data.storage, 'connect'):
                 f.output_data.storage.connect()
-            f.process()
+
+            if restored:
+                f.log_debug("using output from content-addressed store")
+            else:
+                n_additional_docs = len(self.additional_docs)
+                runtime_args = dict(self.runtime_args)
+
+                with self.wrapper.filter_profiler.profile(f):
+                    f.process()
+
+                # Only share output which has no side effects on the doc.
+                if len(self.additional_docs) == n_additional_docs and runtime_args == self.runtime_args:
+                    f.output_data.storage.save_to_cas(content_address, f.alias)
+
             f.finish_time = time.time()
             f.elapsed = f.finish_time - f.start_time
+            self.wrapper.tracer.add_span(f.alias, 'filter', f.start_time,
+                    f.finish_time, doc=self.key, restored=f.restored)
 
         self.finish_time = time.time()
         self.elapsed_time = self.finish_time - self.start_time
+        self.wrapper.tracer.add_span(self.key_with_class(), 'node',
+                self.start_time, self.finish_time,
+                **self.wrapper.fileio.summary('node', self.key_with_class()))
         self.wrapper.batch.add_doc(self)
         self.save_runtime_info()
 
@@ -0,0 +1,241 @@
+from dexy.exceptions import UserFeedback
+from dexy.utils import s
+import bisect
+import dexy.utils
+import fnmatch
+import os
+import posixpath
+import re
+import time
+
+class FileInfo(object):
+    """
+    Information about a file in the project directory. The file is only
+    stat'ed if and when its stat result is needed.
+    """
+    __slots__ = ['ospath', 'dir', '_stat', 'fileio']
+
+    def __init__(self, ospath, dirname, fileio=None):
+        self.ospath = ospath
+        self.dir = dirname
+        self._stat = None
+        self.fileio = fileio
+
+    @property
+    def stat(self):
+        if self._stat is None:
+            if self.fileio:
+                self._stat = self.fileio.stat(self.ospath)
+            else:
+                self._stat = os.stat(self.ospath)
+        return self._stat
+
+    def refresh(self):
+        """
+        Forget stat result, e.g. after the file has been modified.
+        """
+        self._stat = None
+
+    def __getitem__(self, key):
+        # support code written for the dicts which used to be in the filemap
+        return getattr(self, key)
+
+    def __repr__(self):
+        return "FileInfo(%s)" % self.ospath
+
+def prefetch_stats(fileinfos):
+    """
+    Stats files in parallel ahead of their stat results being needed.
+    """
+    def prefetch(fileinfo):
+        try:
+            fileinfo.stat
+        except OSError:
+            # raised again if the stat result is actually used
+            pass
+    dexy.utils.parallel_map(prefetch, fileinfos)
+
+class FileMapIndex(object):
+    """
+    Persistent index of directory listings in the project directory, used to
+    build the filemap without listing directories which have not changed
+    since the last run.
+
+    Each directory maps to its mtime and the names of the files and
+    subdirectories it contained at that mtime. A directory's mtime changes
+    whenever entries are added, removed or renamed, so if it matches the
+    recorded mtime the recorded listing can be used as is. Subdirectories
+    are still visited since their own contents may have changed.
+    """
+    # Listings of directories modified less than this many seconds before
+    # they were read are not reused, in case they changed again within the
+    # resolution of the filesystem's timestamps.
+    min_age = 2
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.saved = {}
+        self.current = {}
+
+    def filename(self):
+        return os.path.join(self.wrapper.artifacts_dir, 'filemap.pickle')
+
+    def load(self):
+        try:
+            with open(self.filename(), 'rb') as f:
+                pickle = self.wrapper.pickle_lib()
+                self.saved = pickle.load(f)
+        except (IOError, EOFError):
+            self.saved = {}
+
+    def save(self):
+        if not os.path.isdir(self.wrapper.artifacts_dir):
+            return
+
+        with open(self.filename(), 'wb') as f:
+            pickle = self.wrapper.pickle_lib()
+            pickle.dump(self.current, f, -1)
+
+    def list_dir(self, dirpath):
+        """
+        Returns lists of file names and subdirectory names in dirpath.
+        """
+        fileio = self.wrapper.fileio
+        mtime = fileio.stat(dirpath).st_mtime
+        saved = self.saved.get(dirpath)
+
+        if saved and saved[0] == mtime:
+            filenames, dirnames = saved[1], saved[2]
+        else:
+            filenames = []
+            dirnames = []
+            for name in fileio.listdir(dirpath):
+                if fileio.isdir(os.path.join(dirpath, name)):
+                    dirnames.append(name)
+                else:
+                    filenames.append(name)
+
+            if time.time() - mtime < self.min_age:
+                mtime = None
+
+        self.current[dirpath] = (mtime, filenames, dirnames)
+        return filenames, dirnames
+
+    def map_files(self, exclude, include):
+        """
+        Returns a dict of posix-style relative file paths to FileInfo objects
+        for files in the project directory.
+        """
+        filemap = {}
+        dirpaths = ['.']
+
+        while dirpaths:
+            dirpath = dirpaths.pop()
+            filenames, dirnames = self.list_dir(dirpath)
+
+            if '.nodexy' in filenames:
+                continue
+            elif 'pip-delete-this-directory.txt' in filenames:
+                msg = s("""pip left an old build/ file lying around,
+                please remove this before running dexy""")
+                raise UserFeedback(msg)
+
+            dirname = os.path.normpath(dirpath)
+            for filename in filenames:
+                ospath = os.path.normpath(os.path.join(dirpath, filename))
+                if os.sep == posixpath.sep:
+                    filepath = ospath
+                else:
+                    filepath = posixpath.normpath(posixpath.join(dirpath, filename))
+                filemap[filepath] = FileInfo(ospath, dirname, self.wrapper.fileio)
+
+            for name in dirnames:
+                if name in exclude and not name in include:
+                    continue
+                dirpaths.append(os.path.join(dirpath, name))
+
+        return filemap
+
+# Characters which have a special meaning in glob patterns.
+GLOB_SPECIAL_CHARS = re.compile(r"[*?\[\]]")
+
+def casefold(path):
+    """
+    Folds case in the same way as fnmatch.fnmatch does on this platform.
+    """
+    return os.path.normcase(path.replace("/", os.sep)).replace(os.sep, "/")
+
+def file_extension(path):
+    """
+    Returns the extension of the file name at the end of path, starting from
+    the last '.', or '' if the file name has no '.'.
+    """
+    filename = path.rsplit("/", 1)[-1]
+    i = filename.rfind(".")
+    if i < 0:
+        return ''
+    return filename[i:]
+
+class GlobIndex(object):
+    """
+    Index of the file paths in a filemap, for finding the files matching a
+    glob pattern without testing each path against each pattern.
+
+    Paths are kept sorted, all together and bucketed by file extension. The
+    paths starting with a pattern's literal prefix, e.g. 'src/' for
+    'src/*.py', are a contiguous range which is found by bisection. If the
+    literal end of the pattern fixes the extension of matching files, like
+    '.py', only that extension's bucket is searched. The paths found are
+    then matched against the pattern's compiled regex.
+
+    Results are remembered by pattern, since pattern nodes with different
+    filters often share a file pattern.
+    """
+    def __init__(self, filemap):
+        self.filemap = filemap
+        self.matches = {}
+
+        # map of case-folded paths to paths in the filemap
+        self.filepaths = dict((casefold(filepath), filepath) for filepath in filemap)
+
+        self.paths = sorted(self.filepaths)
+        self.paths_by_extension = {}
+        for path in self.paths:
+            self.paths_by_extension.setdefault(file_extension(path), []).append(path)
+
+    def candidates(self, pattern):
+        """
+        Returns a list of case-folded paths which may match the case-folded
+        pattern.
+        """
+        special = [m.start() for m in GLOB_SPECIAL_CHARS.finditer(pattern)]
+        if not special:
+            return [pattern] if pattern in self.filepaths else []
+
+        prefix = pattern[:special[0]]
+        suffix = pattern[special[-1]+1:]
+
+        if "/" in suffix or "." in suffix:
+            paths = self.paths_by_extension.get(file_extension(suffix), [])
+        else:
+            paths = self.paths
+
+        candidates = []
+        for i in xrange(bisect.bisect_left(paths, prefix), len(paths)):
+            if not paths[i].startswith(prefix):
+                break
+            candidates.append(paths[i])
+        return candidates
+
+    def match(self, pattern):
+        """
+        Returns a sorted list of paths in the filemap which match pattern,
+        with the same results as fnmatch.fnmatch.
+        """
+        if not pattern in self.matches:
+            folded_pattern = casefold(pattern)
+            regex = re.compile(fnmatch.translate(folded_pattern))
+            self.matches[pattern] = [self.filepaths[path]
+                    for path in self.candidates(folded_pattern)
+                    if regex.match(path)]
+        return self.matches[pattern]
@@ -1,10 +1,12 @@
 from dexy.utils import copy_or_link
 from dexy.utils import os_to_posix
+from dexy.version import DEXY_VERSION
 from operator import attrgetter
 import dexy.doc
 import dexy.exceptions
 import dexy.plugin
 import dexy.utils
+import json
 import os
 import posixpath
 
@@ -41,6 +43,11 @@ class Filter(dexy.plugin.Plugin):
             'additional-doc-settings' : (
                 "Settings to apply to additional documents created as side effects.",
                 {}),
+            'content-addressed' : (
+                """Whether output depends only on the names and contents of
+                inputs and on settings, so it can be reused from the
+                content-addressed store.""",
+                True),
             'examples' : (
                 "Templates which should be used as examples for this filter.",
                 []),
@@ -109,6 +116,11 @@ class Filter(dexy.plugin.Plugin):
     def __init__(self, doc=None):
         self.doc = doc
 
+        # Set when the filter runs, recorded in the run history.
+        self.elapsed = None
+        self.restored = False
+        self.exit_code = None
+
     def filter_commands(self):
         """
         Return dictionary of filter command canonical names and method objects.
@@ -277,6 +289,46 @@ class Filter(dexy.plugin.Plugin):
         """
         pass
 
+    def content_address(self):
+        """
+        Returns a digest of everything which determines this filter's output,
+        which is used as the key in the content-addressed store. Returns None
+        if output should not be reused.
+        """
+        wrapper = self.doc.wrapper
+        if wrapper.dont_use_cache or not self.setting('content-addressed'):
+            return None
+        elif self.is_part_of_script_bundle():
+            return None
+
+        # Filters often put names of the doc and its inputs into their output
+        # (anchors, archive members, lexers chosen by filename), so names are
+        # part of the key along with contents.
+        try:
+            inputs = [(self.input_data.key,
+                wrapper.cas.file_digest(self.input_data.storage.data_file()))]
+            for doc in self.doc.walk_input_docs():
+                filepath = doc.output_data().storage.data_file()
+                inputs.append((doc.key, wrapper.cas.file_digest(filepath)))
+        except IOError:
+            return None
+
+        key_elements = [
+                DEXY_VERSION,
+                self.alias,
+                self.__class__.__name__,
+                self.prev_ext,
+                self.ext,
+                self.doc.key,
+                self.output_data.key,
+                self.output_data.alias,
+                self.doc.sorted_arg_string(),
+                json.dumps(self.setting_values(), sort_keys=True, default=repr),
+                inputs
+                ]
+
+        return dexy.utils.md5_hash(json.dumps(key_elements, default=repr))
+
     def calculate_canonical_name(self):
         name_without_ext = posixpath.splitext(self.doc.name)[0]
         return "%s%s" % (name_without_ext, self.ext)
@@ -565,6 +617,15 @@ class Filter(dexy.plugin.Plugin):
         else:
             return doc in conflict_docs and conflict_docs.index(doc) == 0
 
+    def changes_working_dir(self):
+        """
+        Returns a boolean indicating whether this filter changes the current
+        working directory while it runs. The working directory is shared by
+        all threads, so docs with such filters are run on their own when
+        running docs in parallel.
+        """
+        return False
+
     def is_part_of_script_bundle(self):
         if hasattr(self.doc, 'parent'):
             return hasattr(self.doc.parent, 'script_storage')
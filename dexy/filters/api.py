@@ -29,6 +29,8 @@ class ApiFilter(dexy.filter.DexyFilter):
     aliases = ['apis']
 
     _settings = {
+            'content-addressed' : False,
+
             # Files to hold collections of API keys
             'master-api-key-file' : ("Master API key file for user.", "~/.dexyapis"),
             'project-api-key-file' : ("API key file for project.", ".dexyapis"),
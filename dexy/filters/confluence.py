@@ -13,6 +13,7 @@ class ConfluenceRESTAPI(DexyFilter):
 
     _settings = {
             'publish' : False,
+            'content-addressed' : False,
             'input-extensions' : ['.html'],
             'output-extensions' : ['.json', '.html'],
             'url-base' : ("Root of URL.", None),
@@ -65,6 +65,7 @@ class GitBase(DexyFilter):
     """
     aliases = []
     _settings = {
+            'content-addressed' : False,
             'reference' : ("The reference to use.", None),
             'revision' : ("The revision to use, see 'man gitrevisions'.", None),
             'url-prefixes' : ("""Tuple of strings which mean the specified repo
@@ -4,6 +4,7 @@ from dexy.exceptions import InactivePlugin
 from dexy.filters.process import SubprocessFilter
 import re
 import os
+import time
 
 try:
     import pexpect
@@ -137,6 +138,7 @@ class PexpectReplFilter(SubprocessFilter):
         self.log_debug("about to spawn new process '%s' in '%s'" % (executable, wd))
 
         # Spawn the process
+        spawn_time = time.time()
         try:
             proc = pexpect.spawn(
                     executable,
@@ -227,6 +229,9 @@ class PexpectReplFilter(SubprocessFilter):
             msgargs = (proc.pid, self.key)
             raise UserFeedback(msg % msgargs)
 
+        self.doc.wrapper.tracer.add_span(executable, 'subprocess', spawn_time,
+                time.time(), command=executable, doc=self.key)
+
         if proc.exitstatus and self.setting('check-return-code'):
             self.handle_subprocess_proc_return(self.setting('executable'), proc.exitstatus, section_transcript)
 
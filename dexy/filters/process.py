@@ -31,6 +31,14 @@ class SubprocessFilter(Filter):
             'write-stderr-to-stdout' : ("Should stderr be piped to stdout?", True),
             }
 
+    def trace_subprocess(self, command):
+        """
+        Returns a context manager which records a span in the trace for
+        running command.
+        """
+        name = self.setting('executable') or command.split()[0]
+        return self.doc.wrapper.tracer.span(name, 'subprocess', command=command, doc=self.key)
+
     def version_command(klass):
         if platform.system() == 'Windows':
             return klass.setting('windows-version-command') or klass.setting('version-command')
@@ -88,6 +96,7 @@ class SubprocessFilter(Filter):
 
     def handle_subprocess_proc_return(self, command, exitcode, stderr, compiled=False):
         self.log_debug("exit code is '%s'" % exitcode)
+        self.exit_code = exitcode
         if exitcode is None:
             raise dexy.exceptions.InternalDexyProblem("no return code, proc not finished!")
         elif exitcode == 127 and not compiled:
@@ -149,7 +158,7 @@ class SubprocessFilter(Filter):
             raise dexy.exceptions.UserFeedback("exclude-add-new-files should be a list, not a string")
 
         new_files_added = 0
-        for dirpath, subdirs, filenames in os.walk(wd):
+        for dirpath, subdirs, filenames in self.doc.wrapper.fileio.walk(wd):
             # Prune subdirs which match exclude.
             subdirs[:] = [d for d in subdirs if d not in skip_dirs]
 
@@ -209,8 +218,7 @@ class SubprocessFilter(Filter):
                     raise Exception("Should not get here unless is_valid_file_extension")
 
                 self.log_debug("Adding %s" % filepath)
-                with open(filepath, 'rb') as f:
-                    contents = f.read()
+                contents = self.doc.wrapper.fileio.read(filepath)
                 self.add_doc(relpath, contents)
                 new_files_added += 1
 
@@ -243,17 +251,18 @@ class SubprocessFilter(Filter):
             wd = os.getcwd()
 
         self.log_debug("about to run '%s' in '%s'" % (command, os.path.abspath(wd)))
-        proc = subprocess.Popen(command, shell=True,
-                                    cwd=wd,
-                                    stdin=stdin,
-                                    stdout=stdout,
-                                    stderr=stderr,
-                                    env=env)
-
-        if input_text:
-            self.log_debug("about to send input_text '%s'" % input_text)
-
-        stdout, stderr = proc.communicate(input_text)
+        with self.trace_subprocess(command):
+            proc = subprocess.Popen(command, shell=True,
+                                        cwd=wd,
+                                        stdin=stdin,
+                                        stdout=stdout,
+                                        stderr=stderr,
+                                        env=env)
+
+            if input_text:
+                self.log_debug("about to send input_text '%s'" % input_text)
+
+            stdout, stderr = proc.communicate(input_text)
         self.log_debug(u"stdout is '%s'" % stdout.decode('utf-8'))
 
         if stderr:
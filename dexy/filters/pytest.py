@@ -46,6 +46,9 @@ class PythonTest(PythonIntrospection):
     def is_active(self):
         return AVAILABLE
 
+    def changes_working_dir(self):
+        return bool(self.setting('chdir'))
+
     def load_tests_from_dir(self, module_name):
         self.log_debug("Loading module '%s' to find its tests." % module_name)
         mod = self.load_module(module_name)
@@ -1,11 +1,12 @@
 from bs4 import BeautifulSoup
 from dexy.filter import DexyFilter
-from dexy.utils import chdir
 import base64
 import inflection
 import mimetypes
+import os
 import re
 import urllib
+import urlparse
 
 class Customize(DexyFilter):
     """
@@ -40,16 +41,28 @@ class InlineAssets(DexyFilter):
     aliases = ['inliner']
 
     _settings = {
+            'content-addressed' : False,
             'html-parser' : ("Name of html parser BeautifulSoup should use.", 'html.parser'),
             'inline-images' : ("Whether to inline images using the data uri scheme.", True),
             'inline-styles' : ("Whether to embed referenced CSS in the page header.", True)
             }
 
+    def asset_location(self, path):
+        """
+        Returns the location to read an asset from. Relative paths are files
+        in the workspace. This doesn't change into the workspace, as the
+        working directory is shared with docs running on other threads.
+        """
+        if urlparse.urlparse(path).scheme:
+            return path
+        else:
+            return os.path.join(os.path.abspath(self.parent_work_dir()), path)
+
     def inline_images(self, soup):
         for tag in soup.find_all("img"):
             path = tag.get('src')
 
-            f = urllib.urlopen(path)
+            f = urllib.urlopen(self.asset_location(path))
             data = f.read()
             f.close()
 
@@ -62,7 +75,7 @@ class InlineAssets(DexyFilter):
         for tag in soup.find_all("link"):
             path = tag.get('href')
 
-            f = urllib.urlopen(path)
+            f = urllib.urlopen(self.asset_location(path))
             data = f.read()
             f.close()
 
@@ -75,13 +88,12 @@ class InlineAssets(DexyFilter):
         soup = BeautifulSoup(unicode(self.input_data), self.setting('html-parser'))
         self.populate_workspace()
 
-        with chdir(self.parent_work_dir()):
-            if self.setting('inline-images'):
-                self.inline_images(soup)
-    
-            if self.setting('inline-styles'):
-                self.inline_styles(soup)
-    
+        if self.setting('inline-images'):
+            self.inline_images(soup)
+
+        if self.setting('inline-styles'):
+            self.inline_styles(soup)
+
         self.output_data.set_data(unicode(soup))
 
 class SoupSections(DexyFilter):
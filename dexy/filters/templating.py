@@ -43,6 +43,7 @@ class TemplateFilter(DexyFilter):
 
     _settings = {
             'output' : True,
+            'content-addressed' : False,
             'variables' : ("Variables to be made available to document.", {}),
             'vars' : ("Variables to be made available to document.", {}),
             'plugins' : ("List of plugins for run_plugins to use.", []),
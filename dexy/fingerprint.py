@@ -0,0 +1,97 @@
+from dexy.utils import file_digest
+import hashlib
+import json
+import os
+
+class Fingerprints(object):
+    """
+    Records content digests of documents so that changes can be detected by
+    comparing contents rather than modification times.
+
+    Each doc key maps to a (stat tuple, digest) pair. For documents backed by
+    a file the stat tuple is (size, mtime, inode), and the file is only
+    rehashed when the live stat tuple differs from the recorded one. Virtual
+    documents have a stat tuple of None and are hashed from their contents.
+    """
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.saved = {}
+        self.current = {}
+        self.file_digests = {}
+
+    def filename(self):
+        return os.path.join(self.wrapper.artifacts_dir, 'fingerprints.pickle')
+
+    def load(self):
+        """
+        Load fingerprints recorded at the end of the last successful run.
+        """
+        try:
+            with open(self.filename(), 'rb') as f:
+                pickle = self.wrapper.pickle_lib()
+                self.saved = pickle.load(f)
+        except IOError:
+            self.saved = {}
+
+    def save(self, doc_keys):
+        """
+        Save fingerprints for the docs in doc_keys, which should be the docs
+        whose cached artifacts are up to date as of this run. Entries for other
+        docs are carried over unchanged from the previous run.
+        """
+        fingerprints = dict(self.saved)
+        for doc_key in doc_keys:
+            if doc_key in self.current:
+                fingerprints[doc_key] = self.current[doc_key]
+
+        with open(self.filename(), 'wb') as f:
+            pickle = self.wrapper.pickle_lib()
+            pickle.dump(fingerprints, f)
+
+        self.saved = fingerprints
+
+    def stat_tuple(self, stat):
+        return (stat.st_size, stat.st_mtime, stat.st_ino)
+
+    def file_digest(self, filepath):
+        """
+        Returns digest of file contents, each file is only hashed once per run.
+        """
+        if not filepath in self.file_digests:
+            self.file_digests[filepath] = file_digest(filepath)
+        return self.file_digests[filepath]
+
+    def contents_digest(self, contents):
+        if isinstance(contents, unicode):
+            contents = contents.encode('utf-8')
+        elif not isinstance(contents, str):
+            contents = json.dumps(contents, sort_keys=True, default=repr)
+        return hashlib.md5(contents).hexdigest()
+
+    def changed(self, doc_key, fingerprint):
+        self.current[doc_key] = fingerprint
+        saved = self.saved.get(doc_key)
+        return (not saved) or saved[1] != fingerprint[1]
+
+    def file_changed(self, doc_key, filepath, live_stat):
+        """
+        Returns a boolean indicating whether the contents of filepath differ
+        from the contents recorded for doc_key. Uses the recorded digest
+        without reading the file if the stat tuple has not changed.
+        """
+        stat_tuple = self.stat_tuple(live_stat)
+        saved = self.saved.get(doc_key)
+
+        if saved and saved[0] == stat_tuple:
+            digest = saved[1]
+        else:
+            digest = self.file_digest(filepath)
+
+        return self.changed(doc_key, (stat_tuple, digest))
+
+    def contents_changed(self, doc_key, contents):
+        """
+        Returns a boolean indicating whether the contents of a virtual
+        document differ from the contents recorded for doc_key.
+        """
+        return self.changed(doc_key, (None, self.contents_digest(contents)))
@@ -0,0 +1,216 @@
+"""
+Accounting of the file I/O dexy does itself, as opposed to I/O done by
+programs which filters run.
+
+Storage, workspace population, file mapping and copying go through the
+wrapper's fileio object rather than calling os, shutil and open directly.
+Normally this is a FileIO which just does the I/O. When the iostats option
+is set it is an IOStats, which also counts calls, bytes read or written and
+time taken for each kind of operation, per phase of the run and per node.
+
+Phases are set by the wrapper as it moves through setup, walk, check, run
+and report. The current node is tracked for each thread, so nodes which
+run on worker threads are each accounted for separately. I/O done while a
+node is running is counted against both the node and the phase.
+"""
+from contextlib import contextmanager
+import os
+import shutil
+import threading
+import time
+
+OPERATIONS = ('stat', 'listdir', 'walk', 'read', 'write', 'copy', 'link')
+
+class FileIO(object):
+    """
+    Does file I/O without accounting for it.
+    """
+    enabled = False
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+    @contextmanager
+    def node(self, node):
+        yield
+
+    def summary(self, scope, name):
+        return {}
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def getsize(self, path):
+        return os.path.getsize(path)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def walk(self, top):
+        return os.walk(top)
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def write(self, path, data):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def copyfile(self, src, dst):
+        shutil.copyfile(src, dst)
+
+    def link(self, src, dst):
+        os.link(src, dst)
+
+class IOStats(FileIO):
+    """
+    Does file I/O and counts calls, bytes and seconds for each operation.
+    exists, isdir and getsize are counted as stat calls.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.current_phase = None
+        # (scope, name) : { operation : [calls, bytes, seconds] }
+        # where scope is 'phase' or 'node'
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        previous = self.current_phase
+        self.current_phase = name
+        try:
+            yield
+        finally:
+            self.current_phase = previous
+
+    @contextmanager
+    def node(self, node):
+        previous = getattr(self.local, 'node', None)
+        self.local.node = node.key_with_class()
+        try:
+            yield
+        finally:
+            self.local.node = previous
+
+    def record(self, operation, nbytes, seconds):
+        scopes = [('phase', self.current_phase)]
+        node = getattr(self.local, 'node', None)
+        if node:
+            scopes.append(('node', node))
+
+        with self.lock:
+            for scope in scopes:
+                counts = self.counts.setdefault(scope, {})
+                total = counts.setdefault(operation, [0, 0, 0.0])
+                total[0] += 1
+                total[1] += nbytes
+                total[2] += seconds
+
+    def timed(self, operation, fn, *args):
+        start = time.time()
+        try:
+            return fn(*args)
+        finally:
+            self.record(operation, 0, time.time() - start)
+
+    def exists(self, path):
+        return self.timed('stat', os.path.exists, path)
+
+    def isdir(self, path):
+        return self.timed('stat', os.path.isdir, path)
+
+    def stat(self, path):
+        return self.timed('stat', os.stat, path)
+
+    def getsize(self, path):
+        return self.timed('stat', os.path.getsize, path)
+
+    def listdir(self, path):
+        return self.timed('listdir', os.listdir, path)
+
+    def walk(self, top):
+        """
+        Like os.walk, counting each directory listed as a walk call. Lists
+        of subdirectories can still be pruned by the caller.
+        """
+        walker = os.walk(top)
+        while True:
+            start = time.time()
+            try:
+                entry = next(walker)
+            except StopIteration:
+                return
+            self.record('walk', 0, time.time() - start)
+            yield entry
+
+    def read(self, path):
+        start = time.time()
+        data = FileIO.read(self, path)
+        self.record('read', len(data), time.time() - start)
+        return data
+
+    def write(self, path, data):
+        start = time.time()
+        FileIO.write(self, path, data)
+        self.record('write', len(data), time.time() - start)
+
+    def copyfile(self, src, dst):
+        start = time.time()
+        shutil.copyfile(src, dst)
+        self.record('copy', os.path.getsize(dst), time.time() - start)
+
+    def link(self, src, dst):
+        self.timed('link', os.link, src, dst)
+
+    def totals(self, scope, name):
+        """
+        Returns a dict of operation to [calls, bytes, seconds] for the
+        phase or node name.
+        """
+        with self.lock:
+            return dict((op, list(total))
+                    for op, total in self.counts.get((scope, name), {}).iteritems())
+
+    def names(self, scope):
+        with self.lock:
+            return [name for s, name in self.counts if s == scope]
+
+    def seconds(self, scope, name):
+        return sum(total[2] for total in self.totals(scope, name).itervalues())
+
+    def summary(self, scope, name):
+        """
+        Returns a flat dict of counts for the phase or node, for recording
+        as args of trace events.
+        """
+        summary = {}
+        for op, (calls, nbytes, seconds) in sorted(self.totals(scope, name).iteritems()):
+            summary["io_%s_calls" % op] = calls
+            if nbytes:
+                summary["io_%s_bytes" % op] = nbytes
+            summary["io_%s_ms" % op] = round(seconds * 1000, 3)
+        return summary
+
+    def nodes_by_seconds(self):
+        """
+        Returns keys of nodes which did I/O, those which spent longest on
+        it first.
+        """
+        return sorted(self.names('node'), key=lambda name: -self.seconds('node', name))
+
+def create_file_io(wrapper):
+    if wrapper.iostats:
+        return IOStats()
+    else:
+        return FileIO()
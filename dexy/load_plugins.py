@@ -1,14 +1,5 @@
-import dexy.filters
-import dexy.reporters
-import dexy.parsers
-import dexy.datas
+import dexy.plugin_manifest
 
-# Automatically register plugins in any python package named like dexy_*
-import pkg_resources
-for dist in pkg_resources.working_set:
-    if dist.key.startswith("dexy-"):
-        import_pkg = dist.egg_name().split("-")[0]
-        try:
-            __import__(import_pkg)
-        except ImportError as e:
-            print "plugin", import_pkg, "not registered because", e
+# Register all plugins, modules defining plugins are only imported when needed
+# if an up to date plugin manifest is available.
+dexy.plugin_manifest.load_plugins()
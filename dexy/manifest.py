@@ -0,0 +1,117 @@
+from dexy.utils import parallel_map
+import os
+
+def list_dir(dirpath):
+    try:
+        return os.listdir(dirpath)
+    except OSError:
+        return []
+
+class CacheManifest(object):
+    """
+    Records which files in the cache directory belong to the last successful
+    run, grouped by the doc which owns them.
+
+    There is a single cache directory. The 'last' generation is the set of
+    files listed in the manifest, the 'this' generation is the set of files
+    written during the current run. Files of cached docs stay where they are
+    from one run to the next, only files of docs which are re-run get
+    replaced.
+    """
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.generation = 0
+        self.owners = {}
+        self.files = set()
+        self.present = None
+
+    def filename(self):
+        return os.path.join(self.wrapper.artifacts_dir, 'manifest.pickle')
+
+    def load(self):
+        """
+        Load manifest written at the end of the last successful run.
+        """
+        try:
+            with open(self.filename(), 'rb') as f:
+                pickle = self.wrapper.pickle_lib()
+                info = pickle.load(f)
+            self.generation = info['generation']
+            self.owners = info['owners']
+        except IOError:
+            self.generation = 0
+            self.owners = {}
+
+        self.files = set(filepath
+                for filepaths in self.owners.itervalues()
+                for filepath in filepaths)
+        self.present = None
+
+    def present_files(self):
+        """
+        Returns the set of files in the manifest which exist. Each directory
+        holding files in the manifest is listed once, rather than checking
+        for each file separately.
+        """
+        if self.present is None:
+            dirs = sorted(set(os.path.dirname(filepath) for filepath in self.files))
+            listings = parallel_map(list_dir, dirs)
+            self.present = set(os.path.join(d, filename)
+                    for d, filenames in zip(dirs, listings)
+                    for filename in filenames)
+        return self.present
+
+    def discard(self, filepaths):
+        """
+        Notes that filepaths have been removed, so they are no longer
+        treated as present if the manifest is used again.
+        """
+        if self.present is not None:
+            self.present.difference_update(filepaths)
+
+    def write(self, generation, owners):
+        with open(self.filename(), 'wb') as f:
+            pickle = self.wrapper.pickle_lib()
+            pickle.dump({'generation' : generation, 'owners' : owners}, f)
+
+    def is_present(self, filepath):
+        """
+        Returns a boolean indicating whether filepath is a valid artifact from
+        the last successful run.
+        """
+        return filepath in self.files and filepath in self.present_files()
+
+    def files_owned_by(self, doc_key):
+        return self.owners.get(doc_key, [])
+
+    def forget(self, doc_keys):
+        """
+        Remove entries for docs which are about to be re-run, so their files
+        are not mistaken for valid artifacts if this run fails.
+        """
+        doc_keys = [k for k in doc_keys if k in self.owners]
+        if doc_keys:
+            owners = dict(self.owners)
+            for doc_key in doc_keys:
+                del owners[doc_key]
+            self.write(self.generation, owners)
+
+    def save(self, owners):
+        """
+        Save a new generation made up of the files in owners, and remove any
+        files from the previous generation which are no longer needed.
+        """
+        self.write(self.generation + 1, owners)
+
+        new_files = set(filepath
+                for filepaths in owners.itervalues()
+                for filepath in filepaths)
+
+        for filepath in self.files - new_files:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+        self.generation += 1
+        self.owners = owners
+        self.files = new_files
+        self.present = None
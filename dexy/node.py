@@ -2,9 +2,97 @@ from dexy.utils import md5_hash
 from dexy.utils import os_to_posix
 import dexy.doc
 import dexy.plugin
-import fnmatch
 import json
 import re
+import threading
+
+class InputIndex(object):
+    """
+    Memoized transitive inputs of nodes.
+
+    The transitive inputs of a node are its inputs and children, each
+    followed by their own transitive inputs, with each node included only
+    once in the order in which it is first reached. They are computed once
+    per node and stored along with a bitset of integer ids assigned to
+    nodes, so the inputs of a node which adds nothing new to a walk are
+    skipped without looking at each of them.
+
+    The index must be cleared whenever inputs or children of nodes change
+    after the wrapper has walked the docs, i.e. when additional docs are
+    added or removed.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.ids = {}
+            self.closures = {}
+            self.walks = {}
+
+    def node_bit(self, node):
+        node_id = self.ids.get(node)
+        if node_id is None:
+            node_id = self.ids[node] = len(self.ids)
+        return 1 << node_id
+
+    def merge(self, nodes):
+        """
+        Returns a tuple of nodes and each of their transitive inputs without
+        duplicates, and a bitset of these nodes.
+        """
+        result = []
+        seen = set()
+        seen_bits = 0
+
+        for node in nodes:
+            if node in seen:
+                # everything reachable from node has already been added
+                continue
+            result.append(node)
+            seen.add(node)
+            seen_bits |= self.node_bit(node)
+
+            closure, closure_bits = self.closures.get(node, ((), 0))
+            if closure_bits & ~seen_bits:
+                for inpt in closure:
+                    if not inpt in seen:
+                        result.append(inpt)
+                        seen.add(inpt)
+                seen_bits |= closure_bits
+
+        return tuple(result), seen_bits
+
+    def compute_closures(self, nodes):
+        """
+        Computes transitive inputs of nodes and everything they depend on,
+        visiting inputs before the nodes which need them.
+        """
+        in_progress = set()
+        stack = list(nodes)
+        while stack:
+            node = stack[-1]
+            if node in self.closures:
+                stack.pop()
+            elif node in in_progress:
+                stack.pop()
+                self.closures[node] = self.merge(node.inputs + node.children)
+            else:
+                in_progress.add(node)
+                stack.extend(inpt for inpt in node.inputs + node.children
+                        if not inpt in self.closures and not inpt in in_progress)
+
+    def walk_inputs(self, node):
+        """
+        Returns a tuple of the direct inputs of node and their transitive
+        inputs.
+        """
+        with self.lock:
+            if not node in self.walks:
+                self.compute_closures(node.inputs)
+                self.walks[node] = self.merge(node.inputs)[0]
+            return self.walks[node]
 
 class Node(dexy.plugin.Plugin):
     """
@@ -19,6 +107,8 @@ class Node(dexy.plugin.Plugin):
             ('new', 'uncached'),
             ('uncached', 'running'),
             ('running', 'ran'),
+            ('ran', 'uncached'),
+            ('consolidated', 'uncached'),
             )
 
     def __init__(self, pattern, wrapper, inputs=None, **kwargs):
@@ -39,10 +129,12 @@ class Node(dexy.plugin.Plugin):
         self.runtime_args = {}
         self.children = []
         self.additional_docs = []
+        self.created_by_doc = None
 
         self.hashid = md5_hash(self.key)
 
         self.state = 'new'
+        self.uncached_reasons = []
 
         # Class-specific setup.
         self.setup()
@@ -72,20 +164,19 @@ class Node(dexy.plugin.Plugin):
 
     def walk_inputs(self):
         """
-        Yield all direct inputs and their inputs.
+        Return all direct inputs and their inputs, each node once.
         """
-        children = []
-        def walk(inputs):
-            for inpt in inputs:
-                children.append(inpt)
-                walk(inpt.inputs + inpt.children)
-
         if self.inputs:
-            walk(self.inputs)
+            if self.wrapper.state in ('new', 'valid'):
+                # nodes are still being set up, so don't memoize
+                index = InputIndex()
+            else:
+                index = self.wrapper.input_index
+            return list(index.walk_inputs(self))
         elif hasattr(self, 'parent'):
-            children = self.parent.walk_inputs()
-
-        return children
+            return self.parent.walk_inputs()
+        else:
+            return []
 
     def walk_input_docs(self):
         """
@@ -117,10 +208,9 @@ class Node(dexy.plugin.Plugin):
             self.log_debug("no saved args, will return True for args_changed")
             return True
         else:
-            self.log_debug("    saved args '%s' (%s)" % (saved_args, saved_args.__class__))
-            self.log_debug("    sorted args '%s' (%s)" % (self.sorted_arg_string(), self.sorted_arg_string().__class__))
-            self.log_debug("  args unequal: %s" % (saved_args != self.sorted_arg_string()))
-            return saved_args != self.sorted_arg_string()
+            args_changed = (saved_args != self.sorted_arg_string())
+            self.log_debug("  args unequal: %s" % args_changed)
+            return args_changed
 
     def sorted_args(self, skip=['contents']):
         """
@@ -174,6 +264,7 @@ class Node(dexy.plugin.Plugin):
         self.wrapper.add_node(doc)
         self.wrapper.batch.add_doc(doc)
         self.additional_docs.append(doc)
+        self.wrapper.input_index.clear()
 
     def check_cache_elements_present(self):
         """
@@ -181,6 +272,13 @@ class Node(dexy.plugin.Plugin):
         """
         return True
 
+    def changes_working_dir(self):
+        """
+        Returns a boolean indicating whether running this node changes the
+        current working directory, see Filter.changes_working_dir.
+        """
+        return False
+
     def input_nodes(self, with_parent_inputs = False):
         input_nodes = self.inputs + self.children
         if with_parent_inputs and hasattr(self, 'parent'):
@@ -192,12 +290,13 @@ class Node(dexy.plugin.Plugin):
         if self.state == 'new':
             self.log_debug("checking if %s is changed" % self.key)
 
-            any_inputs_not_cached = False
+            inputs_not_cached = []
             for node in self.input_nodes(True):
                 node.check_is_cached()
                 if not node.state == 'cached':
                     self.log_debug("    input node %s is not cached" % node.key_with_class())
-                    any_inputs_not_cached = True
+                    inputs_not_cached.append(node.key_with_class())
+            any_inputs_not_cached = bool(inputs_not_cached)
 
             self.args_changed = self.check_args_changed()
             self.doc_changed = self.check_doc_changed()
@@ -214,15 +313,40 @@ class Node(dexy.plugin.Plugin):
             if is_cached and cache_elements_present:
                 self.transition('cached')
             else:
+                self.uncached_reasons = self.reasons_not_cached(
+                        inputs_not_cached, cache_elements_present)
                 self.transition('uncached')
 
             # do housekeeping stuff we need to do for every node
             self.wrapper.add_node(self)
             self.wrapper.batch.add_doc(self)
 
+    def reasons_not_cached(self, inputs_not_cached, cache_elements_present):
+        """
+        Returns a list of reasons, as found by check_is_cached, why this node
+        will be run.
+        """
+        reasons = []
+        if self.doc_changed:
+            reasons.append("doc changed")
+        if self.args_changed:
+            reasons.append("args changed")
+        if inputs_not_cached:
+            reasons.append("input not cached: %s" % ", ".join(inputs_not_cached))
+        if not cache_elements_present:
+            reasons.append("cache element missing")
+        return reasons
+
     def load_runtime_info(self):
         pass
 
+    def reset(self):
+        """
+        Returns a node which has run or been consolidated to the 'uncached'
+        state, so that it will run again.
+        """
+        self.transition('uncached')
+
     def consolidate_cache_files(self):
         for node in self.input_nodes():
             node.consolidate_cache_files()
@@ -260,7 +384,8 @@ class Node(dexy.plugin.Plugin):
             for task in inpt:
                 task()
         self.wrapper.current_task = self
-        self.run()
+        with self.wrapper.fileio.node(self):
+            self.run()
         self.wrapper.current_task = None
 
     def run(self):
@@ -320,24 +445,26 @@ class PatternNode(Node):
         file_pattern = self.key.split("|")[0]
         filter_aliases = self.key.split("|")[1:]
 
-        for filepath, fileinfo in self.wrapper.filemap.iteritems():
-            if fnmatch.fnmatch(filepath, file_pattern):
-                except_p = self.args.get('except')
-                if except_p and re.search(except_p, filepath):
-                    msg = "not creating child of patterndoc for file '%s' because it matches except '%s'"
-                    msgargs = (filepath, except_p)
-                    self.log_debug(msg % msgargs)
+        except_p = self.args.get('except')
+        if except_p:
+            except_re = re.compile(except_p)
+
+        for filepath in self.wrapper.glob_index().match(file_pattern):
+            if except_p and except_re.search(filepath):
+                msg = "not creating child of patterndoc for file '%s' because it matches except '%s'"
+                msgargs = (filepath, except_p)
+                self.log_debug(msg % msgargs)
+            else:
+                if len(filter_aliases) > 0:
+                    doc_key = "%s|%s" % (filepath, "|".join(filter_aliases))
                 else:
-                    if len(filter_aliases) > 0:
-                        doc_key = "%s|%s" % (filepath, "|".join(filter_aliases))
-                    else:
-                        doc_key = filepath
-
-                    msg = "creating child of patterndoc %s: %s"
-                    msgargs = (self.key, doc_key)
-                    self.log_debug(msg % msgargs)
-                    doc = dexy.doc.Doc(doc_key, self.wrapper, [], **self.args)
-                    doc.parent = self
-                    self.children.append(doc)
-                    self.wrapper.add_node(doc)
-                    self.wrapper.batch.add_doc(doc)
+                    doc_key = filepath
+
+                msg = "creating child of patterndoc %s: %s"
+                msgargs = (self.key, doc_key)
+                self.log_debug(msg % msgargs)
+                doc = dexy.doc.Doc(doc_key, self.wrapper, [], **self.args)
+                doc.parent = self
+                self.children.append(doc)
+                self.wrapper.add_node(doc)
+                self.wrapper.batch.add_doc(doc)
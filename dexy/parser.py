@@ -1,9 +1,68 @@
+from collections import OrderedDict
+from dexy.version import DEXY_VERSION
 import copy
 import dexy.doc
 import dexy.exceptions
 import dexy.plugin
+import dexy.utils
+import os
 import posixpath
 
+def path_components(path):
+    """
+    Returns a list of the directory names in a relative path, after
+    normalizing it, e.g. ['abc', 'def'] for 'abc/./def/' and [] for '.'.
+    """
+    path = posixpath.normpath(path.replace(os.sep, posixpath.sep))
+    if path == '.':
+        return []
+    return path.split(posixpath.sep)
+
+class DirectorySettings(object):
+    """
+    Resolves settings registered for directories, such as default args and
+    environment, which apply to a directory and everything below it.
+
+    Settings are stored in a trie of path components. The settings for a
+    file are those of each directory on the path to the file's directory
+    merged from the top down, so settings for a directory override those of
+    its parents. Resolved settings are cached for each directory.
+    """
+    def __init__(self, entries):
+        self.n_entries = len(entries)
+        self.resolved = {}
+
+        # Each trie node is a (list of settings dicts, dict of children) tuple.
+        self.trie = ([], {})
+        for directory, settings in entries:
+            node = self.trie
+            for component in path_components(directory):
+                node = node[1].setdefault(component, ([], {}))
+            node[0].append(settings)
+
+    def resolve_directory(self, directory):
+        if not directory in self.resolved:
+            merged = {}
+            node = self.trie
+            components = path_components(directory)
+            while True:
+                for settings in node[0]:
+                    merged.update(settings)
+                if not components:
+                    break
+                node = node[1].get(components.pop(0))
+                if node is None:
+                    break
+            self.resolved[directory] = merged
+        return self.resolved[directory]
+
+    def resolve(self, path):
+        """
+        Returns a new dict of the settings which apply to the file at path,
+        relative to the project root.
+        """
+        return dict(self.resolve_directory(posixpath.dirname(path) or '.'))
+
 class AbstractSyntaxTree():
     def __init__(self, wrapper):
         self.wrapper = wrapper
@@ -11,52 +70,87 @@ class AbstractSyntaxTree():
         self.root_nodes_ordered = False
 
         self.lookup_table = {}
-        self.tree = []
+
+        # Nodes which are not an input of any other node, in the order they
+        # were added, and the number of nodes each node is an input of.
+        self.root_keys = OrderedDict()
+        self.in_degree = {}
+
+        # Standardized keys for keys as written in config files
+        self.standard_keys = {}
 
         # Lists of (directory, settings) tuples
         self.default_args_for_directory = []
         self.environment_for_directory = []
+        self.settings_resolvers = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['wrapper']
+        del state['settings_resolvers']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.settings_resolvers = {}
+
+    @property
+    def tree(self):
+        """
+        List of root node keys, i.e. keys of nodes which are not an input of
+        some other node.
+        """
+        return self.root_keys.keys()
 
     def all_inputs(self):
         """
         Returns a set of all node keys identified as inputs of some other
         element.
         """
-        all_inputs = set()
-        for kwargs in self.lookup_table.values():
-            inputs = kwargs['inputs']
-            all_inputs.update(inputs)
-        return all_inputs
+        return set(k for k, n in self.in_degree.iteritems() if n > 0)
 
-    def clean_tree(self):
+    def standardize_key(self, key):
         """
-        Removes tasks which are already represented as inputs (tree should
-        only contain root nodes).
+        Returns the wrapper's standardized key for key. The same keys come up
+        many times while parsing config files, so results are remembered.
         """
-        treecopy = copy.deepcopy(self.tree)
-        all_inputs = self.all_inputs()
-        for task in treecopy:
-            if task in all_inputs:
-                self.tree.remove(task)
+        try:
+            return self.standard_keys[key]
+        except KeyError:
+            standard_key = self.wrapper.standardize_key(key)
+            self.standard_keys[key] = standard_key
+            self.standard_keys[standard_key] = standard_key
+            return standard_key
+
+    def add_input(self, input_node_key):
+        self.in_degree[input_node_key] = self.in_degree.get(input_node_key, 0) + 1
+        self.root_keys.pop(input_node_key, None)
+
+    def remove_input(self, input_node_key):
+        self.in_degree[input_node_key] -= 1
+        if self.in_degree[input_node_key] == 0 and input_node_key in self.lookup_table:
+            self.root_keys[input_node_key] = True
 
     def add_node(self, node_key, **kwargs):
         """
         Adds the node and its kwargs to the tree and lookup table
         """
-        node_key = self.wrapper.standardize_key(node_key)
-
-        if not node_key in self.tree:
-            self.tree.append(node_key)
+        node_key = self.standardize_key(node_key)
 
         if not self.lookup_table.has_key(node_key):
-            self.lookup_table[node_key] = {}
+            self.lookup_table[node_key] = {'inputs' : []}
+            if not self.in_degree.get(node_key):
+                self.root_keys[node_key] = True
 
-        self.lookup_table[node_key].update(kwargs)
+        node_kwargs = self.lookup_table[node_key]
 
-        if not self.lookup_table[node_key].has_key('inputs'):
-            self.lookup_table[node_key]['inputs'] = []
+        if 'inputs' in kwargs:
+            for input_node_key in node_kwargs['inputs']:
+                self.remove_input(input_node_key)
+            for input_node_key in kwargs['inputs']:
+                self.add_input(input_node_key)
 
-        self.clean_tree()
+        node_kwargs.update(kwargs)
         return node_key
 
     def add_dependency(self, node_key, input_node_key):
@@ -69,14 +163,13 @@ class AbstractSyntaxTree():
 
         if not node_key == input_node_key:
             self.lookup_table[node_key]['inputs'].append(input_node_key)
-
-        self.clean_tree()
+            self.add_input(input_node_key)
 
     def args_for_node(self, node_key):
         """
         Returns the dict of kw args for a node
         """
-        node_key = self.wrapper.standardize_key(node_key)
+        node_key = self.standardize_key(node_key)
         args = copy.deepcopy(self.lookup_table[node_key])
         del args['inputs']
         return args
@@ -85,28 +178,26 @@ class AbstractSyntaxTree():
         """
         Returns the list of inputs for a node
         """
-        node_key = self.wrapper.standardize_key(node_key)
+        node_key = self.standardize_key(node_key)
         return self.lookup_table[node_key]['inputs']
 
-    def calculate_default_args_for_directory(self, path):
-        dir_path = posixpath.dirname(posixpath.abspath(path))
-        default_kwargs = {}
-
-        for d, args in self.default_args_for_directory:
-            if posixpath.abspath(d) in dir_path:
-                default_kwargs.update(args)
+    def directory_settings(self, name):
+        """
+        Returns the DirectorySettings for the list of (directory, settings)
+        tuples in the attribute name, rebuilt if entries have been added.
+        """
+        entries = getattr(self, name)
+        resolver = self.settings_resolvers.get(name)
+        if resolver is None or resolver.n_entries != len(entries):
+            resolver = DirectorySettings(entries)
+            self.settings_resolvers[name] = resolver
+        return resolver
 
-        return default_kwargs
+    def calculate_default_args_for_directory(self, path):
+        return self.directory_settings('default_args_for_directory').resolve(path)
 
     def calculate_environment_for_directory(self, path):
-        dir_path = posixpath.dirname(posixpath.abspath(path))
-        env = {}
-
-        for d, args in self.environment_for_directory:
-            if posixpath.abspath(d) in dir_path:
-                env.update(args)
-
-        return env
+        return self.directory_settings('environment_for_directory').resolve(path)
 
     def walk(self):
         """
@@ -150,6 +241,10 @@ class AbstractSyntaxTree():
             return self.wrapper.nodes[key]
 
         def parse_item(key):
+            if key in self.wrapper.nodes:
+                # already parsed as an input of another node
+                return self.wrapper.nodes[key]
+
             inputs = self.inputs_for_node(key)
             kwargs = self.args_for_node(key)
             self.wrapper.log.debug("parsing item %s" % key)
@@ -173,6 +268,72 @@ class AbstractSyntaxTree():
             if root_node:
                 self.wrapper.roots.append(root_node)
 
+class ParsedConfigCache(object):
+    """
+    Stores the AST parsed from the project's config files in the artifacts
+    directory, so it can be reused while the config files are unchanged.
+
+    The AST is keyed by the contents of the config files, the options which
+    affect parsing, the node and parser plugins available and the paths in
+    the filemap, since whether a file exists decides what type of node a
+    key refers to.
+    """
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+
+    def filename(self):
+        return os.path.join(self.wrapper.artifacts_dir, 'configs.pickle')
+
+    def cache_key(self, configs):
+        """
+        Returns a digest for a list of (alias, filepath, dir, config text)
+        tuples for the config files to be parsed.
+        """
+        wrapper = self.wrapper
+        key = (
+                DEXY_VERSION,
+                wrapper.parsers, wrapper.recurse, wrapper.configs, wrapper.siblings,
+                sorted(dexy.node.Node.plugins), sorted(Parser.plugins),
+                sorted(wrapper.filemap),
+                [(alias, filepath, dirname, dexy.utils.md5_hash(text))
+                    for alias, filepath, dirname, text in configs]
+                )
+        return dexy.utils.md5_hash(repr(key))
+
+    def load(self, configs):
+        """
+        Returns the saved AST if it was parsed from these configs, or None.
+        """
+        try:
+            with open(self.filename(), 'rb') as f:
+                pickle = self.wrapper.pickle_lib()
+                key, ast = pickle.load(f)
+        except Exception:
+            # missing, truncated or written by an incompatible version
+            return None
+
+        if key != self.cache_key(configs):
+            return None
+
+        ast.wrapper = self.wrapper
+        return ast
+
+    def save(self, configs, ast):
+        if not os.path.isdir(self.wrapper.artifacts_dir):
+            return
+
+        pickle = self.wrapper.pickle_lib()
+        try:
+            data = pickle.dumps((self.cache_key(configs), ast), -1)
+        except (pickle.PicklingError, TypeError):
+            # e.g. a dexy-env.py config defined values which can't be pickled
+            if os.path.exists(self.filename()):
+                os.remove(self.filename())
+            return
+
+        with open(self.filename(), 'wb') as f:
+            f.write(data)
+
 class Parser(dexy.plugin.Plugin):
     """
     Parse various types of config file.
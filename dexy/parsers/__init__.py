@@ -1,2 +0,0 @@
-import dexy.parsers.doc
-import dexy.parsers.environment
@@ -0,0 +1,146 @@
+"""
+Estimates of the work a dexy run would do, used by `dexy plan`.
+
+Each doc which is not cached is given an estimated time from the run
+history kept in the batch database (see `dexy stats`): the median time the
+doc took in recent runs, or if the doc has not run before, the sum of the
+median times of its filters. Docs which are cached take no time.
+
+Nodes form a graph in which each node waits for its inputs, so with
+enough workers a run can finish no sooner than the slowest chain of
+dependent docs, the critical path. With N workers the run takes at least
+max(total / N, critical path), and the ratio of the total time to this is
+the best speedup N workers could give.
+"""
+from dexy.doc import Doc
+from dexy.utils import median
+import dexy.scheduler
+
+class Plan(object):
+    def __init__(self, wrapper, n_runs=10):
+        """
+        wrapper should have walked the docs and checked which are cached.
+        Timings are taken from the most recent n_runs runs.
+        """
+        self.wrapper = wrapper
+        self.n_runs = n_runs
+        self.load_history()
+
+        if self.wrapper.target:
+            roots = self.wrapper.roots_matching_target()
+        else:
+            roots = self.wrapper.roots
+
+        scheduler = dexy.scheduler.Scheduler(self.wrapper, self.wrapper.jobs)
+        self.depends_on, self.dependents = scheduler.build_graph(roots)
+        self.estimates = dict((node, self.estimate(node)) for node in self.depends_on)
+        self.find_critical_path()
+
+    def load_history(self):
+        """
+        Loads median times of docs and filters which ran in recent runs. Times
+        of filters whose output was restored from the content-addressed store
+        are left out, as they don't reflect the time the filter takes to run.
+        """
+        db = self.wrapper.batch_db()
+        run_ids = [run[0] for run in db.recent_runs(self.n_runs)]
+
+        doc_times = {}
+        for run_id, doc_key, state, elapsed, bytes_in, bytes_out in db.doc_runs(run_ids):
+            if elapsed is not None:
+                doc_times.setdefault(doc_key, []).append(elapsed)
+
+        filter_times = {}
+        for row in db.filter_runs(run_ids):
+            alias, elapsed, restored = row[3:6]
+            if elapsed is not None and not restored:
+                filter_times.setdefault(alias, []).append(elapsed)
+
+        self.doc_times = dict((k, median(v)) for k, v in doc_times.iteritems())
+        self.filter_times = dict((k, median(v)) for k, v in filter_times.iteritems())
+
+    def estimate(self, node):
+        """
+        Returns a tuple of estimated seconds for node to run and where the
+        estimate came from, which is 'history' if the doc has run before,
+        'filters' if it is based on times of its filters, 'unknown' if some
+        of its filters have not run before, or None if node will not run.
+        """
+        if node.state != 'uncached' or not isinstance(node, Doc):
+            return (0.0, None)
+        elif node.key in self.doc_times:
+            return (self.doc_times[node.key], 'history')
+        else:
+            aliases = [f.alias for f in node.filters]
+            seconds = sum(self.filter_times.get(alias, 0.0) for alias in aliases)
+            if all(alias in self.filter_times for alias in aliases):
+                return (seconds, 'filters')
+            else:
+                return (seconds, 'unknown')
+
+    def seconds(self, node):
+        return self.estimates[node][0]
+
+    def find_critical_path(self):
+        """
+        Finds the chain of dependent nodes with the longest total estimated
+        time, visiting nodes after all the nodes they depend on. Nodes in a
+        circular dependency are never visited, the scheduler reports these
+        when dexy runs.
+        """
+        waiting_for = dict((node, len(deps)) for node, deps in self.depends_on.iteritems())
+        ready = sorted(node for node, count in waiting_for.iteritems() if count == 0)
+
+        # node : (estimated seconds until node finishes, previous node on path)
+        finishes = {}
+        while ready:
+            node = ready.pop()
+            previous = None
+            start = 0.0
+            for dep in sorted(self.depends_on[node]):
+                if finishes[dep][0] > start:
+                    start, previous = finishes[dep][0], dep
+            finishes[node] = (start + self.seconds(node), previous)
+
+            for dependent in sorted(self.dependents[node]):
+                waiting_for[dependent] -= 1
+                if waiting_for[dependent] == 0:
+                    ready.append(dependent)
+
+        self.critical_path = []
+        self.critical_path_seconds = 0.0
+        if finishes:
+            node = max(sorted(finishes), key=lambda n: finishes[n][0])
+            self.critical_path_seconds = finishes[node][0]
+            while node is not None:
+                self.critical_path.insert(0, node)
+                node = finishes[node][1]
+
+    def uncached_docs(self):
+        """
+        Returns docs which will run, those with the longest estimated times
+        first.
+        """
+        docs = [node for node in self.depends_on
+                if node.state == 'uncached' and isinstance(node, Doc)]
+        return sorted(docs, key=lambda doc: (-self.seconds(doc), doc.key))
+
+    def total_seconds(self):
+        return sum(self.seconds(node) for node in self.depends_on)
+
+    def min_seconds(self, workers):
+        """
+        Returns the least time in which a run could finish with the number
+        of workers.
+        """
+        return max(self.total_seconds() / workers, self.critical_path_seconds)
+
+    def speedup(self, workers):
+        """
+        Returns the greatest speedup which the number of workers could give
+        over a single worker, or None if nothing will take any time.
+        """
+        min_seconds = self.min_seconds(workers)
+        if not min_seconds:
+            return None
+        return self.total_seconds() / min_seconds
@@ -7,6 +7,34 @@ class PluginMeta(cashew.PluginMeta):
     """
     _store_other_class_settings = {} # allow plugins to define settings for other classes
     official_dexy_plugins = ("dexy_templates", "dexy_viewer", "dexy_filter_examples")
+    manifest_modules = set() # modules whose plugins were registered from the plugin manifest
+
+    def register_plugin(cls, alias_or_aliases, class_or_class_name, settings):
+        """
+        Plugins in modules listed in the plugin manifest have already been
+        registered by module and class name. When such a module is imported,
+        aliases which the manifest assigns to the class being registered are
+        updated to refer to the class, keeping their settings, and aliases
+        which the manifest assigns to other plugins are left alone.
+        """
+        klass = class_or_class_name
+        if not isinstance(klass, type) or not klass.__module__ in PluginMeta.manifest_modules:
+            return cashew.PluginMeta.register_plugin(cls, alias_or_aliases, klass, settings)
+
+        aliases = [cls.apply_prefix(klass.__module__, alias)
+                for alias in cls.standardize_alias_or_aliases(alias_or_aliases)]
+        registered = dict((alias, cls.plugins.get(alias)) for alias in aliases)
+
+        cashew.PluginMeta.register_plugin(cls, alias_or_aliases, klass, settings)
+
+        ref = "%s:%s" % (klass.__module__, klass.__name__)
+        for alias, entry in registered.iteritems():
+            if entry is None:
+                continue
+            elif entry[0] == ref or entry[0] is klass:
+                cls.plugins[alias] = (klass, entry[1])
+            else:
+                cls.plugins[alias] = entry
 
     def load_class_from_locals(cls, class_name):
         from dexy.template import Template
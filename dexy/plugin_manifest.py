@@ -0,0 +1,273 @@
+"""
+Loads dexy's plugins, using a manifest of plugin aliases to avoid importing
+every plugin module each time dexy starts.
+
+The manifest is generated by importing all plugin modules, then recording
+each alias registered for each type of plugin along with a "module:Class"
+reference to the plugin class and its settings. When a valid manifest is
+found, these entries are registered instead of importing the modules, and
+cashew imports a plugin's module when an instance is first created.
+
+The manifest is rebuilt when the dexy version or the python executable
+changes, when anything is installed into or removed from a directory on
+sys.path, or when one of the imported plugin modules or this module is
+modified.
+"""
+from dexy.version import DEXY_VERSION
+import cashew
+import dexy.data
+import dexy.filter
+import dexy.node
+import dexy.parser
+import dexy.plugin
+import dexy.remote_cache
+import dexy.reporter
+import dexy.storage
+import dexy.template
+import hashlib
+import os
+import sys
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Modules which define dexy's built-in plugins.
+PLUGIN_MODULES = [
+        'dexy.filters.ansi',
+        'dexy.filters.api',
+        'dexy.filters.archive',
+        'dexy.filters.asciidoctor',
+        'dexy.filters.aws',
+        'dexy.filters.confluence',
+        'dexy.filters.deprecated',
+        'dexy.filters.easy',
+        'dexy.filters.example',
+        'dexy.filters.fluid_html',
+        'dexy.filters.genipynb',
+        'dexy.filters.git',
+        'dexy.filters.id',
+        'dexy.filters.ipynb',
+        'dexy.filters.ipynbcasper',
+        'dexy.filters.java',
+        'dexy.filters.latex',
+        'dexy.filters.lyx',
+        'dexy.filters.md',
+        'dexy.filters.org',
+        'dexy.filters.pexp',
+        'dexy.filters.phantomjs',
+        'dexy.filters.pydoc',
+        'dexy.filters.pytest',
+        'dexy.filters.pyparse',
+        'dexy.filters.pyg',
+        'dexy.filters.pyn',
+        'dexy.filters.rst',
+        'dexy.filters.sanitize',
+        'dexy.filters.soup',
+        'dexy.filters.split',
+        'dexy.filters.standard',
+        'dexy.filters.sub',
+        'dexy.filters.templating',
+        'dexy.filters.websequence',
+        'dexy.filters.wordpress',
+        'dexy.filters.yamlargs',
+        'dexy.filters.xxml',
+        'dexy.reporters.run',
+        'dexy.reporters.output',
+        'dexy.reporters.website',
+        'dexy.reporters.nodegraph',
+        'dexy.parsers.doc',
+        'dexy.parsers.environment',
+        'dexy.datas.soup',
+        'dexy.datas.h5',
+        'dexy.datas.et',
+        'dexy.commands.cache',
+        ]
+
+FILTERS_YAML = os.path.join(os.path.dirname(__file__), 'filters', 'filters.yaml')
+
+# Each type of plugin has its own registry of aliases.
+PLUGIN_BASE_CLASSES = [
+        dexy.data.Data,
+        dexy.filter.Filter,
+        dexy.node.Node,
+        dexy.parser.Parser,
+        dexy.plugin.Command,
+        dexy.plugin.TemplatePlugin,
+        dexy.remote_cache.RemoteCache,
+        dexy.reporter.Reporter,
+        dexy.storage.Storage,
+        dexy.template.Template,
+        ]
+
+def import_all_plugins():
+    """
+    Imports all built-in plugin modules and any installed python package
+    named like dexy_*, registering all their plugins.
+    """
+    for modname in PLUGIN_MODULES:
+        __import__(modname)
+
+    dexy.filter.Filter.register_plugins_from_yaml_file(FILTERS_YAML)
+
+    # Automatically register plugins in any python package named like dexy_*
+    import pkg_resources
+    for dist in pkg_resources.working_set:
+        if dist.key.startswith("dexy-"):
+            import_pkg = dist.egg_name().split("-")[0]
+            try:
+                __import__(import_pkg)
+            except ImportError as e:
+                print "plugin", import_pkg, "not registered because", e
+
+def manifest_filename():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+            os.path.join(os.path.expanduser("~"), ".cache")
+    # Different python installations, copies of dexy and python paths get
+    # their own manifest.
+    install_key = os.pathsep.join([sys.executable, os.path.dirname(__file__)] + sys.path)
+    install_id = hashlib.md5(install_key).hexdigest()
+    filename = "plugin-manifest-%s.pickle" % install_id
+    return os.path.join(cache_home, "dexy", filename)
+
+def mtime(filepath):
+    try:
+        return os.stat(filepath).st_mtime
+    except OSError:
+        return None
+
+def source_file(module):
+    filepath = getattr(module, '__file__', None)
+    if filepath and filepath.endswith((".pyc", ".pyo")):
+        filepath = filepath[:-1]
+    return filepath
+
+def environment_key():
+    """
+    Returns a value which changes when python packages are installed or
+    removed, or dexy is upgraded.
+    """
+    # The current dir is skipped as it depends on where dexy is run from.
+    path_dirs = tuple((d, mtime(d)) for d in sys.path if d)
+    return (DEXY_VERSION, sys.executable, path_dirs)
+
+def class_ref(klass):
+    return "%s:%s" % (klass.__module__, klass.__name__)
+
+def build_manifest(module_names):
+    """
+    Returns a manifest of the currently registered plugins, or None if any
+    plugin class can't be imported by its module and class name.
+    """
+    plugins = {}
+    modules = set()
+
+    for base_class in PLUGIN_BASE_CLASSES:
+        entries = {}
+        for alias, (class_or_class_name, settings) in base_class.plugins.iteritems():
+            if isinstance(class_or_class_name, type):
+                klass = class_or_class_name
+                module = sys.modules.get(klass.__module__)
+                if getattr(module, klass.__name__, None) is not klass:
+                    return None
+                modules.add(klass.__module__)
+                entries[alias] = (class_ref(klass), settings)
+            else:
+                if ":" in class_or_class_name:
+                    modules.add(class_or_class_name.split(":")[0])
+                entries[alias] = (class_or_class_name, settings)
+        plugins[base_class.__name__] = entries
+
+    files = dict((filepath, mtime(filepath))
+            for filepath in [source_file(sys.modules.get(modname))
+                for modname in modules.union(module_names)] +
+                [FILTERS_YAML, source_file(sys.modules[__name__])]
+            if filepath)
+
+    return {
+            'environment' : environment_key(),
+            'files' : files,
+            'modules' : modules,
+            'plugins' : plugins,
+            'other-class-settings' : cashew.PluginMeta._store_other_class_settings
+            }
+
+def is_valid(manifest):
+    if manifest.get('environment') != environment_key():
+        return False
+
+    for filepath, recorded_mtime in manifest['files'].iteritems():
+        if mtime(filepath) != recorded_mtime:
+            return False
+
+    return True
+
+def read_manifest(filename):
+    try:
+        with open(filename, 'rb') as f:
+            manifest = pickle.load(f)
+    except Exception:
+        # missing or unreadable manifest, it will be regenerated
+        return None
+
+    if isinstance(manifest, dict) and is_valid(manifest):
+        return manifest
+
+def write_manifest(filename, manifest):
+    try:
+        dirname = os.path.dirname(filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        # write to a temp file first so other processes never see a partial file
+        tmp_filename = "%s.%s" % (filename, os.getpid())
+        with open(tmp_filename, 'wb') as f:
+            pickle.dump(manifest, f, -1)
+        os.rename(tmp_filename, filename)
+
+    except (IOError, OSError, pickle.PicklingError, TypeError):
+        # not being able to save the manifest just means dexy starts slower
+        pass
+
+def register_from_manifest(manifest):
+    """
+    Registers plugins listed in the manifest without importing them.
+    """
+    for base_class in PLUGIN_BASE_CLASSES:
+        entries = manifest['plugins'].get(base_class.__name__, {})
+        for alias, (ref, settings) in entries.iteritems():
+            existing = base_class.plugins.get(alias)
+            # Keep entries for plugin classes which are already imported.
+            if existing and isinstance(existing[0], type) and class_ref(existing[0]) == ref:
+                continue
+            base_class.plugins[alias] = (ref, settings)
+
+    for alias, settings in manifest['other-class-settings'].iteritems():
+        cashew.PluginMeta._store_other_class_settings.setdefault(alias, {}).update(settings)
+
+    dexy.plugin.PluginMeta.manifest_modules.update(manifest['modules'])
+
+def load_plugins(filename=None):
+    """
+    Registers all available plugins, from the manifest if it is up to date,
+    otherwise by importing all plugin modules and generating a new manifest.
+    Returns True if the manifest was used.
+    """
+    if filename is None:
+        filename = manifest_filename()
+
+    manifest = read_manifest(filename)
+    if manifest:
+        register_from_manifest(manifest)
+        return True
+
+    modules_before = set(sys.modules)
+    import_all_plugins()
+    new_modules = [modname for modname in set(sys.modules) - modules_before
+            if modname.startswith('dexy') and sys.modules[modname]]
+
+    manifest = build_manifest(new_modules)
+    if manifest:
+        write_manifest(filename, manifest)
+    return False
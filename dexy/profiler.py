@@ -0,0 +1,122 @@
+"""
+Profiles of each filter which runs, as opposed to the profile option which
+profiles the whole dexy run in one cProfile session.
+
+When the profilefilters option is set, each call to a filter's process()
+method is profiled separately and saved to a .prof file in the profiles
+directory within the artifacts directory, named after the doc and the
+filter's position and alias. At the end of the run the profiles of each
+filter alias are merged, saved as <alias>.prof and summarized in
+report.txt, which lists the functions with the most cumulative time for
+each filter, filters which took most time first.
+
+cProfile sets its hook on the calling thread only, so filters running on
+different worker threads are profiled separately.
+"""
+from contextlib import contextmanager
+import cProfile
+import os
+import pstats
+import re
+import shutil
+import threading
+
+class NullFilterProfiler(object):
+    """
+    Profiler used when profiling filters is off, which profiles nothing.
+    """
+    enabled = False
+
+    def start(self):
+        pass
+
+    @contextmanager
+    def profile(self, f):
+        yield
+
+    def save_report(self):
+        pass
+
+class FilterProfiler(object):
+    """
+    Profiles each filter's process() call and aggregates the profiles by
+    filter alias.
+    """
+    enabled = True
+    n_functions = 25
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.lock = threading.Lock()
+        self.profiles = {} # alias : list of .prof files
+
+    def profiles_dir(self):
+        return os.path.join(self.wrapper.artifacts_dir, 'profiles')
+
+    def report_filename(self):
+        return os.path.join(self.profiles_dir(), 'report.txt')
+
+    def start(self):
+        """
+        Removes profiles from an earlier run.
+        """
+        shutil.rmtree(self.profiles_dir(), ignore_errors=True)
+        os.makedirs(self.profiles_dir())
+        self.profiles = {}
+
+    def profile_filename(self, f):
+        safe_key = re.sub(r"[^\w.-]+", "_", f.doc.key)[0:80]
+        position = f.doc.filters.index(f)
+        name = "%s-%s-%s-%s.prof" % (safe_key, f.doc.hashid[0:8], position, f.alias)
+        return os.path.join(self.profiles_dir(), name)
+
+    @contextmanager
+    def profile(self, f):
+        """
+        Profiles the code run within the block and saves the profile for
+        filter f.
+        """
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            filename = self.profile_filename(f)
+            profiler.dump_stats(filename)
+            with self.lock:
+                self.profiles.setdefault(f.alias, []).append(filename)
+
+    def merged_stats(self):
+        """
+        Returns a list of (alias, pstats.Stats) with the profiles of each
+        filter alias merged, those with most total time first.
+        """
+        merged = []
+        for alias, filenames in self.profiles.iteritems():
+            stats = pstats.Stats(*filenames)
+            merged.append((alias, stats))
+        return sorted(merged, key=lambda item: -item[1].total_tt)
+
+    def save_report(self):
+        if not self.profiles:
+            return
+
+        merged = self.merged_stats()
+        with open(self.report_filename(), 'w') as f:
+            for alias, stats in merged:
+                stats.dump_stats(os.path.join(self.profiles_dir(), "%s.prof" % alias))
+
+                f.write("=" * 80 + "\n")
+                f.write("%s: %s calls, %.3fs\n" % (alias,
+                    len(self.profiles[alias]), stats.total_tt))
+                f.write("=" * 80 + "\n")
+                stats.stream = f
+                stats.sort_stats("cumulative")
+                stats.print_stats(self.n_functions)
+
+def create_filter_profiler(wrapper):
+    if wrapper.profile_filters:
+        return FilterProfiler(wrapper)
+    else:
+        return NullFilterProfiler()
@@ -0,0 +1,139 @@
+"""
+Deletes the contents of dexy's trash directory in a background process.
+
+Run as `python -m dexy.reaper TRASH_DIR`, this is started by the wrapper so
+that runs and `dexy reset` do not have to wait for large directories to be
+deleted. A lock file inside the trash dir ensures only one reaper works on a
+trash dir at a time. The reaper keeps going until the trash dir is empty, so
+anything trashed while it is running is also removed. The trash dir itself is
+left in place so it can't vanish from under a process which is trashing
+something.
+"""
+import errno
+import os
+import shutil
+import subprocess
+import sys
+
+LOCK_FILENAME = ".reaper.lock"
+
+def lock_path(trash_dir):
+    return os.path.join(trash_dir, LOCK_FILENAME)
+
+def pid_is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+def acquire_lock(trash_dir):
+    """
+    Creates the lock file, returns a boolean indicating whether the lock was
+    acquired. A lock file left behind by a reaper which is no longer running
+    is removed.
+    """
+    filepath = lock_path(trash_dir)
+
+    for attempt in range(2):
+        try:
+            fd = os.open(filepath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                # trash dir does not exist, nothing to do
+                return False
+            elif e.errno != errno.EEXIST:
+                raise
+        else:
+            os.write(fd, str(os.getpid()))
+            os.close(fd)
+            return True
+
+        if is_locked(trash_dir):
+            return False
+
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
+
+    return False
+
+def is_locked(trash_dir):
+    """
+    Returns a boolean indicating whether a live reaper holds the lock on
+    trash_dir.
+    """
+    try:
+        with open(lock_path(trash_dir), "r") as f:
+            pid = int(f.read().strip() or 0)
+    except (IOError, ValueError):
+        return False
+
+    return bool(pid) and pid_is_running(pid)
+
+def release_lock(trash_dir):
+    try:
+        os.remove(lock_path(trash_dir))
+    except OSError:
+        pass
+
+def trash_contents(trash_dir):
+    try:
+        return [os.path.join(trash_dir, name)
+                for name in os.listdir(trash_dir)
+                if name != LOCK_FILENAME]
+    except OSError:
+        return []
+
+def remove(filepath):
+    if os.path.isdir(filepath) and not os.path.islink(filepath):
+        shutil.rmtree(filepath, ignore_errors=True)
+    else:
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
+
+def reap(trash_dir):
+    """
+    Deletes everything in trash_dir.
+    """
+    # Something may be trashed after the lock is released, so check again.
+    while trash_contents(trash_dir) and acquire_lock(trash_dir):
+        try:
+            contents = trash_contents(trash_dir)
+            while contents:
+                for filepath in contents:
+                    remove(filepath)
+                contents = trash_contents(trash_dir)
+        finally:
+            release_lock(trash_dir)
+
+def start_reaper(trash_dir):
+    """
+    Starts a detached reaper process for trash_dir unless one is running.
+    """
+    if not trash_contents(trash_dir) or is_locked(trash_dir):
+        return
+
+    # make sure this copy of dexy is importable by the reaper process
+    env = dict(os.environ)
+    dexy_parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    pythonpath = [dexy_parent_dir]
+    if env.get('PYTHONPATH'):
+        pythonpath.append(env['PYTHONPATH'])
+    env['PYTHONPATH'] = os.pathsep.join(pythonpath)
+
+    with open(os.devnull, "r+") as devnull:
+        subprocess.Popen(
+                [sys.executable, "-m", "dexy.reaper", os.path.abspath(trash_dir)],
+                env=env,
+                stdin=devnull,
+                stdout=devnull,
+                stderr=devnull,
+                close_fds=True,
+                preexec_fn=os.setsid)
+
+if __name__ == '__main__':
+    reap(sys.argv[1])
@@ -0,0 +1,297 @@
+"""
+Remote tiers for the content-addressed store, so filter output can be shared
+between machines, CI runners and worktrees which run dexy on the same inputs.
+
+A remote cache holds the same layout as .dexy/cas/, index entries under
+index/ and content under objects/. Before a filter runs, an index entry for
+its content address is looked up in the remote cache and the output fetched
+from there. Output of filters which did run is published to the remote cache.
+
+The remote cache is set with the remote_cache option, either a directory
+(e.g. on a shared network drive) or an http:// or https:// URL for a server
+which responds to GET, HEAD and PUT requests, like `dexy cache:serve`.
+"""
+import BaseHTTPServer
+import dexy.exceptions
+import dexy.plugin
+import errno
+import httplib
+import os
+import posixpath
+import re
+import shutil
+import urllib2
+import uuid
+
+# Paths which can be stored in a remote cache.
+VALID_PATH = re.compile("^(index|objects)/[0-9a-f]{2}/[0-9a-f]+$")
+
+# Content addresses and output digests are md5 hex digests. Anything else
+# read from an index is not used to build a path.
+VALID_DIGEST = re.compile("^[0-9a-f]{32}$")
+
+class RemoteCache(dexy.plugin.Plugin):
+    """
+    Base class for types of remote cache. Subclasses implement reading and
+    writing files given paths relative to the root of the cache, and raise
+    IOError when the remote cache can't be used. The base class has no
+    files, so every lookup is a miss and writes are discarded.
+    """
+    __metaclass__ = dexy.plugin.PluginMeta
+    _settings = {}
+    aliases = []
+
+    def __init__(self, location, wrapper):
+        self.location = location
+        self.wrapper = wrapper
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.location)
+
+    def index_path(self, content_address):
+        return posixpath.join('index', content_address[0:2], content_address)
+
+    def object_path(self, digest):
+        return posixpath.join('objects', digest[0:2], digest)
+
+    def lookup(self, content_address):
+        """
+        Returns the output digest stored for content_address, or None.
+        """
+        if not VALID_DIGEST.match(content_address):
+            return None
+
+        digest = self.read(self.index_path(content_address))
+        if not digest:
+            return None
+
+        digest = digest.strip()
+        if VALID_DIGEST.match(digest):
+            return digest
+        else:
+            msg = "ignoring invalid digest '%s' for %s in remote cache %s"
+            self.wrapper.log.warn(msg % (digest[0:80], content_address, self.location))
+            return None
+
+    def fetch(self, digest, filepath):
+        """
+        Downloads the object with this digest to filepath. Returns a boolean
+        indicating whether the object was found.
+        """
+        return self.download(self.object_path(digest), filepath)
+
+    def publish(self, content_address, digest, filepath):
+        """
+        Uploads the file at filepath as the object with this digest, unless
+        the remote cache already has it, and records it as the output for
+        content_address.
+        """
+        object_path = self.object_path(digest)
+        if not self.exists(object_path):
+            self.upload(filepath, object_path)
+        self.write(self.index_path(content_address), digest)
+
+    def read(self, path):
+        """
+        Returns contents of the file at path, or None if there is no file.
+        """
+        pass
+
+    def write(self, path, contents):
+        pass
+
+    def exists(self, path):
+        return False
+
+    def download(self, path, filepath):
+        """
+        Copies the file at path to filepath. Returns a boolean indicating
+        whether the file was found.
+        """
+        return False
+
+    def upload(self, filepath, path):
+        pass
+
+class DirRemoteCache(RemoteCache):
+    """
+    Remote cache in a directory, for example on a shared network drive.
+    """
+    aliases = ['dir']
+
+    def local_path(self, path):
+        return os.path.join(self.location, *path.split("/"))
+
+    def read(self, path):
+        try:
+            with open(self.local_path(path), 'rb') as f:
+                return f.read()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+
+    def exists(self, path):
+        return os.path.exists(self.local_path(path))
+
+    def download(self, path, filepath):
+        try:
+            shutil.copyfile(self.local_path(path), filepath)
+            return True
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+
+    def write_atomically(self, path, write_fn):
+        # Other processes may be reading from the cache at the same time, so
+        # files are written under a temporary name first.
+        local_path = self.local_path(path)
+        try:
+            os.makedirs(os.path.dirname(local_path))
+        except OSError:
+            pass
+        tmp_path = "%s.%s" % (local_path, uuid.uuid4())
+        write_fn(tmp_path)
+        os.rename(tmp_path, local_path)
+
+    def write(self, path, contents):
+        def write_contents(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(contents)
+        self.write_atomically(path, write_contents)
+
+    def upload(self, filepath, path):
+        self.write_atomically(path, lambda tmp_path: shutil.copyfile(filepath, tmp_path))
+
+class HttpRemoteCache(RemoteCache):
+    """
+    Remote cache on a web server. Files are read with GET and HEAD requests
+    and written with PUT requests to URLs relative to the cache URL.
+    """
+    aliases = ['http']
+
+    # Seconds to wait for the server.
+    timeout = 30
+
+    def url(self, path):
+        return "%s/%s" % (self.location.rstrip("/"), path)
+
+    def request(self, path, method='GET', data=None):
+        request = urllib2.Request(self.url(path), data)
+        request.get_method = lambda: method
+        if data is not None:
+            request.add_header('Content-Type', 'application/octet-stream')
+        try:
+            return urllib2.urlopen(request, timeout=self.timeout)
+        except urllib2.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+        except httplib.HTTPException as e:
+            raise IOError("error talking to remote cache %s: %s" % (self.location, e))
+
+    def read(self, path):
+        response = self.request(path)
+        if response:
+            return response.read()
+
+    def exists(self, path):
+        return self.request(path, 'HEAD') is not None
+
+    def download(self, path, filepath):
+        response = self.request(path)
+        if not response:
+            return False
+        with open(filepath, 'wb') as f:
+            shutil.copyfileobj(response, f)
+        return True
+
+    def write(self, path, contents):
+        self.request(path, 'PUT', contents)
+
+    def upload(self, filepath, path):
+        with open(filepath, 'rb') as f:
+            self.request(path, 'PUT', f.read())
+
+def create_remote_cache(wrapper):
+    """
+    Returns a remote cache instance for the wrapper's remote_cache option,
+    or None if no remote cache is configured.
+    """
+    location = wrapper.remote_cache
+    if not location:
+        return None
+
+    if "://" in location:
+        scheme, path = location.split("://", 1)
+        if scheme == 'file':
+            alias, location = 'dir', path
+        elif scheme == 'https':
+            alias = 'http'
+        else:
+            alias = scheme
+    else:
+        alias = 'dir'
+
+    if not RemoteCache.plugins.get(alias):
+        msg = "no remote cache type '%s' available for remote cache '%s'"
+        raise dexy.exceptions.UserFeedback(msg % (alias, wrapper.remote_cache))
+
+    return RemoteCache.create_instance(alias, location, wrapper)
+
+class RemoteCacheRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves a directory as a remote cache over http. The directory is the
+    `root` attribute of the server.
+    """
+    def local_path(self):
+        path = self.path.split("?")[0].lstrip("/")
+        if not VALID_PATH.match(path):
+            return None
+        return os.path.join(self.server.root, *path.split("/"))
+
+    def send_file(self, include_body):
+        local_path = self.local_path()
+        if not local_path or not os.path.isfile(local_path):
+            self.send_error(404, "Not found")
+            return
+
+        with open(local_path, 'rb') as f:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            if include_body:
+                shutil.copyfileobj(f, self.wfile)
+
+    def do_GET(self):
+        self.send_file(True)
+
+    def do_HEAD(self):
+        self.send_file(False)
+
+    def do_PUT(self):
+        local_path = self.local_path()
+        if not local_path:
+            self.send_error(403, "Invalid path")
+            return
+
+        length = int(self.headers.getheader('Content-Length') or 0)
+        try:
+            os.makedirs(os.path.dirname(local_path))
+        except OSError:
+            pass
+
+        tmp_path = "%s.%s" % (local_path, uuid.uuid4())
+        with open(tmp_path, 'wb') as f:
+            f.write(self.rfile.read(length))
+        os.rename(tmp_path, local_path)
+
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        if not getattr(self.server, 'quiet', False):
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
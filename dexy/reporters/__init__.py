@@ -1,4 +0,0 @@
-import dexy.reporters.run
-import dexy.reporters.output
-import dexy.reporters.website
-import dexy.reporters.nodegraph
@@ -7,6 +7,7 @@ import os
 import random
 import shutil
 import codecs
+import dexy.iostats
 
 def link_to_doc(node):
     return """&nbsp;<a href="#%s">&darr; doc info</a>""" % node.output_data().websafe_key()
@@ -50,6 +51,14 @@ class RunReporter(Reporter):
         env_data['batch'] = wrapper.batch
         env_data['log_contents'] = log_contents
 
+        if wrapper.fileio.enabled:
+            phases = [p for p in ('setup', 'walk', 'check', 'run', 'report')
+                    if wrapper.fileio.totals('phase', p)]
+            nodes = wrapper.fileio.nodes_by_seconds()[0:20]
+            env_data['io_operations'] = dexy.iostats.OPERATIONS
+            env_data['io_phases'] = phases
+            env_data['io_rows'] = [('phase', p) for p in phases] + [('node', n) for n in nodes]
+
         def printable_args(args):
             return dict((k, v) for k, v in args.iteritems() if not k in ('contents', 'wrapper'))
 
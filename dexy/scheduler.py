@@ -0,0 +1,148 @@
+from collections import deque
+import Queue
+import dexy.exceptions
+import sys
+import threading
+
+class Scheduler(object):
+    """
+    Runs nodes on a pool of worker threads, starting each node as soon as all
+    the nodes it depends on have finished running.
+    """
+    def __init__(self, wrapper, jobs):
+        self.wrapper = wrapper
+        self.jobs = jobs
+
+    def build_graph(self, roots):
+        """
+        Returns a dict mapping every node reachable from roots to the set of
+        nodes it depends on, and a dict mapping nodes to their dependents.
+
+        A node depends on its inputs, its children and (for children of
+        pattern nodes) its parent's inputs, which is the same set of nodes
+        consulted by `check_is_cached`. ScriptNode sibling ordering is
+        captured because script members already list earlier siblings as
+        inputs.
+        """
+        depends_on = {}
+        dependents = {}
+
+        stack = list(roots)
+        while stack:
+            node = stack.pop()
+            if node in depends_on:
+                continue
+
+            node_inputs = node.input_nodes(True)
+            depends_on[node] = set(node_inputs)
+            dependents.setdefault(node, set())
+
+            for inpt in node_inputs:
+                dependents.setdefault(inpt, set()).add(node)
+                stack.append(inpt)
+
+        return depends_on, dependents
+
+    def run_node(self, node):
+        for task in node:
+            task()
+
+    def worker(self, tasks, results):
+        while True:
+            node = tasks.get()
+            if node is None:
+                break
+
+            try:
+                self.run_node(node)
+            except Exception:
+                results.put((node, sys.exc_info()))
+            else:
+                results.put((node, None))
+
+    def run(self, roots):
+        """
+        Runs all uncached nodes reachable from roots. Nodes in other states
+        (e.g. consolidated) are not sent to workers but are treated as
+        finished so their dependents can start.
+
+        Nodes which change the working directory would change it for every
+        worker, so they wait until no other nodes are running and then run
+        on this thread while nothing else is scheduled.
+        """
+        depends_on, dependents = self.build_graph(roots)
+        waiting_for = dict((node, len(deps)) for node, deps in depends_on.iteritems())
+        ready = deque(sorted(n for n, count in waiting_for.iteritems() if count == 0))
+
+        def finished(node):
+            for dependent in sorted(dependents[node]):
+                waiting_for[dependent] -= 1
+                if waiting_for[dependent] == 0:
+                    ready.append(dependent)
+
+        tasks = Queue.Queue()
+        results = Queue.Queue()
+
+        workers = []
+        for i in range(self.jobs):
+            t = threading.Thread(target=self.worker, args=(tasks, results),
+                    name="worker-%s" % (i + 1))
+            t.daemon = True
+            t.start()
+            workers.append(t)
+
+        error = None
+        in_flight = 0
+        exclusive = deque()
+
+        try:
+            while ready or exclusive or in_flight:
+                while ready and not error:
+                    node = ready.popleft()
+                    if node.state != 'uncached':
+                        self.run_node(node)
+                        finished(node)
+                    elif node.changes_working_dir():
+                        exclusive.append(node)
+                    else:
+                        self.wrapper.log.debug("scheduling %s" % node.key_with_class())
+                        tasks.put(node)
+                        in_flight += 1
+
+                if exclusive and not in_flight and not error:
+                    node = exclusive.popleft()
+                    self.wrapper.log.debug("running %s on its own" % node.key_with_class())
+                    try:
+                        self.run_node(node)
+                    except Exception:
+                        error = sys.exc_info()
+                        self.wrapper.current_task = node
+                    else:
+                        finished(node)
+                    continue
+
+                if not in_flight:
+                    break
+
+                node, exc_info = results.get()
+                in_flight -= 1
+
+                if exc_info:
+                    if not error:
+                        error = exc_info
+                        self.wrapper.current_task = node
+                else:
+                    finished(node)
+
+        finally:
+            for t in workers:
+                tasks.put(None)
+            for t in workers:
+                t.join()
+
+        if error:
+            raise error[0], error[1], error[2]
+
+        blocked = [n.key_with_class() for n, count in waiting_for.iteritems() if count > 0]
+        if blocked:
+            raise dexy.exceptions.CircularDependency(", ".join(sorted(blocked)))
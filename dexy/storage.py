@@ -1,10 +1,10 @@
 from dexy.exceptions import UserFeedback
 from dexy.exceptions import InternalDexyProblem
+from dexy.utils import break_hardlink
 from dexy.utils import file_exists
 import dexy.exceptions
 import dexy.plugin
 import os
-import shutil
 import sqlite3
 
 class Storage(dexy.plugin.Plugin):
@@ -43,9 +43,9 @@ class GenericStorage(Storage):
         Location of data file.
         """
         if read:
-            if os.path.exists(self.this_data_file()):
+            if self.wrapper.fileio.exists(self.this_data_file()):
                 return self.this_data_file()
-            elif os.path.exists(self.last_data_file()):
+            elif self.wrapper.fileio.exists(self.last_data_file()):
                 return self.last_data_file()
             else:
                 return self.this_data_file()
@@ -66,15 +66,15 @@ class GenericStorage(Storage):
 
     def data_file_exists(self, this):
         if this:
-            return os.path.exists(self.this_data_file())
+            return self.wrapper.fileio.exists(self.this_data_file())
         else:
-            return os.path.exists(self.last_data_file())
+            return self.wrapper.fileio.exists(self.last_data_file())
 
     def data_file_size(self, this):
         if this:
-            return os.path.getsize(self.this_data_file())
+            return self.wrapper.fileio.getsize(self.this_data_file())
         else:
-            return os.path.getsize(self.last_data_file())
+            return self.wrapper.fileio.getsize(self.last_data_file())
 
     def storage_dir(self, this=None):
         if this is None:
@@ -87,24 +87,58 @@ class GenericStorage(Storage):
         
         return os.path.join(cache_dir, self.storage_key[0:2])
 
+    def ensure_storage_dir(self):
+        """
+        Creates the cache subdirectory for this storage's data file if needed.
+        """
+        self.wrapper.ensure_dir(os.path.dirname(self.this_data_file()))
+
     def write_data(self, data, filepath=None):
         if not filepath:
             filepath = self.data_file(read=False)
+            self.ensure_storage_dir()
 
         self.assert_location_is_in_project_dir(filepath)
+        break_hardlink(filepath)
 
-        if os.path.exists(self.this_data_file()) and not filepath == self.this_data_file():
-            shutil.copyfile(self.this_data_file(), filepath)
+        if self.wrapper.fileio.exists(self.this_data_file()) and not filepath == self.this_data_file():
+            self.wrapper.fileio.copyfile(self.this_data_file(), filepath)
+        elif not isinstance(data, unicode):
+            self.wrapper.fileio.write(filepath, data)
         else:
-             with open(filepath, "wb") as f:
-                 if not isinstance(data, unicode):
-                     f.write(data)
-                 else:
-                     f.write(unicode(data).encode("utf-8"))
+            self.wrapper.fileio.write(filepath, unicode(data).encode("utf-8"))
 
     def read_data(self):
-        with open(self.data_file(read=True), "rb") as f:
-            return f.read()
+        filepath = self.data_file(read=True)
+        self.record_access(filepath)
+        return self.wrapper.fileio.read(filepath)
+
+    def record_access(self, filepath):
+        """
+        Notes that the data file has been used, for deciding which stored
+        output to remove when the cache is over its size budget.
+        """
+        cas = getattr(self.wrapper, 'cas', None)
+        if cas:
+            cas.record_access(filepath)
+
+    def restore_from_cas(self, content_address, alias=None):
+        """
+        Links output stored under content_address in the content-addressed
+        store into place as this storage's data file. Returns a boolean
+        indicating whether stored output was found. The alias of the filter
+        which created the output is recorded for reporting.
+        """
+        return self.wrapper.cas.restore(content_address, self.data_file(read=False), alias)
+
+    def save_to_cas(self, content_address, alias=None):
+        """
+        Adds this storage's data file to the content-addressed store as the
+        output for content_address.
+        """
+        filepath = self.data_file(read=False)
+        if self.wrapper.fileio.exists(filepath):
+            self.wrapper.cas.store(content_address, filepath, alias)
 
     def copy_file(self, filepath):
         """
@@ -113,7 +147,7 @@ class GenericStorage(Storage):
         try:
             self.assert_location_is_in_project_dir(filepath)
             this = (self.wrapper.state in ('walked', 'running', 'ran',))
-            shutil.copyfile(self.data_file(this), filepath)
+            self.wrapper.fileio.copyfile(self.data_file(this), filepath)
             return True
         except:
             return False
@@ -127,21 +161,23 @@ class JsonSectionedStorage(GenericStorage):
     aliases = ['jsonsectioned']
 
     def read_data(self, this=True):
-        with open(self.data_file(this), "rb") as f:
-            data = json.load(f)
-            if hasattr(data, 'keys'):
-                msg = "Data storage format has changed. Please clear your dexy cache by running dexy with '-r' option."
-                raise UserFeedback(msg)
-            return data
+        filepath = self.data_file(this)
+        self.record_access(filepath)
+        data = json.loads(self.wrapper.fileio.read(filepath))
+        if hasattr(data, 'keys'):
+            msg = "Data storage format has changed. Please clear your dexy cache by running dexy with '-r' option."
+            raise UserFeedback(msg)
+        return data
 
     def write_data(self, data, filepath=None):
         if not filepath:
             filepath = self.data_file()
+            self.ensure_storage_dir()
 
         self.assert_location_is_in_project_dir(filepath)
+        break_hardlink(filepath)
 
-        with open(filepath, "wb") as f:
-            json.dump(data, f)
+        self.wrapper.fileio.write(filepath, json.dumps(data))
 
 # Key Value Data
 class JsonKeyValueStorage(GenericStorage):
@@ -172,8 +208,9 @@ class JsonKeyValueStorage(GenericStorage):
         return self.data().iteritems()
 
     def read_data(self, this=True):
-        with open(self.data_file(this), "rb") as f:
-            return json.load(f)
+        filepath = self.data_file(this)
+        self.record_access(filepath)
+        return json.loads(self.wrapper.fileio.read(filepath))
 
     def data(self):
         if len(self._data) == 0:
@@ -186,11 +223,12 @@ class JsonKeyValueStorage(GenericStorage):
     def write_data(self, data, filepath=None):
         if not filepath:
             filepath = self.data_file()
+            self.ensure_storage_dir()
 
         self.assert_location_is_in_project_dir(filepath)
+        break_hardlink(filepath)
 
-        with open(filepath, "wb") as f:
-            json.dump(data, f)
+        self.wrapper.fileio.write(filepath, json.dumps(data))
 
 class Sqlite3KeyValueStorage(GenericStorage):
     """
@@ -212,7 +250,7 @@ class Sqlite3KeyValueStorage(GenericStorage):
         if self.wrapper.state in ('walked', 'checked', 'running'):
             if file_exists(self.this_data_file()):
                 self.connected_to = 'existing'
-                self._storage = sqlite3.connect(self.this_data_file())
+                self._storage = sqlite3.connect(self.this_data_file(), check_same_thread=False)
                 self._cursor = self._storage.cursor()
             elif file_exists(self.last_data_file()):
                 msg ="Should not only have last data file %s"
@@ -220,22 +258,36 @@ class Sqlite3KeyValueStorage(GenericStorage):
                 raise dexy.exceptions.InternalDexyProblem(msg % msgargs)
             else:
                 assert not os.path.exists(self.working_file())
-                assert os.path.exists(os.path.dirname(self.working_file()))
+                self.wrapper.ensure_dir(os.path.dirname(self.working_file()))
                 self.connected_to = 'working'
-                self._storage = sqlite3.connect(self.working_file())
+                self._storage = sqlite3.connect(self.working_file(), check_same_thread=False)
                 self._cursor = self._storage.cursor()
                 self._cursor.execute("CREATE TABLE kvstore (key TEXT, value TEXT)")
         elif self.wrapper.state == 'walked':
             raise dexy.exceptions.InternalDexyProblem("connect should not be called in 'walked' state")
         else:
-            if file_exists(self.last_data_file()):
-                self._storage = sqlite3.connect(self.last_data_file())
-                self._cursor = self._storage.cursor()
-            elif file_exists(self.this_data_file()):
-                self._storage = sqlite3.connect(self.this_data_file())
-                self._cursor = self._storage.cursor()
+            # Data is only read once the run has finished, connections are
+            # opened on first use and shared between data objects.
+            self.connected_to = None
+            self._storage = None
+            self._cursor = None
+
+    def read_only_file(self):
+        if file_exists(self.last_data_file()):
+            return self.last_data_file()
+        elif file_exists(self.this_data_file()):
+            return self.this_data_file()
+        else:
+            raise dexy.exceptions.InternalDexyProblem("no data for %s" % self.storage_key)
+
+    def cursor(self):
+        if getattr(self, '_cursor', None) is None:
+            if self.wrapper.state in ('walked', 'checked', 'running'):
+                self.connect()
             else:
-                raise dexy.exceptions.InternalDexyProblem("no data for %s" % self.storage_key)
+                self._storage = self.wrapper.sqlite_connection(self.read_only_file())
+                self._cursor = self._storage.cursor()
+        return self._cursor
 
     def append(self, key, value):
         self._cursor.execute("INSERT INTO kvstore VALUES (?, ?)", (key, value))
@@ -246,28 +298,32 @@ class Sqlite3KeyValueStorage(GenericStorage):
             self._append_counter = 0
 
     def keys(self):
-        self._cursor.execute("SELECT key from kvstore")
-        return [unicode(k[0]) for k in self._cursor.fetchall()]
+        cursor = self.cursor()
+        cursor.execute("SELECT key from kvstore")
+        return [unicode(k[0]) for k in cursor.fetchall()]
 
     def iteritems(self):
-        self._cursor.execute("SELECT key, value from kvstore")
-        for k in self._cursor.fetchall():
+        cursor = self.cursor()
+        cursor.execute("SELECT key, value from kvstore")
+        for k in cursor.fetchall():
             yield (unicode(k[0]), k[1])
 
     def items(self):
         return [(key, value) for (key, value) in self.iteritems()]
 
     def value(self, key):
-        self._cursor.execute("SELECT value from kvstore where key = ?", (key,))
-        row = self._cursor.fetchone()
+        cursor = self.cursor()
+        cursor.execute("SELECT value from kvstore where key = ?", (key,))
+        row = cursor.fetchone()
         if not row:
             raise Exception("No value found for key '%s'" % key)
         else:
             return row[0]
 
     def like(self, key):
-        self._cursor.execute("SELECT value from kvstore where key LIKE ?", (key,))
-        row = self._cursor.fetchone()
+        cursor = self.cursor()
+        cursor.execute("SELECT value from kvstore where key LIKE ?", (key,))
+        row = cursor.fetchone()
         if not row:
             raise Exception("No value found for key '%s'" % key)
         else:
@@ -276,8 +332,9 @@ class Sqlite3KeyValueStorage(GenericStorage):
     def query(self, query):
         if not '%' in query:
             query = "%%%s%%" % query
-        self._cursor.execute("SELECT * from kvstore where key like ?", (query,))
-        return self._cursor.fetchall()
+        cursor = self.cursor()
+        cursor.execute("SELECT * from kvstore where key like ?", (query,))
+        return cursor.fetchall()
 
     def __getitem__(self, key):
         return self.value(key)
@@ -288,7 +345,9 @@ class Sqlite3KeyValueStorage(GenericStorage):
         elif self.connected_to == 'working':
             self.assert_location_is_in_project_dir(self.data_file(read=False))
             self._storage.commit()
-            shutil.copyfile(self.working_file(), self.data_file(read=False))
+            self.ensure_storage_dir()
+            break_hardlink(self.data_file(read=False))
+            self.wrapper.fileio.copyfile(self.working_file(), self.data_file(read=False))
         else:
             msg = "Unexpected 'connected_to' value %s"
             msgargs = self.connected_to
@@ -0,0 +1,129 @@
+"""
+Timeline of a dexy run in the Chrome trace event format, which can be
+opened in Perfetto (https://ui.perfetto.dev) or chrome://tracing.
+
+When the trace option is set, spans are recorded for each wrapper phase,
+each node and filter which runs, each subprocess started by a filter and
+each reporter, and written to trace.json in the artifacts directory. Spans
+are recorded on the thread they ran on, so with the jobs option each
+worker thread gets its own track.
+"""
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+class NullTracer(object):
+    """
+    Tracer used when tracing is off, which records nothing.
+    """
+    enabled = False
+
+    @contextmanager
+    def span(self, name, category, **args):
+        yield args
+
+    def add_span(self, name, category, start, end, **args):
+        pass
+
+    def save(self):
+        pass
+
+class Tracer(object):
+    """
+    Records spans as complete ('X') trace events.
+    """
+    enabled = True
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.pid = os.getpid()
+        self.start_time = time.time()
+        self.events = []
+        self.thread_ids = {}
+        self.lock = threading.Lock()
+
+    def filename(self):
+        return os.path.join(self.wrapper.artifacts_dir, 'trace.json')
+
+    def microseconds(self, t):
+        return int((t - self.start_time) * 1000000)
+
+    def thread_id(self):
+        """
+        Returns a small integer id for the current thread, trace viewers
+        list threads in order of their ids.
+        """
+        thread = threading.current_thread()
+        if not thread.ident in self.thread_ids:
+            self.thread_ids[thread.ident] = (len(self.thread_ids), thread.name)
+        return self.thread_ids[thread.ident][0]
+
+    @contextmanager
+    def span(self, name, category, **args):
+        start = time.time()
+        try:
+            yield args
+        finally:
+            self.add_span(name, category, start, time.time(), **args)
+
+    def add_span(self, name, category, start, end, **args):
+        """
+        Records a span which started and ended at the times (as returned by
+        time.time()) on the current thread.
+        """
+        event = {
+                'name' : name,
+                'cat' : category,
+                'ph' : 'X',
+                'ts' : self.microseconds(start),
+                'dur' : self.microseconds(end) - self.microseconds(start),
+                'pid' : self.pid,
+                'args' : args
+                }
+        with self.lock:
+            event['tid'] = self.thread_id()
+            self.events.append(event)
+
+    def metadata_events(self):
+        events = [{
+            'name' : 'process_name',
+            'ph' : 'M',
+            'pid' : self.pid,
+            'args' : { 'name' : 'dexy' }
+            }]
+        for tid, thread_name in self.thread_ids.itervalues():
+            events.append({
+                'name' : 'thread_name',
+                'ph' : 'M',
+                'pid' : self.pid,
+                'tid' : tid,
+                'args' : { 'name' : thread_name }
+                })
+        return events
+
+    def save(self):
+        """
+        Writes the trace recorded so far. Called at the end of each wrapper
+        phase, so the trace is complete whichever phase dexy stops after.
+        """
+        if not os.path.isdir(self.wrapper.artifacts_dir):
+            return
+
+        with self.lock:
+            trace = {
+                    'traceEvents' : self.metadata_events() + self.events,
+                    'displayTimeUnit' : 'ms'
+                    }
+
+        tmp_filename = "%s.tmp" % self.filename()
+        with open(tmp_filename, 'w') as f:
+            json.dump(trace, f)
+        os.rename(tmp_filename, self.filename())
+
+def create_tracer(wrapper):
+    if wrapper.trace:
+        return Tracer(wrapper)
+    else:
+        return NullTracer()
@@ -21,10 +21,11 @@ def copy_or_link(data, destination, use_links=False, read_only_links=True):
     if is_windows or not use_links:
         data.output_to_file(destination)
     else:
-        os.link(data.storage.data_file(), destination)
+        data.wrapper.fileio.link(data.storage.data_file(), destination)
 
 defaults = {
     'artifacts_dir' : '.dexy',
+    'cache_max_size' : '',
     'config_file' : 'dexy.conf',
     'configs' : '',
     'debug' : False,
@@ -39,6 +40,8 @@ defaults = {
     'hashfunction' : 'md5',
     'ignore_nonzero_exit' : False,
     'include' : '',
+    'iostats' : False,
+    'jobs' : 1,
     'log_dir' : '.dexy',
     'log_file' : 'dexy.log',
     'log_format' : "%(name)s - %(levelname)s - %(message)s",
@@ -48,7 +51,9 @@ defaults = {
     'pickle' : 'c',
     'plugins': 'dexyplugins.py dexyplugin.py dexyplugins.yaml dexyplugin.yaml',
     'profile' : False,
+    'profile_filters' : False,
     'recurse' : True,
+    'remote_cache' : '',
     'reports' : '',
     'safety_filename' : '.dexy-generated',
     'siblings' : False,
@@ -56,6 +61,7 @@ defaults = {
     'strace' : False,
     'target' : False,
     'timing' : True,
+    'trace' : False,
     'uselocals' : False,
     'writeanywhere' : False
 }
@@ -108,9 +114,77 @@ def logging_log_level(log_level):
         msg = "'%s' is not a valid log level, check python logging module docs"
         raise dexy.exceptions.UserFeedback(msg % log_level)
 
+size_units = {
+    '' : 1,
+    'K' : 1024,
+    'M' : 1024 ** 2,
+    'G' : 1024 ** 3,
+    'T' : 1024 ** 4
+}
+
+def parse_size(size):
+    """
+    Returns number of bytes given a size like 500, '500K', '20M' or '1.5G'.
+    """
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*$", str(size), re.IGNORECASE)
+    if not match:
+        msg = "'%s' is not a valid size, use a number of bytes optionally followed by K, M, G or T"
+        raise dexy.exceptions.UserFeedback(msg % size)
+    number, unit = match.groups()
+    return int(float(number) * size_units[unit.upper()])
+
+def parallel_map(fn, items, threads=16, min_items=64):
+    """
+    Returns [fn(item) for item in items], calling fn from a pool of threads
+    when there are enough items to make it worthwhile. Intended for file
+    system calls, which can be slow on network file systems and release the
+    GIL while waiting.
+    """
+    items = list(items)
+    if len(items) < min_items or threads < 2:
+        return [fn(item) for item in items]
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(threads)
+    try:
+        return pool.map(fn, items, chunksize=max(1, len(items) // (threads * 4)))
+    finally:
+        pool.close()
+        pool.join()
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    else:
+        return (values[mid - 1] + values[mid]) / 2.0
+
 def md5_hash(text):
     return hashlib.md5(text).hexdigest()
 
+def file_digest(filepath):
+    """
+    Returns md5 hex digest of a file's contents, read in chunks.
+    """
+    h = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), ''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def break_hardlink(filepath):
+    """
+    Removes filepath if it is hard linked from elsewhere (e.g. from the
+    content-addressed store), so writing to filepath afterwards can't modify
+    the contents seen via the other links.
+    """
+    try:
+        if os.stat(filepath).st_nlink > 1:
+            os.remove(filepath)
+    except OSError:
+        pass
+
 def dict_from_string(text):
     """
     Creates a dict from string like "key1=value1,k2=v2"
@@ -257,35 +331,52 @@ def parse_json_from_file(f):
         msg += unicode(e)
         raise dexy.exceptions.UserFeedback(msg)
 
+# Use libyaml's much faster parser if pyyaml was built with it.
+YamlSafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+def is_tab_before_mark(input_text, mark):
+    """
+    Returns a boolean indicating whether there is a hard tab on the line of a
+    YAML parser error, up to and including the position of the error.
+    """
+    if mark is None:
+        return False
+    lines = input_text.splitlines()
+    return mark.line < len(lines) and "\t" in lines[mark.line][:mark.column+1]
+
+def yaml_error(input_text, e):
+    """
+    Returns a UserFeedback exception explaining the YAML parser error e.
+    """
+    if "found character '\\t'" in unicode(e) or is_tab_before_mark(input_text, e.problem_mark):
+        msg = "You appear to have hard tabs in your yaml, this is not supported. Please change to using soft tabs instead (your text editor should have this option)."
+        return dexy.exceptions.UserFeedback(msg)
+    else:
+        msg = inspect.cleandoc(u"""Was unable to parse the YAML you supplied.
+        Here is information from the YAML parser:""")
+        msg += u"\n"
+        msg += unicode(e)
+        return dexy.exceptions.UserFeedback(msg)
+
 def parse_yaml(input_text):
     """
     Parse a single YAML document.
     """
     try:
-        return yaml.safe_load(input_text)
+        return yaml.load(input_text, Loader=YamlSafeLoader)
     except (yaml.scanner.ScannerError, yaml.parser.ParserError) as e:
-        if "found character '\\t'" in unicode(e):
-            msg = "You appear to have hard tabs in your yaml, this is not supported. Please change to using soft tabs instead (your text editor should have this option)."
-            raise dexy.exceptions.UserFeedback(msg)
-        else:
-            msg = inspect.cleandoc(u"""Was unable to parse the YAML you supplied.
-            Here is information from the YAML parser:""")
-            msg += u"\n"
-            msg += unicode(e)
-            raise dexy.exceptions.UserFeedback(msg)
+        raise yaml_error(input_text, e)
 
 def parse_yamls(input_text):
     """
-    Parse YAML content that may include more than 1 document.
+    Parse YAML content that may include more than 1 document. Returns a list
+    of the documents.
     """
     try:
-        return yaml.safe_load_all(input_text)
+        # load_all is lazy, errors are only raised as documents are parsed
+        return list(yaml.load_all(input_text, Loader=YamlSafeLoader))
     except (yaml.scanner.ScannerError, yaml.parser.ParserError) as e:
-        msg = inspect.cleandoc(u"""Was unable to parse the YAML you supplied.
-        Here is information from the YAML parser:""")
-        msg += u"\n"
-        msg += unicode(e)
-        raise dexy.exceptions.UserFeedback(msg)
+        raise yaml_error(input_text, e)
 
 def printable_for_char(c):
     if ord(c) >= ord('!'):
@@ -0,0 +1,267 @@
+"""
+Watches the project directory for changes to files, using inotify where
+available and falling back to polling elsewhere.
+"""
+from dexy.utils import os_to_posix
+from stat import S_ISDIR
+import ctypes
+import ctypes.util
+import errno
+import os
+import posixpath
+import select
+import struct
+import time
+
+def watched_dirs(exclude, include):
+    """
+    Yields directories in the project which dexy looks at for documents, this
+    honors the same exclude dirs and .nodexy files as the filemap.
+    """
+    dirpaths = ['.']
+    while dirpaths:
+        dirpath = dirpaths.pop()
+        try:
+            names = os.listdir(dirpath)
+        except OSError:
+            continue
+
+        if '.nodexy' in names:
+            continue
+
+        yield dirpath
+
+        for name in names:
+            subdir = os.path.join(dirpath, name)
+            if os.path.isdir(subdir):
+                if name in exclude and not name in include:
+                    continue
+                dirpaths.append(subdir)
+
+# Returned in place of file paths when it's not known what changed.
+EVERYTHING = '.'
+
+def normalize(dirpath, name):
+    return os_to_posix(posixpath.normpath(posixpath.join(os_to_posix(dirpath), name)))
+
+class Watcher(object):
+    """
+    Base class for watchers. The `wait` method blocks until something has
+    changed and returns the set of changed file paths, which are relative to
+    the project root and in the same form as keys of the wrapper's filemap.
+    """
+    # Wait for this many seconds without further changes before returning,
+    # so a burst of changes (e.g. an editor saving a file) is handled at once.
+    settle_time = 0.2
+
+    def __init__(self, exclude, include):
+        self.exclude = exclude
+        self.include = include
+
+    def wait(self, timeout=None):
+        changes = self.poll_changes(timeout)
+        while changes:
+            more_changes = self.poll_changes(self.settle_time)
+            if not more_changes:
+                break
+            changes.update(more_changes)
+        return changes
+
+    def poll_changes(self, timeout):
+        """
+        Returns the set of paths which have changed, waiting up to timeout
+        seconds for a change. The base class never sees any changes.
+        """
+        return set()
+
+    def close(self):
+        pass
+
+class PollingWatcher(Watcher):
+    """
+    Detects changes by comparing the size and modification time of each file
+    to a snapshot taken on the previous check.
+    """
+    interval = 1.0
+
+    def __init__(self, exclude, include):
+        super(PollingWatcher, self).__init__(exclude, include)
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = {}
+        for dirpath in watched_dirs(self.exclude, self.include):
+            try:
+                names = os.listdir(dirpath)
+            except OSError:
+                continue
+            for name in names:
+                ospath = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(ospath)
+                except OSError:
+                    continue
+                if not S_ISDIR(stat.st_mode):
+                    snapshot[normalize(dirpath, name)] = (stat.st_size, stat.st_mtime)
+        return snapshot
+
+    def poll_changes(self, timeout):
+        start = time.time()
+        while True:
+            snapshot = self.take_snapshot()
+            changes = set(path for path, info in snapshot.iteritems()
+                    if self.snapshot.get(path) != info)
+            changes.update(path for path in self.snapshot if not path in snapshot)
+            self.snapshot = snapshot
+
+            if changes:
+                return changes
+            elif timeout is not None and time.time() - start >= timeout:
+                return set()
+            else:
+                time.sleep(min(self.interval, timeout or self.interval))
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+        IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+EVENT_HEADER = struct.Struct("iIII")
+
+def load_libc():
+    libc_name = ctypes.util.find_library('c')
+    if not libc_name:
+        return None
+    try:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init'):
+        return None
+    return libc
+
+class InotifyWatcher(Watcher):
+    """
+    Watches every directory in the project with inotify (Linux only).
+    """
+    def __init__(self, exclude, include, libc):
+        super(InotifyWatcher, self).__init__(exclude, include)
+        self.libc = libc
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        self.dirs_by_wd = {}
+        for dirpath in watched_dirs(exclude, include):
+            self.add_watch(dirpath)
+
+    def add_watch(self, dirpath):
+        wd = self.libc.inotify_add_watch(self.fd, dirpath, WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                msg = "inotify watch limit reached, increase fs.inotify.max_user_watches"
+                raise OSError(err, msg)
+            # directory may have been removed already
+            return
+        self.dirs_by_wd[wd] = dirpath
+
+    def read_events(self):
+        buf = os.read(self.fd, 65536)
+        i = 0
+        while i < len(buf):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buf, i)
+            i += EVENT_HEADER.size
+            name = buf[i:i+length].rstrip("\0")
+            i += length
+            yield wd, mask, name
+
+    def poll_changes(self, timeout):
+        try:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return set()
+            raise
+
+        if not ready:
+            return set()
+
+        changes = set()
+        for wd, mask, name in self.read_events():
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, so anything may have changed
+                changes.add(EVERYTHING)
+                continue
+
+            dirpath = self.dirs_by_wd.get(wd)
+            if dirpath is None:
+                continue
+
+            if mask & IN_IGNORED:
+                del self.dirs_by_wd[wd]
+                continue
+
+            if not name:
+                continue
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    if not (name in self.exclude and not name in self.include):
+                        self.add_new_dir(os.path.join(dirpath, name), changes)
+                continue
+
+            changes.add(normalize(dirpath, name))
+
+        return changes
+
+    def add_new_dir(self, dirpath, changes):
+        """
+        Watches a newly created directory and reports files already in it.
+        """
+        try:
+            names = os.listdir(dirpath)
+        except OSError:
+            return
+
+        if '.nodexy' in names:
+            return
+
+        self.add_watch(dirpath)
+
+        for name in names:
+            subpath = os.path.join(dirpath, name)
+            if os.path.isdir(subpath):
+                if not (name in self.exclude and not name in self.include):
+                    self.add_new_dir(subpath, changes)
+            else:
+                changes.add(normalize(dirpath, name))
+
+    def close(self):
+        os.close(self.fd)
+
+def create_watcher(wrapper, poll=False):
+    """
+    Returns an inotify watcher if possible, otherwise a polling watcher.
+    """
+    exclude = wrapper.exclude_dirs()
+    include = wrapper.include
+
+    if not poll:
+        libc = load_libc()
+        if libc:
+            try:
+                return InotifyWatcher(exclude, include, libc)
+            except OSError as e:
+                wrapper.log.warn("can't use inotify, falling back to polling: %s" % e)
+
+    return PollingWatcher(exclude, include)
@@ -2,20 +2,34 @@ from dexy.exceptions import DeprecatedException
 from dexy.exceptions import InternalDexyProblem
 from dexy.exceptions import UserFeedback
 from dexy.utils import file_exists
+from dexy.utils import is_windows
 from dexy.utils import s
+from contextlib import contextmanager
 import chardet
 import dexy.batch
+import dexy.cas
 import dexy.doc
+import dexy.filemap
+import dexy.iostats
+import dexy.fingerprint
+import dexy.manifest
+import dexy.node
 import dexy.parser
+import dexy.profiler
+import dexy.reaper
 import dexy.reporter
+import dexy.scheduler
+import dexy.trace
 import dexy.utils
 import logging
 import logging.handlers
 import os
 import posixpath
 import shutil
+import sqlite3
 import sys
 import textwrap
+import threading
 import time
 import uuid
 
@@ -35,6 +49,7 @@ class Wrapper(object):
             ('checked', 'running'),
             ('running', 'error'),
             ('running', 'ran'),
+            ('ran', 'checked'),
             )
 
     def printmsg(self, msg):
@@ -82,11 +97,33 @@ class Wrapper(object):
         self.project_root = os.path.abspath(os.getcwd())
         self.project_root_ts = "%s%s" % (self.project_root, os.sep)
         self.state = None
+        self._thread_state = threading.local()
         self.current_task = None
         self.lookup_nodes = {} # map of shortcuts/keys to all nodes which can match
         self.lookup_sections = {} # map of section names to nodes
+        self.known_dirs = set() # dirs which are known to exist
+        self._batch_db = None
+        self._sqlite_connections = {} # path : (inode, mtime, read-only connection to sqlite3 data file)
+        self._sqlite_lock = threading.Lock()
+        self.input_index = dexy.node.InputIndex()
+        self._glob_index = None
+        self.tracer = dexy.trace.create_tracer(self)
+        self.fileio = dexy.iostats.create_file_io(self)
+        self.filter_profiler = dexy.profiler.create_filter_profiler(self)
         self.transition('new')
 
+    @property
+    def current_task(self):
+        """
+        The node being run by the current thread, which is named if an error
+        occurs. Each worker thread has its own.
+        """
+        return getattr(self._thread_state, 'current_task', None)
+
+    @current_task.setter
+    def current_task(self, node):
+        self._thread_state.current_task = node
+
     def state_message(self):
         """
         A message to print at end of dexy run depending on the final wrapper state.
@@ -102,40 +139,75 @@ class Wrapper(object):
     def setup_for_valid(self):
         self.setup_log()
 
+    @contextmanager
+    def traced_phase(self, name):
+        """
+        Records a span for a phase of the run if tracing, and writes the
+        trace when the phase ends. File I/O during the phase is accounted to
+        it, and added to the span if counting I/O.
+        """
+        try:
+            with self.tracer.span(name, 'phase') as args:
+                with self.fileio.phase(name):
+                    yield
+                args.update(self.fileio.summary('phase', name))
+        finally:
+            self.tracer.save()
+
     def to_valid(self):
         if not self.dexy_dirs_exist():
             msg = "Should not attempt to enter 'valid' state unless dexy dirs exist."
             raise dexy.exceptions.InternalDexyProblem(msg)
-        self.setup_for_valid()
+        with self.traced_phase('setup'):
+            self.setup_for_valid()
         self.transition('valid')
 
     def walk(self):
         self.nodes = {}
         self.roots = []
         self.batch = dexy.batch.Batch(self)
+        self.input_index.clear()
         self.filemap = self.map_files()
         self.ast = self.parse_configs()
         self.ast.walk()
 
     def to_walked(self):
-        self.walk()
+        with self.traced_phase('walk'):
+            self.walk()
         self.transition('walked')
 
     def check(self):
+        # Reclaim any trash left behind by an interrupted run.
+        self.empty_trash_in_background()
+
         # Clean and reset working dirs.
         self.reset_work_cache_dir()
-        if not os.path.exists(self.this_cache_dir()):
-            self.create_cache_dir_with_sub_dirs(self.this_cache_dir())
-
-        # Load information about arguments from previous batch.
-        self.load_node_argstrings()
+        self.remove_legacy_cache_dirs()
+        self.load_known_cache_dirs()
 
+        self.load_cache_info()
         self.check_cache()
         self.consolidate_cache()
 
         # Save information about this batch's arguments for next time.
         self.save_node_argstrings()
 
+    def load_cache_info(self):
+        """
+        Loads information about arguments and contents from the previous
+        batch, which is needed to check which docs are cached.
+        """
+        self.load_node_argstrings()
+        self.fingerprints = dexy.fingerprint.Fingerprints(self)
+        self.fingerprints.load()
+        self.cas = dexy.cas.ContentAddressedStore(self)
+        self.cache_manifest = dexy.manifest.CacheManifest(self)
+        self.cache_manifest.load()
+
+        # Checking for changes needs stat results for each doc's file.
+        dexy.filemap.prefetch_stats(self.filemap[doc.name]
+                for doc in self.documents() if doc.name in self.filemap)
+
     def check_cache(self):
         """
         Check whether all required files are already cached from a previous run
@@ -145,23 +217,39 @@ class Wrapper(object):
 
     def consolidate_cache(self):
         """
-        Move all cache files from last/ cache to this/ cache
+        Prepare cached docs for use in this run and clear out stale cache
+        files of docs which will be re-run.
         """
         for node in self.roots:
             node.consolidate_cache_files()
 
-        self.trash(self.last_cache_dir())
+        self.cache_manifest.forget(node.key_with_class()
+                for node in self.nodes.values()
+                if node.state == 'uncached')
 
     def to_checked(self):
-        self.check()
+        with self.traced_phase('check'):
+            self.check()
         self.transition('checked')
 
     # Cache dirs
+    def cache_dir(self):
+        return os.path.join(self.artifacts_dir, "cache")
+
     def this_cache_dir(self):
-        return os.path.join(self.artifacts_dir, "this")
+        # 'this' and 'last' are generations within the same cache dir, see
+        # dexy.manifest.CacheManifest
+        return self.cache_dir()
 
     def last_cache_dir(self):
-        return os.path.join(self.artifacts_dir, "last")
+        return self.cache_dir()
+
+    def legacy_cache_dirs(self):
+        return [os.path.join(self.artifacts_dir, d) for d in ("this", "last")]
+
+    def legacy_batch_files(self):
+        # batch info and node args used to be pickled, now in batch database
+        return [os.path.join(self.artifacts_dir, f) for f in ("batches", "batch.args.pickle")]
 
     def work_cache_dir(self):
         return os.path.join(self.artifacts_dir, "work")
@@ -169,12 +257,28 @@ class Wrapper(object):
     def trash_dir(self):
         return os.path.join(self.project_root, ".trash")
 
-    def create_cache_dir_with_sub_dirs(self, cache_dir):
-        os.mkdir(cache_dir)
-        hexes = ['0','1','2','3','4','5','6','7','8','9','a','b','c','d','e','f']
-        for c in hexes:
-            for d in hexes:
-                os.mkdir(os.path.join(cache_dir, "%s%s" % (c,d)))
+    def ensure_dir(self, dirpath):
+        """
+        Creates dirpath if it does not exist. Subdirectories of the cache dirs
+        are created on first write rather than up front, dirs which are known
+        to exist are remembered so each is only created once.
+        """
+        if dirpath in self.known_dirs:
+            return
+
+        try:
+            os.makedirs(dirpath)
+        except OSError:
+            if not os.path.isdir(dirpath):
+                raise
+
+        self.known_dirs.add(dirpath)
+
+    def load_known_cache_dirs(self):
+        cache_dir = self.cache_dir()
+        self.ensure_dir(cache_dir)
+        for d in os.listdir(cache_dir):
+            self.known_dirs.add(os.path.join(cache_dir, d))
 
     def trash(self, d):
         """
@@ -208,17 +312,43 @@ class Wrapper(object):
             if not no_such_dir and not dir_not_empty:
                 raise
 
+    def remove_legacy_cache_dirs(self):
+        # remove this/ and last/ dirs from dexy versions which moved files
+        # between separate cache dirs
+        for d in self.legacy_cache_dirs() + self.legacy_batch_files():
+            if os.path.exists(d):
+                self.trash(d)
+
+    def empty_trash_in_background(self):
+        """
+        Hands deletion of the .trash directory to a detached reaper process
+        so we don't have to wait for it (see dexy.reaper).
+        """
+        if is_windows:
+            self.empty_trash()
+        else:
+            dexy.reaper.start_reaper(self.trash_dir())
+
     def reset_work_cache_dir(self):
-        # remove work/ dir leftover from previous run (if any) and create a new
-        # work/ dir for this run
+        # move work/ dir leftover from previous run (if any) to the trash and
+        # create a new empty work/ dir for this run
         work_dir = self.work_cache_dir()
         self.trash(work_dir)
-        self.create_cache_dir_with_sub_dirs(work_dir)
+        self.known_dirs.discard(work_dir)
+        self.known_dirs = set(d for d in self.known_dirs
+                if not d.startswith(work_dir + os.sep))
+        self.ensure_dir(work_dir)
 
     def run(self):
+        self.filter_profiler.start()
+        with self.traced_phase('run'):
+            self.run_nodes()
+        self.filter_profiler.save_report()
+
+    def run_nodes(self):
         self.transition('running')
 
-        self.batch.start_time = time.time()
+        self.batch.start()
 
         if self.target:
             matches = self.roots_matching_target()
@@ -226,15 +356,26 @@ class Wrapper(object):
             matches = self.roots
 
         try:
-            for node in matches:
-                for task in node:
-                    task()
+            if self.jobs > 1:
+                scheduler = dexy.scheduler.Scheduler(self, self.jobs)
+                scheduler.run(matches)
+            else:
+                for node in matches:
+                    for task in node:
+                        task()
 
         except Exception as e:
+            error = sys.exc_info()
             self.error = e
             self.transition('error')
+            self.batch.abandon()
+            try:
+                self.save_history()
+            except Exception as history_error:
+                # don't hide the error which stopped the run
+                self.log.warn("unable to save run history: %s" % history_error)
             if self.debug:
-                raise
+                raise error[0], error[1], error[2]
             else:
                 if self.current_task:
                     msg = u"ERROR while running %s: %s\n" % (self.current_task.key, unicode(e))
@@ -245,15 +386,79 @@ class Wrapper(object):
 
         else:
             self.after_successful_run()
+            self.save_history()
+
+    def save_history(self):
+        """
+        Adds timings, cache use and sizes of docs and filters in this run to
+        the run history, which `dexy stats` reports on. Sizes are only
+        recorded for docs which ran, to avoid statting files of cached docs.
+        """
+        def size(data):
+            try:
+                return data.filesize(True)
+            except OSError:
+                return None
+
+        docs = []
+        for doc in self.documents():
+            if doc.state == 'ran':
+                filters = [(f.alias, f.elapsed, f.restored, f.exit_code,
+                    size(f.input_data), size(f.output_data)) for f in doc.filters]
+                docs.append((doc.key, doc.state, doc.elapsed_time,
+                    size(doc.initial_data), size(doc.output_data()), filters))
+            else:
+                filters = [(f.alias, None, None, None, None, None) for f in doc.filters]
+                docs.append((doc.key, doc.state, None, None, None, filters))
+
+        self.batch_db().save_run(self.batch.start_time, time.time(), self.state,
+                self.jobs, docs)
 
     def after_successful_run(self):
         self.transition('ran')
         self.batch.end_time = time.time()
-        self.batch.save_to_file()
-        shutil.move(self.this_cache_dir(), self.last_cache_dir())
-        self.empty_trash()
+        self.batch.save()
+        self.save_fingerprints()
+        self.save_cache_manifest()
+        self.save_cache_access()
+        self.empty_trash_in_background()
         self.add_lookups()
 
+    def save_fingerprints(self):
+        """
+        Save content fingerprints of docs whose cache is now up to date.
+        """
+        doc_keys = [node.key_with_class() for node in self.nodes.values()
+                if node.state in ('ran', 'consolidated')]
+        self.fingerprints.save(doc_keys)
+
+    def save_cache_access(self):
+        """
+        Record when stored filter output was used, and remove the least
+        recently used output if the store is over its size budget.
+        """
+        self.cas.save_access_times()
+        if self.cache_max_size:
+            max_size = dexy.utils.parse_size(self.cache_max_size)
+            n_removed, freed = self.cas.collect_garbage(max_size)
+            msg = "removed %s stored outputs (%s bytes) to keep cache under %s bytes"
+            self.log.debug(msg % (n_removed, freed, max_size))
+
+    def save_cache_manifest(self):
+        """
+        Record cache files of docs which are now up to date as the new cache
+        generation. Additional docs belong to the doc which created them.
+        """
+        owners = {}
+        for node in self.documents():
+            if node.state in ('ran', 'consolidated'):
+                owner = node
+                while owner.created_by_doc:
+                    owner = owner.created_by_doc
+                filepaths = owners.setdefault(owner.key_with_class(), [])
+                filepaths.extend(node.cache_files())
+        self.cache_manifest.save(owners)
+
     def add_lookups(self):
         for data in self.batch:
             data.add_to_lookup_sections()
@@ -304,6 +509,7 @@ class Wrapper(object):
         self.nodes = dict((node.key_with_class(), node) for node in self.roots)
         self.filemap = self.map_files()
         self.batch = dexy.batch.Batch(self)
+        self.input_index.clear()
         self.transition('walked')
 
         self.to_checked()
@@ -328,12 +534,44 @@ class Wrapper(object):
                 raise InternalDexyProblem(msg % key)
             setattr(self, key, value)
 
+        self.jobs = int(self.jobs)
+        if self.jobs < 1:
+            msg = "jobs must be at least 1, got %s" % self.jobs
+            raise UserFeedback(msg)
+
+        if self.cache_max_size:
+            dexy.utils.parse_size(self.cache_max_size)
+
     # Store Args
     def pickle_lib(self):
         return dexy.utils.pickle_lib(self)
 
-    def node_argstrings_filename(self):
-        return os.path.join(self.artifacts_dir, 'batch.args.pickle')
+    def batch_db(self):
+        """
+        Returns the batch database, which is opened on first use.
+        """
+        if self._batch_db is None:
+            self._batch_db = dexy.batch.BatchDatabase(self)
+        return self._batch_db
+
+    def sqlite_connection(self, filepath):
+        """
+        Returns a connection for reading the sqlite3 data file at filepath,
+        shared by all data objects which read this file. A new connection is
+        opened if the file has been replaced since it was last opened, and
+        the connection to the old file is closed.
+        """
+        stat = os.stat(filepath)
+        with self._sqlite_lock:
+            pooled = self._sqlite_connections.get(filepath)
+            if pooled and pooled[0:2] == (stat.st_ino, stat.st_mtime):
+                return pooled[2]
+
+            if pooled:
+                pooled[2].close()
+            conn = sqlite3.connect(filepath, check_same_thread=False)
+            self._sqlite_connections[filepath] = (stat.st_ino, stat.st_mtime, conn)
+            return conn
 
     def save_node_argstrings(self):
         """
@@ -344,21 +582,14 @@ class Wrapper(object):
         for node in self.nodes.values():
             arg_info[node.key_with_class()] = node.sorted_arg_string()
 
-        with open(self.node_argstrings_filename(), 'wb') as f:
-            pickle = self.pickle_lib()
-            pickle.dump(arg_info, f)
+        self.batch_db().save_node_args(arg_info)
 
     def load_node_argstrings(self):
         """
         Load saved node arg strings into a hash so nodes can check if their
         args have changed.
         """
-        try:
-            with open(self.node_argstrings_filename(), 'rb') as f:
-                pickle = self.pickle_lib()
-                self.saved_args = pickle.load(f)
-        except IOError:
-            self.saved_args = {}
+        self.saved_args = self.batch_db().load_node_args()
 
     # Dexy Dirs
     def iter_dexy_dirs(self):
@@ -491,7 +722,7 @@ class Wrapper(object):
         for dirpath, safety_filepath, dirstat in self.iter_dexy_dirs():
             if dirstat:
                 self.trash(dirpath)
-        self.empty_trash()
+        self.empty_trash_in_background()
 
     def remove_reports_dirs(self, reports=True, keep_empty_dir=False):
         if reports:
@@ -559,30 +790,21 @@ class Wrapper(object):
         """
         Generates a map of files present in the project directory.
         """
-        exclude = self.exclude_dirs()
-        filemap = {}
-
-        for dirpath, dirnames, filenames in os.walk('.', followlinks=True):
-            for x in exclude:
-                if x in dirnames and not x in self.include:
-                    dirnames.remove(x)
-
-            if '.nodexy' in filenames:
-                dirnames[:] = []
-            elif 'pip-delete-this-directory.txt' in filenames:
-                msg = s("""pip left an old build/ file lying around,
-                please remove this before running dexy""")
-                raise UserFeedback(msg)
-            else:
-                for filename in filenames:
-                    filepath = posixpath.normpath(posixpath.join(dirpath, filename))
-                    filemap[filepath] = {}
-                    filemap[filepath]['stat'] = os.stat(os.path.join(dirpath, filename))
-                    filemap[filepath]['ospath'] = os.path.normpath(os.path.join(dirpath, filename))
-                    filemap[filepath]['dir'] = os.path.normpath(dirpath)
-
+        index = dexy.filemap.FileMapIndex(self)
+        index.load()
+        filemap = index.map_files(self.exclude_dirs(), self.include)
+        index.save()
         return filemap
 
+    def glob_index(self):
+        """
+        Returns the index for matching glob patterns against the filemap,
+        which is built on first use after the filemap is replaced.
+        """
+        if self._glob_index is None or self._glob_index.filemap is not self.filemap:
+            self._glob_index = dexy.filemap.GlobIndex(self.filemap)
+        return self._glob_index
+
     def file_available(self, filepath):
         """
         Does the file exist and is it available to dexy?
@@ -597,6 +819,63 @@ class Wrapper(object):
         key = node.key_with_class()
         self.nodes[key] = node
 
+    def remove_node(self, node):
+        self.nodes.pop(node.key_with_class(), None)
+        self.batch.remove_doc(node)
+
+    def dependents(self):
+        """
+        Returns a dict mapping nodes to the nodes which have them as inputs
+        or children, i.e. which need to run again if they change.
+        """
+        dependents = {}
+        for node in self.nodes.values():
+            for inpt in node.input_nodes(True):
+                dependents.setdefault(inpt, set()).add(node)
+        return dependents
+
+    def affected_nodes(self, changed_nodes):
+        """
+        Returns changed_nodes and all nodes which depend on them, directly or
+        indirectly.
+        """
+        dependents = self.dependents()
+        affected = set()
+        stack = list(changed_nodes)
+        while stack:
+            node = stack.pop()
+            if not node in affected:
+                affected.add(node)
+                stack.extend(dependents.get(node, []))
+        return affected
+
+    def rerun(self, changed_filepaths):
+        """
+        After a successful run, runs docs for the files in changed_filepaths
+        again along with every node which depends on them. Everything else is
+        kept from the previous run. Files which are added or removed, or
+        changes to config files, need a new wrapper instead.
+        """
+        for filepath in changed_filepaths:
+            self.filemap[filepath].refresh()
+
+        changed_docs = [doc for doc in self.documents()
+                if doc.name in changed_filepaths and not doc.created_by_doc]
+        affected = [node for node in self.affected_nodes(changed_docs)
+                if not node.created_by_doc and node.state in ('ran', 'consolidated')]
+
+        self.transition('checked')
+        self.cache_manifest.forget(node.key_with_class() for node in affected)
+        for node in affected:
+            node.reset()
+
+        self.lookup_nodes = {}
+        self.lookup_sections = {}
+        self.current_task = None
+        self.run()
+
+        return affected
+
     def add_data_to_lookup_nodes(self, key, data):
         if not key in self.lookup_nodes:
             self.lookup_nodes[key] = []
@@ -648,7 +927,8 @@ class Wrapper(object):
         Nodes can have multiple aliases, standardize on first one in list.
         """
         # TODO should we just make it so nodes only have 1 alias?
-        node_class, _ = dexy.node.Node.plugins[alias]
+        class_or_class_name, _ = dexy.node.Node.plugins[alias]
+        node_class = dexy.node.Node.get_reference_to_class(class_or_class_name)
         return node_class.aliases[0]
 
     def standardize_key(self, key):
@@ -678,38 +958,58 @@ class Wrapper(object):
     def is_explicit_config(self, filepath):
         return filepath in self.explicit_config_files()
 
+    def config_files(self):
+        """
+        Returns a list of (parser alias, filepath, fileinfo) tuples for the
+        config files to be parsed, in the order in which they are parsed.
+        """
+        aliases = self.parsers.split()
+        explicit_configs = set(self.explicit_config_files())
+
+        files_by_name = {}
+        for filepath, fileinfo in self.filemap.iteritems():
+            name = os.path.split(filepath)[1]
+            if not name in aliases:
+                continue
+            if fileinfo.dir == '.' or self.recurse or filepath in explicit_configs:
+                files_by_name.setdefault(name, []).append((filepath, fileinfo))
+
+        return [(alias, filepath, fileinfo)
+                for alias in aliases
+                for filepath, fileinfo in files_by_name.get(alias, [])]
+
     def parse_configs(self):
         """
         Look for document config files in current working tree and load them.
         Return an Abstract Syntax Tree with information about nodes to be
         processed.
         """
-        ast = dexy.parser.AbstractSyntaxTree(self)
-
-        processed_configs = []
+        configs = []
+        for alias, filepath, fileinfo in self.config_files():
+            self.log.info("using config file '%s'" % filepath)
+            with open(fileinfo.ospath, "r") as f:
+                configs.append((alias, fileinfo.ospath, fileinfo.dir, f.read()))
 
-        for alias in self.parsers.split():
-            parser = dexy.parser.Parser.create_instance(alias, self, ast)
+        config_cache = dexy.parser.ParsedConfigCache(self)
+        ast = config_cache.load(configs)
 
-            for filepath, fileinfo in self.filemap.iteritems():
-                if fileinfo['dir'] == '.' or self.recurse or self.is_explicit_config(filepath):
-                    if os.path.split(filepath)[1] == alias:
-                        self.log.info("using config file '%s'" % filepath)
-
-                        config_file = fileinfo['ospath']
-                        dirname = fileinfo['dir']
+        if ast:
+            self.log.debug("using cached parse of config files")
+        else:
+            ast = dexy.parser.AbstractSyntaxTree(self)
+            parsers = dict((alias, dexy.parser.Parser.create_instance(alias, self, ast))
+                    for alias in self.parsers.split())
 
-                        with open(config_file, "r") as f:
-                            config_text = f.read()
+            for alias, config_file, dirname, config_text in configs:
+                try:
+                    parsers[alias].parse(dirname, config_text)
+                except UserFeedback:
+                    sys.stderr.write("Problem occurred while parsing %s\n" % config_file)
+                    raise
 
-                        try:
-                            processed_configs.append(filepath)
-                            parser.parse(dirname, config_text)
-                        except UserFeedback:
-                            sys.stderr.write("Problem occurred while parsing %s\n" % config_file)
-                            raise
+            config_cache.save(configs, ast)
 
-        if len(processed_configs) == 0:
+        if len(configs) == 0:
             msg = "didn't find any document config files (like %s)"
             self.printmsg(msg % self.parsers)
 
@@ -727,10 +1027,12 @@ class Wrapper(object):
             self.log.debug(msg)
             reporters = [i for i in dexy.reporter.Reporter if i.setting('default')]
 
-        for reporter in reporters:
-            if self.state in reporter.setting('run-for-wrapper-states'):
-                self.log.debug("running reporter %s" % reporter.aliases[0])
-                reporter.run(self)
+        with self.traced_phase('report'):
+            for reporter in reporters:
+                if self.state in reporter.setting('run-for-wrapper-states'):
+                    self.log.debug("running reporter %s" % reporter.aliases[0])
+                    with self.tracer.span(reporter.aliases[0], 'reporter'):
+                        reporter.run(self)
 
     def is_location_in_project_dir(self, filepath):
         return self.writeanywhere or (self.project_root_ts in os.path.abspath(filepath))
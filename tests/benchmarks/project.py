@@ -0,0 +1,155 @@
+"""
+Generates synthetic dexy projects for benchmarking.
+
+Docs are spread evenly over the requested filter chains, each chain gets
+source files of a suitable type. The shape determines how docs depend on
+each other:
+
+    flat       docs are independent of each other
+    fan-in     an index doc has every doc as an input
+    fan-out    every doc has the same shared doc as an input
+    bundles    docs are grouped into named bundles of 10 docs
+    allinputs  an index doc gets every doc as an input via 'allinputs'
+"""
+import json
+import time
+
+SHAPES = ('flat', 'fan-in', 'fan-out', 'bundles', 'allinputs')
+
+DEFAULT_CHAINS = ('jinja', 'jinja|markdown', 'idio', 'pyg')
+
+BUNDLE_SIZE = 10
+
+TEXT_SOURCE = """Document %(i)s
+
+This is document number {{ %(i)s + 1 - 1 }} in a generated project.
+"""
+
+MARKDOWN_SOURCE = """# Document %(i)s
+
+Some *markdown* with a [link](http://dexy.it) and {{ "jinja" }} content.
+
+    code block in document %(i)s
+"""
+
+PYTHON_SOURCE = '''### @export "imports"
+import os
+
+### @export "function"
+def doc_%(i)s(x):
+    """
+    Function in document %(i)s.
+    """
+    return x * %(i)s
+
+### @export "call"
+print doc_%(i)s(os.getpid())
+'''
+
+INDEX_SOURCE = """Index of {{ d|length }} documents.
+{% for key in d.keys()|sort %}
+{{ key }}
+{%- endfor %}
+"""
+
+def source_for_chain(chain):
+    """
+    Returns the file extension and source template to use for docs processed
+    by this filter chain.
+    """
+    filters = chain.split("|")
+    if 'markdown' in filters:
+        return '.md', MARKDOWN_SOURCE
+    elif filters[0] in ('idio', 'pyg'):
+        return '.py', PYTHON_SOURCE
+    else:
+        return '.txt', TEXT_SOURCE
+
+def doc_filename(i, chain):
+    ext, _ = source_for_chain(chain)
+    return "doc-%05d%s" % (i, ext)
+
+def doc_keys(n_docs, chains):
+    """
+    Returns a list of (filename, doc key) tuples for the generated docs.
+    """
+    keys = []
+    for i in range(n_docs):
+        chain = chains[i % len(chains)]
+        filename = doc_filename(i, chain)
+        keys.append((filename, "%s|%s" % (filename, chain)))
+    return keys
+
+def write_file(filename, contents):
+    with open(filename, "w") as f:
+        f.write(contents)
+
+def write_sources(n_docs, chains):
+    for i in range(n_docs):
+        chain = chains[i % len(chains)]
+        _, source = source_for_chain(chain)
+        write_file(doc_filename(i, chain), source % { 'i' : i })
+
+def yaml_config(shape, keys):
+    lines = []
+
+    if shape == 'flat':
+        lines.extend("- %s" % key for _, key in keys)
+
+    elif shape == 'fan-in':
+        lines.append("index.txt|jinja:")
+        lines.extend("    - %s" % key for _, key in keys)
+
+    elif shape == 'fan-out':
+        for _, key in keys:
+            lines.append("%s:" % key)
+            lines.append("    - shared.txt")
+
+    elif shape == 'bundles':
+        for start in range(0, len(keys), BUNDLE_SIZE):
+            lines.append("bundle-%05d:" % start)
+            lines.extend("    - %s" % key for _, key in keys[start:start+BUNDLE_SIZE])
+
+    return "\n".join(lines) + "\n"
+
+def json_config(keys):
+    config = dict((key, {}) for _, key in keys)
+    config["index.txt|jinja"] = { "allinputs" : True }
+    return json.dumps(config, indent=4)
+
+def generate_project(n_docs=100, chains=DEFAULT_CHAINS, shape='flat'):
+    """
+    Writes source files and config for a synthetic project in the current
+    directory. Returns a dict of wrapper kwargs needed to run the project.
+    """
+    if not shape in SHAPES:
+        raise ValueError("unknown shape '%s', choose from %s" % (shape, ", ".join(SHAPES)))
+
+    write_sources(n_docs, chains)
+    keys = doc_keys(n_docs, chains)
+
+    if shape in ('fan-in', 'allinputs'):
+        write_file("index.txt", INDEX_SOURCE)
+    elif shape == 'fan-out':
+        write_file("shared.txt", "Shared by every document.\n")
+
+    if shape == 'allinputs':
+        write_file("dexy.json", json_config(keys))
+        return { 'parsers' : 'dexy.json' }
+    else:
+        write_file("dexy.yaml", yaml_config(shape, keys))
+        return {}
+
+def change_one_file(chains, shape):
+    """
+    Modifies one source file, for measuring incremental runs. For the fan-out
+    shape this is the doc shared by every other doc.
+    """
+    if shape == 'fan-out':
+        filename = "shared.txt"
+    else:
+        filename = doc_filename(0, chains[0])
+
+    with open(filename, "a") as f:
+        f.write("\n# changed at %s\n" % time.time())
+    return filename
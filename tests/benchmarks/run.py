@@ -0,0 +1,205 @@
+"""
+Times dexy on generated projects, phase by phase.
+
+Each repetition generates a fresh project and times each wrapper phase for
+three scenarios:
+
+    cold       first run, nothing is cached
+    warm       nothing has changed since the previous run
+    changed    one source file has changed since the previous run
+
+The time taken to import dexy and register plugins in a new python process
+is measured separately. The best time for each phase over all repetitions
+is reported. Results are written as JSON, pass an earlier results file via
+--compare to list phases which have become slower.
+
+Usage: python -m tests.benchmarks.run --docs 200 --shape fan-in -o results.json
+"""
+from dexy.version import DEXY_VERSION
+from tests.benchmarks.project import DEFAULT_CHAINS
+from tests.benchmarks.project import SHAPES
+from tests.benchmarks.project import change_one_file
+from tests.benchmarks.project import generate_project
+import argparse
+import datetime
+import dexy
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PHASES = ('to_valid', 'to_walked', 'to_checked', 'run', 'report')
+
+SCENARIOS = ('cold', 'warm', 'changed')
+
+IMPORT_CODE = "import dexy.load_plugins, dexy.wrapper"
+
+def time_phases(wrapper_kwargs):
+    """
+    Runs dexy in the current directory, returns a dict of the time taken by
+    each phase and in total.
+    """
+    from dexy.wrapper import Wrapper
+    wrapper = Wrapper(log_level='WARN', **wrapper_kwargs)
+
+    timings = {}
+    for phase in PHASES:
+        start = time.time()
+        getattr(wrapper, phase)()
+        timings[phase] = time.time() - start
+
+    if wrapper.state != 'ran':
+        raise Exception("dexy run ended in state '%s'" % wrapper.state)
+
+    timings['total'] = sum(timings.values())
+    return timings
+
+def time_import():
+    """
+    Returns the time taken to import dexy and register its plugins in a new
+    python process.
+    """
+    dexy_parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(dexy.__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([dexy_parent_dir, env.get('PYTHONPATH', '')])
+
+    start = time.time()
+    subprocess.check_call([sys.executable, "-c", IMPORT_CODE], env=env)
+    return time.time() - start
+
+def run_scenarios(n_docs, chains, shape):
+    """
+    Generates a project in a temporary directory and times the cold, warm and
+    changed scenarios for it.
+    """
+    from dexy.wrapper import Wrapper
+
+    project_dir = tempfile.mkdtemp()
+    prev_dir = os.path.abspath(os.getcwd())
+
+    try:
+        os.chdir(project_dir)
+        wrapper_kwargs = generate_project(n_docs, chains, shape)
+        Wrapper(**wrapper_kwargs).create_dexy_dirs()
+
+        results = {}
+        results['cold'] = time_phases(wrapper_kwargs)
+        results['warm'] = time_phases(wrapper_kwargs)
+        change_one_file(chains, shape)
+        results['changed'] = time_phases(wrapper_kwargs)
+        return results
+
+    finally:
+        os.chdir(prev_dir)
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+def best_times(samples):
+    """
+    Takes a list of {scenario : {phase : seconds}} dicts, returns the minimum
+    for each scenario and phase.
+    """
+    return dict((scenario, dict((phase, min(s[scenario][phase] for s in samples))
+                for phase in samples[0][scenario]))
+            for scenario in samples[0])
+
+def run_benchmarks(n_docs=100, chains=DEFAULT_CHAINS, shape='flat', repeat=3):
+    import dexy.load_plugins
+
+    samples = [run_scenarios(n_docs, chains, shape) for i in range(repeat)]
+    import_times = [time_import() for i in range(repeat)]
+
+    return {
+            'dexy-version' : DEXY_VERSION,
+            'python-version' : platform.python_version(),
+            'platform' : platform.platform(),
+            'timestamp' : datetime.datetime.now().isoformat(),
+            'params' : {
+                'docs' : n_docs,
+                'chains' : list(chains),
+                'shape' : shape,
+                'repeat' : repeat
+                },
+            'import' : min(import_times),
+            'scenarios' : best_times(samples)
+            }
+
+def compare(previous, current, threshold):
+    """
+    Returns a list of (name, previous seconds, current seconds) for timings
+    which are more than `threshold` (a fraction) slower in current.
+    """
+    pairs = [('import', previous['import'], current['import'])]
+    for scenario, timings in sorted(current['scenarios'].iteritems()):
+        for phase, seconds in sorted(timings.iteritems()):
+            previous_seconds = previous['scenarios'].get(scenario, {}).get(phase)
+            if previous_seconds is not None:
+                pairs.append(("%s %s" % (scenario, phase), previous_seconds, seconds))
+
+    return [(name, before, after) for name, before, after in pairs
+            if after > before * (1 + threshold)]
+
+def print_results(results):
+    print "import: %.3fs" % results['import']
+    for scenario in SCENARIOS:
+        timings = results['scenarios'][scenario]
+        print "%-8s %s" % (scenario, "  ".join("%s %.3fs" % (phase, timings[phase])
+                for phase in PHASES + ('total',)))
+
+def use_absolute_import_paths():
+    """
+    Modules found via a relative sys.path entry, like '' when running with
+    python -m, get relative paths which break when changing into project
+    dirs. Makes sys.path and the paths of modules and packages already
+    imported absolute.
+    """
+    sys.path[:] = [os.path.abspath(path) for path in sys.path]
+    for module in sys.modules.values():
+        if getattr(module, '__file__', None):
+            module.__file__ = os.path.abspath(module.__file__)
+        if getattr(module, '__path__', None):
+            module.__path__[:] = [os.path.abspath(path) for path in module.__path__]
+
+def main():
+    use_absolute_import_paths()
+
+    parser = argparse.ArgumentParser(description="Time dexy on a generated project.")
+    parser.add_argument("--docs", type=int, default=100, help="number of docs to generate")
+    parser.add_argument("--chains", default=",".join(DEFAULT_CHAINS),
+            help="comma-separated filter chains to spread docs over")
+    parser.add_argument("--shape", default='flat', choices=SHAPES,
+            help="how docs depend on each other")
+    parser.add_argument("--repeat", type=int, default=3, help="number of repetitions")
+    parser.add_argument("-o", "--output", help="file to write JSON results to")
+    parser.add_argument("--compare", help="JSON results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+            help="fraction by which a timing must be slower to count as a regression")
+    args = parser.parse_args()
+
+    chains = [chain.strip() for chain in args.chains.split(",") if chain.strip()]
+    results = run_benchmarks(args.docs, chains, args.shape, args.repeat)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+
+        if previous.get('params') != results['params']:
+            print "warning: comparing against results for different params %s" % previous.get('params')
+
+        regressions = compare(previous, results, args.threshold)
+        for name, before, after in regressions:
+            print "slower: %s %.3fs -> %.3fs" % (name, before, after)
+
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
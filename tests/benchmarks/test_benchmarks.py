@@ -0,0 +1,38 @@
+from tests.benchmarks.project import SHAPES
+from tests.benchmarks.project import generate_project
+from tests.benchmarks.run import PHASES
+from tests.benchmarks.run import best_times
+from tests.benchmarks.run import compare
+from tests.benchmarks.run import run_scenarios
+from tests.utils import tempdir
+import os
+
+def test_generate_project():
+    with tempdir():
+        wrapper_kwargs = generate_project(6, ['jinja', 'idio|pyg'], 'fan-in')
+        assert wrapper_kwargs == {}
+        assert os.path.exists("doc-00000.txt")
+        assert os.path.exists("doc-00001.py")
+        with open("dexy.yaml") as f:
+            config = f.read()
+        assert "index.txt|jinja:" in config
+        assert "    - doc-00005.py|idio|pyg" in config
+
+def test_run_scenarios():
+    for shape in SHAPES:
+        results = run_scenarios(4, ['jinja', 'jinja|markdown', 'idio', 'pyg'], shape)
+        assert sorted(results) == ['changed', 'cold', 'warm']
+        for phase in PHASES:
+            assert results['warm'][phase] >= 0
+
+def test_best_times_and_compare():
+    samples = [
+            { 'warm' : { 'run' : 2.0, 'report' : 1.0 } },
+            { 'warm' : { 'run' : 1.0, 'report' : 1.5 } }
+            ]
+    best = best_times(samples)
+    assert best == { 'warm' : { 'run' : 1.0, 'report' : 1.0 } }
+
+    previous = { 'import' : 1.0, 'scenarios' : best }
+    current = { 'import' : 1.05, 'scenarios' : { 'warm' : { 'run' : 2.0, 'report' : 1.0 } } }
+    assert compare(previous, current, 0.1) == [('warm run', 1.0, 2.0)]
@@ -24,3 +24,47 @@ def test_ast():
         ast.walk()
         assert len(wrapper.roots) == 1
         assert len(wrapper.nodes) == 2
+
+def test_ast_root_order():
+    with wrap() as wrapper:
+        wrapper.filemap = wrapper.map_files()
+        ast = AbstractSyntaxTree(wrapper)
+
+        ast.add_node("b.txt")
+        ast.add_node("a.txt")
+        ast.add_dependency("c.txt", "b.txt")
+        ast.add_node("b.txt", foo='bar')
+        ast.add_dependency("a.txt", "a.txt")
+        ast.add_dependency("d.txt", "c.txt")
+
+        assert ast.tree == ['doc:a.txt', 'doc:d.txt']
+        assert ast.all_inputs() == set(['doc:b.txt', 'doc:c.txt'])
+        assert ast.inputs_for_node('a.txt') == []
+
+        ast.add_node("e.txt", inputs=['doc:a.txt'])
+        assert ast.tree == ['doc:d.txt', 'doc:e.txt']
+        ast.add_node("e.txt", inputs=[])
+        assert ast.tree == ['doc:d.txt', 'doc:e.txt', 'doc:a.txt']
+
+def test_default_args_for_directory():
+    with wrap() as wrapper:
+        ast = AbstractSyntaxTree(wrapper)
+        ast.default_args_for_directory.append(("abc/def", {'foo' : 'def'}))
+        ast.default_args_for_directory.append((".", {'foo' : 'root', 'bar' : 'root'}))
+        ast.default_args_for_directory.append(("abc", {'bar' : 'abc'}))
+
+        assert ast.calculate_default_args_for_directory("x.txt") == {'foo' : 'root', 'bar' : 'root'}
+        assert ast.calculate_default_args_for_directory("abc/*.txt") == {'foo' : 'root', 'bar' : 'abc'}
+        assert ast.calculate_default_args_for_directory("abc/def/x.txt|jinja") == {'foo' : 'def', 'bar' : 'abc'}
+        assert ast.calculate_default_args_for_directory("abc/def/ghi/x.txt") == {'foo' : 'def', 'bar' : 'abc'}
+
+        # directories with a shared prefix are not parents of each other
+        assert ast.calculate_default_args_for_directory("abcd/x.txt") == {'foo' : 'root', 'bar' : 'root'}
+        assert ast.calculate_default_args_for_directory("abc/defg/x.txt") == {'foo' : 'root', 'bar' : 'abc'}
+
+        ast.environment_for_directory.append(("abc", {'PATH' : '/abc'}))
+        env = ast.calculate_environment_for_directory("abc/x.txt")
+        assert env == {'PATH' : '/abc'}
+        env['PATH'] = 'changed'
+        assert ast.calculate_environment_for_directory("abc/y.txt") == {'PATH' : '/abc'}
+        assert ast.calculate_environment_for_directory("x.txt") == {}
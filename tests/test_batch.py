@@ -1,7 +1,10 @@
 from tests.utils import tempdir
+from dexy.exceptions import InternalDexyProblem
+from dexy.exceptions import UserFeedback
 from dexy.wrapper import Wrapper
 import dexy.batch
 import os
+import sqlite3
 
 def test_batch():
     with tempdir():
@@ -9,14 +12,15 @@ def test_batch():
         wrapper.create_dexy_dirs()
 
         wrapper = Wrapper()
-        batch = dexy.batch.Batch(wrapper)
-        os.makedirs(batch.batch_dir())
+        assert not dexy.batch.Batch.load_most_recent(wrapper)
 
-        batch.save_to_file()
-        assert batch.filename() in os.listdir(".dexy/batches")
+        batch = dexy.batch.Batch(wrapper)
+        batch.save()
+        assert os.path.exists(".dexy/batches.sqlite3")
 
         wrapper = Wrapper()
-        batch = dexy.batch.Batch.load_most_recent(wrapper)
+        batch_loaded = dexy.batch.Batch.load_most_recent(wrapper)
+        assert batch_loaded.uuid == batch.uuid
 
 def test_batch_with_docs():
     with tempdir():
@@ -38,3 +42,240 @@ def test_batch_with_docs():
         for doc_key in batch.docs:
             assert batch.input_data(doc_key)
             assert batch.output_data(doc_key)
+
+def test_batch_queries():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        for name in ("hello", "help", "other"):
+            with open("%s.txt" % name, "w") as f:
+                f.write(name)
+
+        with open("dexy.yaml", "w") as f:
+            f.write("- .txt|processtext")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        storage_key = wrapper.nodes['doc:hello.txt|processtext'].output_data().storage_key
+
+        wrapper = Wrapper()
+        batch = dexy.batch.Batch.load_most_recent(wrapper)
+        assert 'processtext' in batch.filters_used
+
+        matches = batch.matching_output_data(expr="hel")
+        assert [data.key for data in matches] == ['hello.txt|processtext', 'help.txt|processtext']
+        assert str(matches[0]) == "Dexy processed the text 'hello'"
+        # only matching docs have been read from the database
+        assert batch._docs is None
+
+        matches = batch.matching_output_data(key="other.txt|processtext")
+        assert [data.key for data in matches] == ['other.txt|processtext']
+
+        matches = batch.matching_output_data(name="help.txt")
+        assert [data.key for data in matches] == ['help.txt|processtext']
+
+        assert batch.doc_key(storage_key) == 'doc:hello.txt|processtext'
+        assert batch.doc_info('doc:help.txt|processtext')['state'] == 'ran'
+        assert sorted(batch.docs) == ['doc:hello.txt|processtext', 'doc:help.txt|processtext', 'doc:other.txt|processtext']
+
+def test_settings_are_shared():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        for i in range(5):
+            with open("doc%s.txt" % i, "w") as f:
+                f.write("doc")
+
+        with open("dexy.yaml", "w") as f:
+            f.write("- .txt|processtext")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+
+        db = wrapper.batch_db()
+        n_datas = db.execute("SELECT count(*) FROM datas")[0][0]
+        n_settings = db.execute("SELECT count(*) FROM settings")[0][0]
+        assert n_datas == 15
+        assert n_settings < n_datas
+
+def test_old_batches_are_pruned():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        wrapper = Wrapper()
+        for i in range(dexy.batch.BatchDatabase.keep_batches + 2):
+            dexy.batch.Batch(wrapper).save()
+
+        n_batches = wrapper.batch_db().execute("SELECT count(*) FROM batches")[0][0]
+        assert n_batches == dexy.batch.BatchDatabase.keep_batches
+
+def test_data_objects_are_shared():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        for name in ("hello", "help"):
+            with open("%s.txt" % name, "w") as f:
+                f.write(name)
+
+        with open("dexy.yaml", "w") as f:
+            f.write("- .txt|processtext")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+
+        batch = dexy.batch.Batch.load_most_recent(wrapper)
+        data = batch.output_data('doc:hello.txt|processtext')
+        assert batch.output_data('doc:hello.txt|processtext') is data
+        assert batch.input_data('doc:hello.txt|processtext') is not data
+        assert data in list(batch)
+        assert batch.matching_output_data(name="hello.txt") == [data]
+
+def test_sqlite_connections_opened_when_needed():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        with open("hello.txt", "w") as f:
+            f.write("hello")
+
+        with open("dexy.yaml", "w") as f:
+            f.write("hello.txt|keyvalueexample")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+
+        batch = dexy.batch.Batch.load_most_recent(wrapper)
+        data = batch.output_data('doc:hello.txt|keyvalueexample')
+        assert data.storage._cursor is None
+
+        assert data.value("foo") == "bar"
+        assert data.storage._cursor is not None
+
+        # another data object for the same file shares the connection
+        other = batch.create_data(batch.doc_info('doc:hello.txt|keyvalueexample')['output-data'])
+        assert other is not data
+        assert other.keys() == ['foo']
+        assert other.storage._storage is data.storage._storage
+
+def test_sqlite_connection_replaced_when_file_changes():
+    with tempdir():
+        wrapper = Wrapper()
+
+        def write_db(value):
+            if os.path.exists("data.sqlite3"):
+                os.remove("data.sqlite3")
+            conn = sqlite3.connect("data.sqlite3")
+            conn.execute("CREATE TABLE kvstore (key TEXT, value TEXT)")
+            conn.execute("INSERT INTO kvstore VALUES ('foo', ?)", (value,))
+            conn.commit()
+            conn.close()
+
+        write_db("bar")
+        conn = wrapper.sqlite_connection("data.sqlite3")
+        assert wrapper.sqlite_connection("data.sqlite3") is conn
+
+        write_db("baz")
+        stat = os.stat("data.sqlite3")
+        os.utime("data.sqlite3", (stat.st_atime, stat.st_mtime + 10))
+
+        new_conn = wrapper.sqlite_connection("data.sqlite3")
+        assert new_conn is not conn
+        assert new_conn.execute("SELECT value FROM kvstore").fetchone()[0] == "baz"
+        assert len(wrapper._sqlite_connections) == 1
+
+        try:
+            conn.execute("SELECT value FROM kvstore")
+            assert False, "should raise ProgrammingError"
+        except sqlite3.ProgrammingError:
+            pass
+
+def test_run_history():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        with open("hello.txt", "w") as f:
+            f.write("hello")
+
+        with open("dexy.yaml", "w") as f:
+            f.write("hello.txt|head|wc")
+
+        for i in range(2):
+            wrapper = Wrapper()
+            wrapper.run_from_new()
+
+        db = wrapper.batch_db()
+        runs = db.recent_runs(5)
+        assert len(runs) == 2
+        assert [run[3] for run in runs] == ['ran', 'ran']
+
+        run_ids = [run[0] for run in runs]
+        doc_rows = db.doc_runs(run_ids)
+        assert [(row[0], row[2]) for row in doc_rows] == [(run_ids[0], 'ran'), (run_ids[1], 'consolidated')]
+        assert doc_rows[0][4] == 5
+
+        filter_rows = db.filter_runs(run_ids)
+        first_run = [row for row in filter_rows if row[0] == run_ids[0]]
+        assert [row[3] for row in first_run] == ['head', 'wc']
+        assert all(row[4] is not None for row in first_run)
+        assert first_run[1][6] == 0
+
+def test_run_error_not_hidden_by_history_error():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        with open("bad.txt", "w") as f:
+            f.write("{{ undefined_name.attribute }}")
+
+        with open("dexy.yaml", "w") as f:
+            f.write("bad.txt|jinja")
+
+        def broken_save_history():
+            raise Exception("history is broken")
+
+        wrapper = Wrapper(debug=True)
+        wrapper.save_history = broken_save_history
+        try:
+            wrapper.run_from_new()
+            assert False, "should raise error"
+        except UserFeedback as e:
+            assert "undefined_name" in e.message
+        assert wrapper.state == 'error'
+
+def test_no_commits_while_batch_open():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        wrapper = Wrapper()
+        db = wrapper.batch_db()
+        batch_id = db.start_batch("abc", 0)
+        try:
+            db.save_node_args({'doc:foo.txt' : 'args'})
+            assert False, "should raise InternalDexyProblem"
+        except InternalDexyProblem as e:
+            assert "batch %s is open" % batch_id in e.message
+
+        db.rollback()
+        db.save_node_args({'doc:foo.txt' : 'args'})
+        assert db.load_node_args() == {'doc:foo.txt' : 'args'}
+        assert not db.execute("SELECT id FROM batches")
+
+def test_old_runs_are_pruned():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        wrapper = Wrapper()
+        db = wrapper.batch_db()
+        for i in range(dexy.batch.BatchDatabase.keep_runs + 2):
+            db.save_run(i, i + 1, 'ran', 1, [('doc', 'ran', 1.0, 1, 1, [])])
+
+        assert len(db.recent_runs(1000)) == dexy.batch.BatchDatabase.keep_runs
+        n_doc_runs = db.execute("SELECT count(*) FROM doc_runs")[0][0]
+        assert n_doc_runs == dexy.batch.BatchDatabase.keep_runs
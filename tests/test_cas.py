@@ -0,0 +1,168 @@
+from dexy.wrapper import Wrapper
+from tests.utils import tempdir
+import os
+
+def run_project(yaml, **kwargs):
+    with open("dexy.yaml", "w") as f:
+        f.write(yaml)
+
+    wrapper = Wrapper(**kwargs)
+    wrapper.run_from_new()
+    wrapper.validate_state('ran')
+    return wrapper
+
+def output_file(wrapper, key):
+    node = wrapper.nodes[key]
+    return node.output_data().storage.data_file()
+
+def test_identical_outputs_are_shared():
+    with tempdir():
+        for name in ('a', 'b'):
+            with open("%s.txt" % name, "w") as f:
+                f.write("same contents\n")
+
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        wrapper = run_project("- a.txt|head\n- b.txt|head")
+
+        a = output_file(wrapper, 'doc:a.txt|head')
+        b = output_file(wrapper, 'doc:b.txt|head')
+
+        assert os.stat(a).st_ino == os.stat(b).st_ino
+        assert os.stat(a).st_nlink > 2
+
+def test_renamed_doc_reuses_output():
+    with tempdir():
+        with open("old.txt", "w") as f:
+            f.write("some contents\n")
+
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        wrapper = run_project("old.txt|head")
+        old = output_file(wrapper, 'doc:old.txt|head')
+        old_ino = os.stat(old).st_ino
+
+        os.rename("old.txt", "new.txt")
+        wrapper = run_project("new.txt|head")
+        new = output_file(wrapper, 'doc:new.txt|head')
+
+        # output is not restored for a doc with another name, but is stored
+        # once since it's identical
+        assert wrapper.nodes['doc:new.txt|head'].state == 'ran'
+        assert not wrapper.nodes['doc:new.txt|head'].filters[0].restored
+        assert os.stat(new).st_ino == old_ino
+
+def test_renamed_doc_output_not_restored_from_other_doc():
+    with tempdir():
+        with open("a.py", "w") as f:
+            f.write("x = 1\n")
+
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        wrapper = run_project("a.py|pyg|h")
+        assert "a.py-pyg.html-1" in unicode(wrapper.nodes['doc:a.py|pyg|h'].output_data())
+
+        os.rename("a.py", "b.py")
+        wrapper = run_project("b.py|pyg|h")
+        doc = wrapper.nodes['doc:b.py|pyg|h']
+        assert not doc.filters[0].restored
+        assert "b.py-pyg.html-1" in unicode(doc.output_data())
+        assert not "a.py" in unicode(doc.output_data())
+
+def test_content_addressed_opt_out():
+    with tempdir():
+        with open("hello.txt", "w") as f:
+            f.write("hello\n")
+
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        wrapper = run_project("hello.txt|head:\n    - head: { content-addressed: False }")
+
+        assert not os.path.exists(os.path.join(wrapper.artifacts_dir, 'cas', 'index'))
+
+def write_docs(contents):
+    for name, text in contents.iteritems():
+        with open("%s.txt" % name, "w") as f:
+            f.write(text)
+
+def test_access_recorded_with_filter_alias():
+    with tempdir():
+        write_docs({'a' : "aaa\n"})
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        wrapper = run_project("a.txt|head")
+
+        artifacts = wrapper.batch_db().load_artifacts()
+        assert len(artifacts) == 1
+        alias, last_access = artifacts.values()[0]
+        assert alias == 'head'
+        assert last_access > 0
+
+        footprint = wrapper.cas.footprint()
+        assert footprint.keys() == ['head']
+        n_objects, size, unused_size = footprint['head']
+        assert n_objects == 1
+        assert unused_size == 0
+
+def test_least_recently_used_output_removed():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        for version in ("first", "second", "third"):
+            write_docs({'a' : "%s version\n" % version, 'b' : "b\n"})
+            wrapper = run_project("- a.txt|head\n- b.txt|head")
+
+        objects = list(wrapper.cas.objects())
+        assert len(objects) == 4
+        assert len([o for o in objects if o[2]]) == 2
+
+        # only the oldest version needs to go to fit the budget
+        total_size = sum(size for _, size, _ in objects)
+        n_removed, freed = wrapper.cas.collect_garbage(total_size - 1)
+        assert n_removed == 1
+        assert len(list(wrapper.cas.objects())) == 3
+        assert wrapper.cas.lookup(wrapper.nodes['doc:a.txt|head'].filters[0].content_address())
+
+        # output used by the last run is never removed
+        n_removed, freed = wrapper.cas.collect_garbage(0)
+        assert n_removed == 1
+        assert len(list(wrapper.cas.objects())) == 2
+        assert len(wrapper.batch_db().load_artifacts()) == 2
+        index_dir = os.path.join(wrapper.artifacts_dir, 'cas', 'index')
+        assert sum(len(filenames) for _, _, filenames in os.walk(index_dir)) == 2
+
+def test_cache_max_size_applied_after_run():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        for version in ("first", "second"):
+            write_docs({'a' : "%s version\n" % version})
+            wrapper = run_project("a.txt|head", cache_max_size="1")
+
+        assert len(list(wrapper.cas.objects())) == 1
+
+def test_invalid_digests_are_not_used():
+    with tempdir():
+        with open("secret.txt", "w") as f:
+            f.write("secret\n")
+        with open("a.txt", "w") as f:
+            f.write("a\n")
+
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        wrapper = run_project("a.txt|head")
+        cas = wrapper.cas
+        content_address = wrapper.nodes['doc:a.txt|head'].filters[0].content_address()
+
+        # object_path joins digest[0:2], i.e. '..', and the digest
+        poisoned = os.path.relpath(os.path.abspath("secret.txt"), cas.cas_dir())
+        assert os.path.exists(cas.object_path(poisoned))
+        with open(cas.index_path(content_address), "w") as f:
+            f.write(poisoned)
+
+        assert cas.lookup(content_address) is None
+        assert not cas.restore(content_address, "restored.txt")
+        assert not cas.lookup("../%s" % content_address)
+        assert not cas.write_index_entry(content_address, poisoned)
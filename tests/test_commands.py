@@ -194,3 +194,28 @@ def test_env_text(stdout):
     dexy.commands.run()
     text = stdout.getvalue()
     assert "uuid" in text
+
+def test_stats_regressions():
+    from dexy.commands.stats import regressions
+    times = {
+            'slower' : { 1 : 1.0, 2 : 1.1, 3 : 0.9, 4 : 2.0 },
+            'same' : { 1 : 1.0, 2 : 1.0, 4 : 1.1 },
+            'tiny' : { 1 : 0.01, 4 : 0.05 },
+            'cached' : { 1 : 1.0 },
+            'new' : { 4 : 5.0 }
+            }
+    assert regressions(times, 4, 20, 0.1) == [('slower', 1.0, 2.0)]
+
+@patch.object(sys, 'argv', ['dexy', 'stats'])
+@patch('sys.stdout', new_callable=StringIO)
+def test_stats_command(stdout):
+    with wrap() as wrapper:
+        with open("hello.txt", "w") as f:
+            f.write("hello")
+        with open("dexy.yaml", "w") as f:
+            f.write("hello.txt|head")
+        Wrapper().run_from_new()
+
+        dexy.commands.run()
+        assert "slowest filters" in stdout.getvalue()
+        assert "hello.txt|head" in stdout.getvalue()
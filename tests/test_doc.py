@@ -1,8 +1,11 @@
 from dexy.data import Data
 from dexy.doc import Doc
 from dexy.exceptions import UserFeedback
+from dexy.wrapper import Wrapper
 from tests.utils import wrap
 from nose.tools import raises
+import os
+import time
 
 def test_create_doc_with_one_filter():
     with wrap() as wrapper:
@@ -49,3 +52,51 @@ def test_create_virtual_initial_artifact():
         doc = Doc("abc.txt", wrapper, [], contents="these are the contents")
         wrapper.run_docs(doc)
         assert doc.output_data().__class__.__name__ == "Generic"
+
+def test_touched_file_is_not_changed():
+    with wrap():
+        with open("dexy.yaml", "w") as f:
+            f.write("hello.txt|dexy")
+
+        with open("hello.txt", "w") as f:
+            f.write("hello")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        assert wrapper.nodes['doc:hello.txt|dexy'].state == 'ran'
+
+        # same contents, newer mtime
+        with open("hello.txt", "w") as f:
+            f.write("hello")
+        future = time.time() + 100
+        os.utime("hello.txt", (future, future))
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        assert wrapper.nodes['doc:hello.txt|dexy'].state == 'consolidated'
+
+        with open("hello.txt", "w") as f:
+            f.write("hello again")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        assert wrapper.nodes['doc:hello.txt|dexy'].state == 'ran'
+        assert str(wrapper.nodes['doc:hello.txt|dexy'].output_data()) == "hello again"
+
+def test_virtual_contents_changed():
+    with wrap():
+        wrapper = Wrapper()
+        doc = Doc("abc.txt|dexy", wrapper, [], contents="first")
+        wrapper.run_docs(doc)
+        assert doc.state == 'ran'
+
+        wrapper = Wrapper()
+        doc = Doc("abc.txt|dexy", wrapper, [], contents="first")
+        wrapper.run_docs(doc)
+        assert doc.state == 'consolidated'
+
+        wrapper = Wrapper()
+        doc = Doc("abc.txt|dexy", wrapper, [], contents="second")
+        wrapper.run_docs(doc)
+        assert doc.state == 'ran'
+        assert str(doc.output_data()) == "second"
@@ -0,0 +1,94 @@
+from dexy.filemap import FileInfo
+from dexy.filemap import FileMapIndex
+from dexy.filemap import GlobIndex
+from dexy.wrapper import Wrapper
+from tests.utils import tempdir
+import fnmatch
+import os
+
+def make_files():
+    os.makedirs("abc/def")
+    os.makedirs("skipme/sub")
+    for filepath in ("foo.txt", "abc/bar.txt", "abc/def/baz.txt", "skipme/sub/x.txt"):
+        with open(filepath, "w") as f:
+            f.write(filepath)
+
+def age_dirs(index):
+    # make listings old enough to be reused
+    for dirpath, info in index.current.items():
+        mtime = os.stat(dirpath).st_mtime - 10
+        os.utime(dirpath, (mtime, mtime))
+
+def test_fileinfo():
+    with tempdir():
+        with open("foo.txt", "w") as f:
+            f.write("foo")
+
+        info = FileInfo("foo.txt", ".")
+        assert info._stat is None
+        assert info.stat.st_size == 3
+        assert info['ospath'] == "foo.txt"
+        assert info['dir'] == "."
+
+def test_map_files():
+    with tempdir():
+        make_files()
+        wrapper = Wrapper()
+        index = FileMapIndex(wrapper)
+        filemap = index.map_files(['skipme'], '')
+
+        assert sorted(filemap.keys()) == ['abc/bar.txt', 'abc/def/baz.txt', 'foo.txt']
+        assert filemap['abc/def/baz.txt'].dir == os.path.join("abc", "def")
+        assert filemap['foo.txt'].dir == "."
+
+def test_nodexy():
+    with tempdir():
+        make_files()
+        with open("abc/.nodexy", "w") as f:
+            f.write("")
+
+        wrapper = Wrapper()
+        filemap = FileMapIndex(wrapper).map_files([], '')
+        assert sorted(filemap.keys()) == ['foo.txt', 'skipme/sub/x.txt']
+
+def test_saved_listings_are_reused():
+    with tempdir():
+        make_files()
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        index = FileMapIndex(wrapper)
+        index.map_files([], '')
+        age_dirs(index)
+        # record the aged mtimes
+        index.map_files([], '')
+        index.save()
+
+        index = FileMapIndex(wrapper)
+        index.load()
+        # a listing which doesn't match the directory contents, which would
+        # only show up if the saved listing is used
+        mtime, filenames, dirnames = index.saved['./abc']
+        index.saved['./abc'] = (mtime, filenames + ['ghost.txt'], dirnames)
+        assert 'abc/ghost.txt' in index.map_files([], '')
+
+        with open("abc/new.txt", "w") as f:
+            f.write("new")
+
+        filemap = index.map_files([], '')
+        assert 'abc/new.txt' in filemap
+        assert not 'abc/ghost.txt' in filemap
+
+def test_glob_index_matches_fnmatch():
+    filepaths = ["foo.txt", "foo.py", "abc/bar.txt", "abc/def/baz.txt",
+            "abc/def/.txt", "abc/def/index.md", "abc/README", "xyz/foo.tar.gz",
+            ".bashrc", "Makefile", "src/a.py", "src/b/c.py", "src.py"]
+    index = GlobIndex(dict((filepath, None) for filepath in filepaths))
+
+    patterns = ["*.txt", "*.py", "abc/*", "abc/*/*.txt", "*/index.md",
+            "*.gz", "*.tar.gz", "*.bashrc", "*", "foo.*", "src*", "src/*.py",
+            "abc/README", "missing.txt", "[ab]bc/*.txt", "*[!x]", "?akefile",
+            "abc/def/*", "*E", "*/*"]
+    for pattern in patterns:
+        expected = sorted(f for f in filepaths if fnmatch.fnmatch(f, pattern))
+        assert index.match(pattern) == expected, pattern
@@ -0,0 +1,54 @@
+from dexy.iostats import IOStats
+from dexy.wrapper import Wrapper
+from tests.utils import tempdir
+import json
+import os
+
+def run_with_iostats(**kwargs):
+    with open("hello.txt", "w") as f:
+        f.write("hello\n")
+    with open("dexy.txt", "w") as f:
+        f.write("hello.txt|head\nhello.txt|wc\n")
+
+    Wrapper().create_dexy_dirs()
+    wrapper = Wrapper(iostats=True, **kwargs)
+    wrapper.run_from_new()
+    return wrapper
+
+def test_iostats():
+    with tempdir():
+        wrapper = run_with_iostats(jobs=2)
+        fileio = wrapper.fileio
+
+        assert fileio.totals('phase', 'walk')['listdir'][0] > 0
+        run = fileio.totals('phase', 'run')
+        assert run['copy'][1] > 0
+        assert run['write'][0] > 0
+
+        node = fileio.totals('node', 'doc:hello.txt|head')
+        assert node['copy'][1] == len("hello\n")
+        assert 'doc:hello.txt|wc' in fileio.nodes_by_seconds()
+
+def test_iostats_in_trace():
+    with tempdir():
+        run_with_iostats(trace=True)
+
+        with open(os.path.join(".dexy", "trace.json"), "r") as f:
+            events = json.load(f)['traceEvents']
+        spans = dict(((e['cat'], e['name']), e) for e in events if e['ph'] == 'X')
+        assert spans[('phase', 'walk')]['args']['io_listdir_calls'] > 0
+        assert spans[('node', 'doc:hello.txt|head')]['args']['io_copy_calls'] == 1
+
+def test_iostats_walk_can_be_pruned():
+    with tempdir():
+        for d in ("a/b", "c/d"):
+            os.makedirs(d)
+
+        fileio = IOStats()
+        visited = []
+        for dirpath, subdirs, filenames in fileio.walk("."):
+            subdirs[:] = [d for d in subdirs if d != 'c']
+            visited.append(dirpath)
+
+        assert sorted(visited) == ['.', './a', './a/b']
+        assert fileio.totals('phase', None)['walk'][0] == 3
@@ -1,4 +1,5 @@
 from dexy.doc import Doc
+from dexy.node import InputIndex
 from dexy.node import Node
 from dexy.node import PatternNode
 from tests.utils import wrap
@@ -38,9 +39,9 @@ def test_node_arg_caching():
         assert node.sorted_arg_string() == '[["baz", 123], ["foo", "bar"]]'
 
         assert os.path.exists(wrapper.artifacts_dir)
-        assert not os.path.exists(wrapper.node_argstrings_filename())
+        assert not wrapper.batch_db().load_node_args()
         wrapper.save_node_argstrings()
-        assert os.path.exists(wrapper.node_argstrings_filename())
+        assert wrapper.batch_db().load_node_args()
         wrapper.load_node_argstrings()
         assert not node.check_args_changed()
 
@@ -257,3 +258,43 @@ def test_pattern_node_one_filter():
         assert doc.key == "foo.txt|dexy"
         assert doc.filter_aliases == ['dexy']
         assert doc.parent == node
+
+class FakeNode(object):
+    def __init__(self, name, inputs=None):
+        self.name = name
+        self.inputs = inputs or []
+        self.children = []
+
+    def __repr__(self):
+        return self.name
+
+def test_input_index_diamond():
+    d = FakeNode("d")
+    b = FakeNode("b", [d])
+    c = FakeNode("c", [d])
+    top = FakeNode("top", [b, c])
+
+    index = InputIndex()
+    assert [n.name for n in index.walk_inputs(top)] == ['b', 'd', 'c']
+
+    # the index must be cleared when children are added
+    c.children.append(FakeNode("e"))
+    assert [n.name for n in index.walk_inputs(top)] == ['b', 'd', 'c']
+    index.clear()
+    assert [n.name for n in index.walk_inputs(top)] == ['b', 'd', 'c', 'e']
+
+def test_input_index_long_chain():
+    nodes = []
+    for i in range(3000):
+        nodes.append(FakeNode("n%s" % i, list(nodes[-1:])))
+
+    walked = InputIndex().walk_inputs(nodes[-1])
+    assert [n.name for n in walked] == ["n%s" % i for i in reversed(range(2999))]
+
+def test_walk_inputs_with_shared_inputs():
+    with wrap() as wrapper:
+        shared = Node("shared.txt", wrapper)
+        first = Node("first.txt", wrapper, [shared])
+        second = Node("second.txt", wrapper, [shared])
+        node = Node("foo.txt", wrapper, [first, second])
+        assert [n.key for n in node.walk_inputs()] == ['first.txt', 'shared.txt', 'second.txt']
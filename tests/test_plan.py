@@ -0,0 +1,74 @@
+from dexy.plan import Plan
+from dexy.wrapper import Wrapper
+from tests.utils import tempdir
+
+YAML = """
+final.txt|jinja:
+    - a.txt|jinja:
+        - shared.txt
+    - b.txt|jinja:
+        - shared.txt
+"""
+
+def setup_project():
+    with open("dexy.yaml", "w") as f:
+        f.write(YAML)
+
+    for name in ('final', 'a', 'b', 'shared'):
+        with open("%s.txt" % name, "w") as f:
+            f.write("%s\n" % name)
+
+def planned_wrapper():
+    wrapper = Wrapper()
+    wrapper.to_valid()
+    wrapper.to_walked()
+    wrapper.load_cache_info()
+    wrapper.check_cache()
+    return wrapper
+
+def test_plan():
+    with tempdir():
+        setup_project()
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        wrapper.run_from_new()
+
+        docs = [
+            ('final.txt|jinja', 'ran', 1.0, None, None, [('jinja', 1.0, False, None, None, None)]),
+            ('a.txt|jinja', 'ran', 4.0, None, None, [('jinja', 4.0, False, None, None, None)]),
+            ('b.txt|jinja', 'ran', 2.0, None, None, [('jinja', 2.0, False, None, None, None)]),
+            ('shared.txt', 'ran', 0.5, None, None, [])
+            ]
+        # outweigh times of the real run in the median
+        for i in range(2):
+            wrapper.batch_db().save_run(0, 10, 'ran', 1, docs)
+
+        with open("shared.txt", "w") as f:
+            f.write("changed\n")
+
+        plan = Plan(planned_wrapper())
+
+        keys = [doc.key for doc in plan.uncached_docs()]
+        assert keys == ['a.txt|jinja', 'b.txt|jinja', 'final.txt|jinja', 'shared.txt']
+
+        reasons = dict((doc.key, doc.uncached_reasons) for doc in plan.uncached_docs())
+        assert reasons['shared.txt'] == ['doc changed']
+        assert reasons['final.txt|jinja'] == ["input not cached: doc:a.txt|jinja, doc:b.txt|jinja"]
+
+        assert [node.key for node in plan.critical_path] == ['shared.txt', 'a.txt|jinja', 'final.txt|jinja']
+        assert plan.critical_path_seconds == 5.5
+        assert plan.total_seconds() == 7.5
+        assert plan.speedup(1) == 1.0
+        assert plan.speedup(4) == 7.5 / 5.5
+
+def test_plan_without_history():
+    with tempdir():
+        setup_project()
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+
+        plan = Plan(planned_wrapper())
+        assert len(plan.uncached_docs()) == 4
+        assert plan.estimates[plan.uncached_docs()[0]][1] in ('filters', 'unknown')
+        assert plan.total_seconds() == 0
+        assert plan.speedup(4) is None
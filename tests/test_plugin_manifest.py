@@ -0,0 +1,83 @@
+from tests.utils import tempdir
+import dexy.filter
+import dexy.plugin
+import dexy.plugin_manifest
+import os
+import subprocess
+import sys
+
+CHECK_LAZY_IMPORT = """
+import sys
+import dexy.load_plugins
+import dexy.filter
+print 'dexy.filters.pyg' in sys.modules
+dexy.filter.Filter.create_instance('pyg')
+print 'dexy.filters.pyg' in sys.modules
+"""
+
+def test_build_manifest():
+    manifest = dexy.plugin_manifest.build_manifest([])
+    ref, settings = manifest['plugins']['Filter']['pyg']
+    assert ref == 'dexy.filters.pyg:PygmentsFilter'
+    assert 'pyg' in settings['aliases'][1]
+    assert 'dexy.filters.pyg' in manifest['modules']
+
+    # filters defined in yaml refer to classes by name
+    ref, settings = manifest['plugins']['Filter']['libreoffice']
+    assert ref == 'SubprocessExtToFormatFilter'
+
+def test_manifest_is_saved_and_validated():
+    with tempdir():
+        filename = os.path.abspath("manifest.pickle")
+        assert not dexy.plugin_manifest.load_plugins(filename)
+
+        manifest = dexy.plugin_manifest.read_manifest(filename)
+        assert manifest
+        assert dexy.plugin_manifest.is_valid(manifest)
+
+        filepath = dexy.plugin_manifest.FILTERS_YAML
+        manifest['files'][filepath] -= 10
+        assert not dexy.plugin_manifest.is_valid(manifest)
+
+def test_plugin_modules_imported_when_needed():
+    with tempdir():
+        env = dict(os.environ)
+        env['XDG_CACHE_HOME'] = os.path.abspath("cache")
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(dexy.filter.__file__))
+        args = [sys.executable, "-c", CHECK_LAZY_IMPORT]
+
+        # generates the manifest, imports everything
+        output = subprocess.check_output(args, env=env)
+        assert output.split() == ['True', 'True']
+
+        # uses the manifest
+        output = subprocess.check_output(args, env=env)
+        assert output.split() == ['False', 'True']
+
+def test_manifest_keeps_customized_settings():
+    with tempdir():
+        filename = os.path.abspath("manifest.pickle")
+        dexy.plugin_manifest.load_plugins(filename)
+        manifest = dexy.plugin_manifest.read_manifest(filename)
+
+        # as if the module defining the filter had not been imported yet
+        plugins = dexy.filter.Filter.plugins
+        original = plugins['pyg']
+        manifest_modules = dexy.plugin.PluginMeta.manifest_modules
+        dexy.plugin.PluginMeta.manifest_modules = manifest['modules']
+        try:
+            ref, settings = manifest['plugins']['Filter']['pyg']
+            settings['ext'] = '.custom'
+            plugins['pyg'] = (ref, settings)
+
+            instance = dexy.filter.Filter.create_instance('pyg')
+            assert instance.setting('ext') == '.custom'
+
+            # registering the class again keeps the customized settings
+            klass = instance.__class__
+            klass.register_plugin(klass.aliases, klass, {})
+            assert plugins['pyg'][0] is klass
+            assert plugins['pyg'][1]['ext'] == '.custom'
+        finally:
+            plugins['pyg'] = original
+            dexy.plugin.PluginMeta.manifest_modules = manifest_modules
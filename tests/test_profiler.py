@@ -0,0 +1,40 @@
+from dexy.wrapper import Wrapper
+from tests.utils import tempdir
+import os
+
+def test_filter_profiles():
+    with tempdir():
+        with open("hello.txt", "w") as f:
+            f.write("hello\n")
+        with open("dexy.txt", "w") as f:
+            f.write("hello.txt|head\nhello.txt|wc\nhello.txt|head|wc\n")
+
+        Wrapper().create_dexy_dirs()
+        wrapper = Wrapper(profile_filters=True, jobs=2)
+        wrapper.run_from_new()
+
+        profiles_dir = os.path.join(".dexy", "profiles")
+        filenames = os.listdir(profiles_dir)
+        assert len([f for f in filenames if f.startswith("hello.txt")]) == 4
+        assert "head.prof" in filenames
+        assert "wc.prof" in filenames
+
+        assert len(wrapper.filter_profiler.profiles['wc']) == 2
+
+        with open(os.path.join(profiles_dir, "report.txt"), "r") as f:
+            report = f.read()
+        assert "head: 2 calls" in report
+        assert "wc: 2 calls" in report
+
+def test_filter_profiles_off():
+    with tempdir():
+        with open("hello.txt", "w") as f:
+            f.write("hello\n")
+        with open("dexy.txt", "w") as f:
+            f.write("hello.txt|head\n")
+
+        Wrapper().create_dexy_dirs()
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+
+        assert not os.path.exists(os.path.join(".dexy", "profiles"))
@@ -0,0 +1,53 @@
+from dexy.wrapper import Wrapper
+from tests.utils import tempdir
+import dexy.reaper
+import os
+import time
+
+def make_trash():
+    os.makedirs(".trash/abc/def")
+    with open(".trash/abc/def/foo.txt", "w") as f:
+        f.write("foo")
+    with open(".trash/bar.txt", "w") as f:
+        f.write("bar")
+
+def test_reap():
+    with tempdir():
+        make_trash()
+        dexy.reaper.reap(".trash")
+        assert os.listdir(".trash") == []
+
+def test_reap_locked():
+    with tempdir():
+        make_trash()
+        with open(".trash/.reaper.lock", "w") as f:
+            f.write(str(os.getpid()))
+
+        assert dexy.reaper.is_locked(".trash")
+        dexy.reaper.reap(".trash")
+        assert os.path.exists(".trash/bar.txt")
+
+def test_reap_stale_lock():
+    with tempdir():
+        make_trash()
+        with open(".trash/.reaper.lock", "w") as f:
+            # pid which can't belong to a running process
+            f.write("999999999")
+
+        assert not dexy.reaper.is_locked(".trash")
+        dexy.reaper.reap(".trash")
+        assert os.listdir(".trash") == []
+
+def test_start_reaper():
+    with tempdir():
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        wrapper.remove_dexy_dirs()
+        assert not os.path.exists(wrapper.artifacts_dir)
+
+        for i in range(100):
+            if not dexy.reaper.trash_contents(".trash"):
+                break
+            time.sleep(0.1)
+
+        assert dexy.reaper.trash_contents(".trash") == []
@@ -0,0 +1,128 @@
+from dexy.wrapper import Wrapper
+from contextlib import contextmanager
+from tests.utils import tempdir
+import BaseHTTPServer
+import dexy.cas
+import dexy.remote_cache
+import os
+import stat
+import threading
+
+@contextmanager
+def project(project_dir):
+    """
+    Creates a project with one doc in project_dir and changes into it.
+    """
+    prev_dir = os.getcwd()
+    os.makedirs(project_dir)
+    os.chdir(project_dir)
+    try:
+        with open("hello.txt", "w") as f:
+            f.write("hello\n")
+        with open("dexy.yaml", "w") as f:
+            f.write("hello.txt|head")
+        Wrapper().create_dexy_dirs()
+        yield
+    finally:
+        os.chdir(prev_dir)
+
+def run_project(**kwargs):
+    wrapper = Wrapper(**kwargs)
+    wrapper.run_from_new()
+    wrapper.validate_state('ran')
+    assert wrapper.nodes['doc:hello.txt|head'].output_data().as_text().strip() == "hello"
+    return wrapper
+
+def index_entries(cache_dir):
+    return [filename for _, _, filenames in os.walk(os.path.join(cache_dir, 'index'))
+            for filename in filenames]
+
+def check_output_shared_via_remote(remote_cache, remote_dir):
+    remote_dir = os.path.abspath(remote_dir)
+
+    with project("first"):
+        wrapper = run_project(remote_cache=remote_cache)
+        assert wrapper.cas.remote
+        content_address = wrapper.nodes['doc:hello.txt|head'].filters[-1].content_address()
+        assert index_entries(remote_dir) == [content_address]
+
+    with project("second"):
+        wrapper = run_project(remote_cache=remote_cache)
+        assert wrapper.cas.remote
+        assert index_entries(".dexy/cas") == [content_address]
+
+def test_dir_remote_cache():
+    with tempdir():
+        check_output_shared_via_remote(os.path.abspath("remote"), "remote")
+
+def test_http_remote_cache():
+    with tempdir():
+        os.makedirs("remote")
+        handler = dexy.remote_cache.RemoteCacheRequestHandler
+        httpd = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), handler)
+        httpd.root = os.path.abspath("remote")
+        httpd.quiet = True
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            url = "http://127.0.0.1:%s/" % httpd.server_address[1]
+            check_output_shared_via_remote(url, "remote")
+        finally:
+            httpd.shutdown()
+
+def test_corrupt_remote_object_is_not_used():
+    with tempdir():
+        remote_dir = os.path.abspath("remote")
+        with project("first"):
+            run_project(remote_cache=remote_dir)
+
+        for dirpath, _, filenames in os.walk(os.path.join(remote_dir, 'objects')):
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+                os.chmod(filepath, stat.S_IWUSR | stat.S_IRUSR)
+                with open(filepath, "w") as f:
+                    f.write("corrupted")
+
+        with project("second"):
+            wrapper = run_project(remote_cache=remote_dir)
+            assert wrapper.nodes['doc:hello.txt|head'].state == 'ran'
+
+def test_unavailable_remote_cache_is_skipped():
+    with tempdir():
+        with project("project"):
+            wrapper = run_project(remote_cache="http://127.0.0.1:1/")
+            assert wrapper.cas.remote is None
+
+def test_export_and_import():
+    with tempdir():
+        archive = os.path.abspath("cache.tar.gz")
+        with project("first"):
+            wrapper = run_project()
+            assert wrapper.cas.export_archive(archive) == 1
+
+        with project("second"):
+            cas = dexy.cas.ContentAddressedStore(Wrapper())
+            assert cas.import_archive(archive) == 1
+            assert cas.import_archive(archive) == 0
+            assert len(index_entries(".dexy/cas")) == 1
+
+def test_invalid_digest_in_remote_cache_is_ignored():
+    with tempdir():
+        remote_dir = os.path.abspath("remote")
+        with project("first"):
+            wrapper = run_project(remote_cache=remote_dir)
+            content_address = wrapper.nodes['doc:hello.txt|head'].filters[-1].content_address()
+
+        index_file = os.path.join(remote_dir, 'index', content_address[0:2], content_address)
+        os.chmod(index_file, stat.S_IWUSR | stat.S_IRUSR)
+        with open(index_file, "w") as f:
+            f.write("../../../../etc/passwd")
+
+        with project("second"):
+            wrapper = run_project(remote_cache=remote_dir)
+            assert wrapper.nodes['doc:hello.txt|head'].state == 'ran'
+            # the doc ran, so a valid entry has been published again
+            assert wrapper.cas.remote.lookup(content_address)
+            assert index_entries(".dexy/cas") == [content_address]
+            assert wrapper.cas.lookup(content_address)
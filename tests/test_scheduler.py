@@ -0,0 +1,148 @@
+from dexy.filter import DexyFilter
+from dexy.scheduler import Scheduler
+from dexy.utils import chdir
+from dexy.wrapper import Wrapper
+from tests.utils import tempdir
+import time
+
+YAML = """
+final.txt|jinja:
+    - a.txt|jinja:
+        - shared.txt
+    - b.txt|jinja:
+        - shared.txt
+    - c.txt
+
+script:steps:
+    - first.txt
+    - second.txt
+    - third.txt
+"""
+
+def setup_project():
+    with open("dexy.yaml", "w") as f:
+        f.write(YAML)
+
+    for name in ('final', 'a', 'b', 'c', 'shared', 'first', 'second', 'third'):
+        with open("%s.txt" % name, "w") as f:
+            f.write("%s\n" % name)
+
+def test_build_graph():
+    with tempdir():
+        setup_project()
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        wrapper.to_valid()
+        wrapper.to_walked()
+
+        scheduler = Scheduler(wrapper, 2)
+        depends_on, dependents = scheduler.build_graph(wrapper.roots)
+
+        final = wrapper.nodes['doc:final.txt|jinja']
+        shared = wrapper.nodes['doc:shared.txt']
+        third = wrapper.nodes['doc:third.txt']
+
+        assert len(depends_on[final]) == 3
+        assert len(dependents[shared]) == 2
+        assert wrapper.nodes['doc:second.txt'] in depends_on[third]
+        assert wrapper.nodes['doc:first.txt'] in depends_on[third]
+
+def test_parallel_run():
+    with tempdir():
+        setup_project()
+        wrapper = Wrapper(jobs=4)
+        wrapper.create_dexy_dirs()
+        wrapper.run_from_new()
+
+        wrapper.validate_state('ran')
+        for node in wrapper.nodes.values():
+            assert node.state == 'ran'
+
+        scheduler = Scheduler(wrapper, 4)
+        depends_on, _ = scheduler.build_graph(wrapper.roots)
+        for node, inputs in depends_on.iteritems():
+            for inpt in inputs:
+                if inpt.finish_time and node.start_time:
+                    assert inpt.finish_time <= node.start_time
+
+        wrapper = Wrapper(jobs=4)
+        wrapper.run_from_new()
+        wrapper.validate_state('ran')
+        for node in wrapper.nodes.values():
+            assert node.state == 'consolidated'
+
+def test_parallel_run_error():
+    with tempdir():
+        with open("dexy.yaml", "w") as f:
+            f.write("bad.txt|jinja")
+
+        with open("bad.txt", "w") as f:
+            f.write("{{ undefined_name.attribute }}")
+
+        wrapper = Wrapper(jobs=2)
+        wrapper.create_dexy_dirs()
+        wrapper.run_from_new()
+
+        assert wrapper.state == 'error'
+        assert wrapper.current_task.key == 'bad.txt|jinja'
+
+class ChdirFilter(DexyFilter):
+    """
+    filter which changes into its workspace while it runs, for testing
+    """
+    aliases = ['chdirtest']
+
+    def changes_working_dir(self):
+        return True
+
+    def process_text(self, input_text):
+        running = [n.key for n in self.doc.wrapper.nodes.values()
+                if n.state == 'running' and n is not self.doc]
+        self.populate_workspace()
+        with chdir(self.parent_work_dir()):
+            with open("scratch.txt", "w") as f:
+                f.write(input_text)
+            time.sleep(0.05)
+            with open("scratch.txt", "r") as f:
+                contents = f.read()
+        return "%s running alongside: %s" % (contents.strip(), running)
+
+def test_chdir_filter_runs_on_its_own():
+    with tempdir():
+        with open("dexy.yaml", "w") as f:
+            f.write("- a.txt|chdirtest\n- b.txt|chdirtest\n- c.txt|jinja\n- d.txt|jinja\n")
+        for name in ('a', 'b', 'c', 'd'):
+            with open("%s.txt" % name, "w") as f:
+                f.write("%s\n" % name)
+
+        wrapper = Wrapper(jobs=2)
+        wrapper.create_dexy_dirs()
+        wrapper.run_from_new()
+        wrapper.validate_state('ran')
+
+        for name in ('a', 'b'):
+            output = wrapper.nodes['doc:%s.txt|chdirtest' % name].output_data().as_text()
+            assert output == "%s running alongside: []" % name
+
+        for name in ('c', 'd'):
+            assert wrapper.nodes['doc:%s.txt|jinja' % name].output_data().as_text().strip() == name
+
+def test_inliner_reads_assets_from_workspace_with_jobs():
+    with tempdir():
+        with open("dexy.yaml", "w") as f:
+            f.write("- page.html|inliner:\n    - dot.gif\n- other.txt|jinja\n")
+        with open("page.html", "w") as f:
+            f.write('<html><body><img src="dot.gif"/></body></html>')
+        with open("dot.gif", "wb") as f:
+            f.write("GIF89a")
+        with open("other.txt", "w") as f:
+            f.write("other\n")
+
+        wrapper = Wrapper(jobs=2)
+        wrapper.create_dexy_dirs()
+        wrapper.run_from_new()
+        wrapper.validate_state('ran')
+
+        output = wrapper.nodes['doc:page.html|inliner'].output_data().as_text()
+        assert "data:image/gif;base64,R0lGODlh" in output
+        assert wrapper.nodes['doc:other.txt|jinja'].output_data().as_text().strip() == "other"
@@ -29,8 +29,9 @@ def test_create_new_sectioned_dat():
 
 def test_load_json():
     with wrap() as wrapper:
-        os.makedirs(".dexy/this/de")
-        with open(".dexy/this/de/def123.txt", "w") as f:
+        cache_dir = os.path.join(wrapper.this_cache_dir(), "de")
+        os.makedirs(cache_dir)
+        with open(os.path.join(cache_dir, "def123.txt"), "w") as f:
             f.write("""
             [
                 { "foo" : "bar" },
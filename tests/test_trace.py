@@ -0,0 +1,56 @@
+from dexy.wrapper import Wrapper
+from tests.utils import tempdir
+import json
+import os
+
+def run_traced(**kwargs):
+    with open("hello.txt", "w") as f:
+        f.write("hello\n")
+    with open("dexy.txt", "w") as f:
+        f.write("hello.txt|head\nhello.txt|wc\n")
+
+    Wrapper().create_dexy_dirs()
+    wrapper = Wrapper(trace=True, **kwargs)
+    wrapper.run_from_new()
+    wrapper.report()
+
+    with open(os.path.join(".dexy", "trace.json"), "r") as f:
+        return json.load(f)['traceEvents']
+
+def test_trace():
+    with tempdir():
+        events = run_traced()
+
+        spans = dict(((e['cat'], e['name']), e) for e in events if e['ph'] == 'X')
+        for phase in ('setup', 'walk', 'check', 'run', 'report'):
+            assert ('phase', phase) in spans
+        assert ('node', 'doc:hello.txt|head') in spans
+        assert ('filter', 'head') in spans
+        assert ('subprocess', 'wc') in spans
+        assert ('reporter', 'output') in spans
+
+        run = spans[('phase', 'run')]
+        node = spans[('node', 'doc:hello.txt|head')]
+        assert run['ts'] <= node['ts']
+        assert node['ts'] + node['dur'] <= run['ts'] + run['dur']
+
+def test_trace_worker_threads():
+    with tempdir():
+        events = run_traced(jobs=2)
+
+        thread_names = dict((e['tid'], e['args']['name']) for e in events
+                if e['name'] == 'thread_name')
+        node_threads = set(thread_names[e['tid']] for e in events if e.get('cat') == 'node')
+        assert node_threads
+        assert all(name.startswith("worker-") for name in node_threads)
+
+def test_no_trace_by_default():
+    with tempdir():
+        with open("hello.txt", "w") as f:
+            f.write("hello\n")
+        with open("dexy.txt", "w") as f:
+            f.write("hello.txt|head\n")
+
+        Wrapper().create_dexy_dirs()
+        Wrapper().run_from_new()
+        assert not os.path.exists(os.path.join(".dexy", "trace.json"))
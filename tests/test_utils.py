@@ -5,6 +5,11 @@ from nose.tools import raises
 from dexy.utils import s
 from dexy.utils import split_path
 from dexy.utils import iter_paths
+from dexy.utils import parse_size
+from dexy.utils import parallel_map
+from dexy.utils import parse_yaml
+from dexy.utils import parse_yamls
+from dexy.exceptions import UserFeedback
 
 def test_iter_path():
     full_path = "/foo/bar/baz"
@@ -47,3 +52,40 @@ class InactiveDexyFilter(Filter):
 def test_inactive_filters_skip():
     with runfilter("inactive", "hello"):
         pass
+
+def test_parse_size():
+    assert parse_size(500) == 500
+    assert parse_size("2K") == 2048
+    assert parse_size("1.5M") == 1572864
+    assert parse_size("1gb") == 1024 ** 3
+
+@raises(UserFeedback)
+def test_parse_size_invalid():
+    parse_size("lots")
+
+def test_parallel_map():
+    items = range(200)
+    assert parallel_map(lambda i: i * 2, items) == [i * 2 for i in items]
+    assert parallel_map(lambda i: i * 2, items[:3]) == [0, 2, 4]
+
+def test_parse_yamls():
+    assert parse_yamls("foo: 1\n---\nbar: 2\n") == [{'foo' : 1}, {'bar' : 2}]
+
+@raises(UserFeedback)
+def test_parse_yaml_invalid():
+    parse_yaml("foo: [1\n")
+
+def test_parse_yamls_hard_tabs():
+    for text in ("foo:\t- .txt", "foo: 1\n---\nfoo:\t- .txt"):
+        try:
+            parse_yamls(text)
+            assert False, "should raise UserFeedback"
+        except UserFeedback as e:
+            assert "hard tabs" in e.message
+
+def test_parse_yamls_error_in_later_document():
+    try:
+        parse_yamls("foo: 1\n---\nbar: [1\n")
+        assert False, "should raise UserFeedback"
+    except UserFeedback as e:
+        assert "Was unable to parse the YAML" in e.message
@@ -0,0 +1,110 @@
+from dexy.commands.watch import files_to_rerun
+from dexy.wrapper import Wrapper
+from tests.utils import tempdir
+import dexy.watcher
+import os
+
+YAML = """
+final.txt|jinja:
+    - a.txt|jinja:
+        - shared.txt
+    - b.txt
+"""
+
+def setup_project():
+    with open("dexy.yaml", "w") as f:
+        f.write(YAML)
+
+    with open("final.txt", "w") as f:
+        f.write("{{ d['a.txt|jinja'] }}")
+
+    with open("a.txt", "w") as f:
+        f.write("a {{ d['shared.txt'] }}")
+
+    for name in ('b', 'shared'):
+        with open("%s.txt" % name, "w") as f:
+            f.write(name)
+
+    wrapper = Wrapper()
+    wrapper.create_dexy_dirs()
+    wrapper.run_from_new()
+    wrapper.validate_state('ran')
+    return wrapper
+
+def test_rerun():
+    with tempdir():
+        wrapper = setup_project()
+
+        with open("shared.txt", "w") as f:
+            f.write("changed")
+
+        affected = wrapper.rerun(set(['shared.txt']))
+        wrapper.validate_state('ran')
+
+        affected_keys = sorted(node.key for node in affected)
+        assert affected_keys == ['a.txt|jinja', 'final.txt|jinja', 'shared.txt'], affected_keys
+        assert wrapper.nodes['doc:b.txt'].state == 'ran'
+        assert str(wrapper.nodes['doc:final.txt|jinja'].output_data()) == "a changed"
+
+        # next run picks up the changed output from the cache
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        assert wrapper.nodes['doc:final.txt|jinja'].state == 'consolidated'
+        assert str(wrapper.nodes['doc:final.txt|jinja'].output_data()) == "a changed"
+
+def test_files_to_rerun():
+    with tempdir():
+        wrapper = setup_project()
+
+        with open("notadoc.txt", "w") as f:
+            f.write("not a doc")
+
+        assert files_to_rerun(wrapper, set(['b.txt', 'notadoc.txt'])) == set(['b.txt'])
+        assert 'notadoc.txt' in wrapper.filemap
+        assert files_to_rerun(wrapper, set(['dexy.yaml'])) is None
+        assert files_to_rerun(wrapper, set([dexy.watcher.EVERYTHING])) is None
+
+        os.remove("b.txt")
+        assert files_to_rerun(wrapper, set(['b.txt'])) is None
+
+def test_base_watcher_sees_no_changes():
+    with tempdir():
+        watcher = dexy.watcher.Watcher([], [])
+        assert watcher.wait(0) == set()
+
+def test_polling_watcher():
+    with tempdir():
+        os.makedirs("abc")
+        os.makedirs("skip")
+        with open("abc/foo.txt", "w") as f:
+            f.write("foo")
+
+        watcher = dexy.watcher.PollingWatcher(['skip'], '')
+        watcher.interval = 0.01
+
+        with open("abc/foo.txt", "w") as f:
+            f.write("foo has changed")
+        with open("skip/bar.txt", "w") as f:
+            f.write("bar")
+
+        assert watcher.wait(1) == set(['abc/foo.txt'])
+        assert watcher.wait(0.05) == set()
+
+def test_inotify_watcher():
+    libc = dexy.watcher.load_libc()
+    if not libc:
+        return
+
+    with tempdir():
+        os.makedirs("abc")
+        watcher = dexy.watcher.InotifyWatcher([], '', libc)
+
+        with open("abc/foo.txt", "w") as f:
+            f.write("foo")
+        os.makedirs("abc/new")
+        with open("abc/new/bar.txt", "w") as f:
+            f.write("bar")
+
+        changes = watcher.wait(1)
+        assert 'abc/foo.txt' in changes
+        watcher.close()
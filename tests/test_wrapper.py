@@ -158,6 +158,75 @@ def test_ran():
             assert node.state == 'consolidated'
         wrapper.validate_state('ran')
 
+def test_cache_generations():
+    with tempdir():
+        with open("dexy.yaml", "w") as f:
+            f.write("- foo.txt|head\n- bar.txt|head")
+
+        for name in ("foo", "bar"):
+            with open("%s.txt" % name, "w") as f:
+                f.write(name)
+
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        os.makedirs(os.path.join(wrapper.artifacts_dir, "last"))
+        wrapper.run_from_new()
+        assert wrapper.cache_manifest.generation == 1
+        assert not os.path.exists(os.path.join(wrapper.artifacts_dir, "last"))
+
+        foo_files = wrapper.nodes['doc:foo.txt|head'].cache_files()
+        bar_files = wrapper.nodes['doc:bar.txt|head'].cache_files()
+        bar_inodes = [os.stat(f).st_ino for f in bar_files]
+
+        with open("foo.txt", "w") as f:
+            f.write("foo has changed")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        assert wrapper.cache_manifest.generation == 2
+        assert wrapper.nodes['doc:foo.txt|head'].state == 'ran'
+        assert wrapper.nodes['doc:bar.txt|head'].state == 'consolidated'
+
+        # cached files stay in place
+        assert [os.stat(f).st_ino for f in bar_files] == bar_inodes
+        assert str(wrapper.nodes['doc:foo.txt|head'].output_data()) == "foo has changed\n"
+        assert sorted(wrapper.nodes['doc:foo.txt|head'].cache_files()) == sorted(foo_files)
+
+        with open("dexy.yaml", "w") as f:
+            f.write("- bar.txt|head")
+
+        wrapper = Wrapper()
+        wrapper.run_from_new()
+        assert wrapper.nodes['doc:bar.txt|head'].state == 'consolidated'
+        for filepath in foo_files:
+            assert not os.path.exists(filepath)
+
+def test_removed_cache_files_not_present():
+    with tempdir():
+        with open("dexy.yaml", "w") as f:
+            f.write("- foo.txt|head")
+
+        with open("foo.txt", "w") as f:
+            f.write("foo")
+
+        wrapper = Wrapper()
+        wrapper.create_dexy_dirs()
+        wrapper.run_from_new()
+
+        wrapper = Wrapper()
+        wrapper.to_valid()
+        wrapper.to_walked()
+        wrapper.load_cache_info()
+        wrapper.check_cache()
+
+        doc = wrapper.nodes['doc:foo.txt|head']
+        foo_files = doc.cache_files()
+        assert foo_files
+        assert all(wrapper.cache_manifest.is_present(f) for f in foo_files)
+
+        doc.remove_stale_cache_files()
+        assert not any(wrapper.cache_manifest.is_present(f) for f in foo_files)
+
 def test_explicit_configs():
     wrapper = Wrapper()
     wrapper.configs = "foo.txt bar.txt   abc/def/foo.txt "
@@ -399,3 +468,52 @@ def test_run_target_ba():
         assert wrapper.nodes['bundle:baz'].state == 'ran'
         assert wrapper.nodes['bundle:foob'].state == 'uncached'
         assert wrapper.nodes['bundle:foobar'].state == 'uncached'
+
+def walked_wrapper():
+    wrapper = Wrapper()
+    wrapper.to_valid()
+    wrapper.to_walked()
+    return wrapper
+
+def test_parsed_configs_are_cached():
+    with tempdir():
+        Wrapper().create_dexy_dirs()
+
+        with open("dexy.yaml", "w") as f:
+            f.write("foo.txt|head")
+
+        with open("foo.txt", "w") as f:
+            f.write("foo")
+
+        wrapper = walked_wrapper()
+        assert 'doc:foo.txt|head' in wrapper.nodes
+
+        def fail_to_parse(parser, directory, input_text):
+            raise Exception("config should not be parsed again")
+
+        original_parse = Yaml.parse
+        Yaml.parse = fail_to_parse
+        try:
+            wrapper = walked_wrapper()
+            assert 'doc:foo.txt|head' in wrapper.nodes
+        finally:
+            Yaml.parse = original_parse
+
+        with open("dexy.yaml", "w") as f:
+            f.write("foo.txt|wc")
+
+        wrapper = walked_wrapper()
+        assert wrapper.nodes.keys() == ['doc:foo.txt|wc']
+
+        # whether foo exists decides if this is a bundle or a doc
+        with open("dexy.yaml", "w") as f:
+            f.write("foo")
+
+        wrapper = walked_wrapper()
+        assert wrapper.nodes.keys() == ['bundle:foo']
+
+        with open("foo", "w") as f:
+            f.write("foo")
+
+        wrapper = walked_wrapper()
+        assert wrapper.nodes.keys() == ['doc:foo']